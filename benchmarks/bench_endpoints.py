@@ -0,0 +1,209 @@
+"""
+Offline latency/throughput benchmark for /api/search, /api/home/feed and /api/anomalous.
+
+Starts the RapidAPI stub and the app (uvicorn, throwaway SQLite DB) as subprocesses,
+then drives each scenario at several concurrency levels and reports throughput and
+p50/p90/p95/p99 latency. Nothing touches the network or nocta_trends.db.
+
+    python benchmarks/bench_endpoints.py --concurrency 1,8,32 --requests 200
+    python benchmarks/bench_endpoints.py --stub-args="--tail-rate 0.05 --throttle-rate 0.05"
+    python benchmarks/bench_endpoints.py --baseline benchmarks/results/<earlier>.json
+
+Results are written to benchmarks/results/<timestamp>.json. With --baseline, a p95
+regression beyond --tolerance on any scenario makes the script exit with status 1.
+Use --target http://host:port to benchmark an already running app instead.
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+ADMIN = {"email": "admin@nocta.app", "password": "admin123"}
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+def _cycle(paths):
+    return functools.partial(next, itertools.cycle(list(paths)))
+
+def scenarios():
+    """name -> callable returning the next request path. *_cold scenarios never repeat a cache key."""
+    counter = itertools.count()
+    return {
+        "search_cold": lambda: f"/api/search?q=fitness+bench{next(counter)}&timeframe=all",
+        "search_warm": _cycle(f"/api/search?q=fitness&sort_by={s}&page={p}"
+                              for s in ("views", "er", "likes", "recent") for p in (1, 2, 3)),
+        "search_json": _cycle(f"/api/search?q=fitness&page={p}&format=json&fields=platform_id,views,likes" for p in (1, 2, 3)),
+        "feed": _cycle(f"/api/home/feed?page={p}" for p in (1, 2, 3, 4)),
+        "anomalous": _cycle(f"/api/anomalous?timeframe={t}&sort_by={s}" for t in ("3d", "7d") for s in ("anomaly", "views")),
+    }
+
+async def run_level(client, next_path, concurrency, total):
+    latencies, errors = [], 0
+    remaining = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while next(remaining) < total:
+            path = next_path()
+            t0 = time.perf_counter()
+            try:
+                resp = await client.get(path)
+                if resp.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p90_ms": round(percentile(latencies, 90), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+    }
+
+async def run_benchmark(base_url, names, levels, total, timeout):
+    limits = httpx.Limits(max_connections=max(levels) + 4, max_keepalive_connections=max(levels) + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        resp = await client.post("/auth/login", data=ADMIN)
+        resp.raise_for_status()
+        all_scenarios = scenarios()
+        results = {}
+        for name in names:
+            next_path = all_scenarios[name]
+            # One untimed request so the first level doesn't pay for the initial cache fill
+            if not name.endswith("_cold"):
+                await client.get(next_path())
+            results[name] = []
+            for level in levels:
+                row = await run_level(client, next_path, level, total)
+                results[name].append(row)
+                print(f"{name:<12} c={level:<4} rps={row['rps']:<8} p50={row['p50_ms']:<8} p95={row['p95_ms']:<8} "
+                      f"p99={row['p99_ms']:<8} errors={row['errors']}")
+        return results
+
+def wait_ready(url, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+def compare(results, baseline, tolerance):
+    """Print p95 deltas against a previous results file; return the regressed scenarios."""
+    regressions = []
+    for name, rows in results.items():
+        old_rows = {r["concurrency"]: r for r in baseline.get("results", {}).get(name, [])}
+        for row in rows:
+            old = old_rows.get(row["concurrency"])
+            if not old or not old["p95_ms"]:
+                continue
+            delta = (row["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+            flag = "REGRESSION" if delta > tolerance else ""
+            print(f"{name:<12} c={row['concurrency']:<4} p95 {old['p95_ms']} -> {row['p95_ms']} ({delta:+.0%}) {flag}")
+            if flag:
+                regressions.append(f"{name}@c{row['concurrency']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(scenarios()), help="comma-separated scenario names")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--target", default="", help="benchmark a running app instead of spawning one")
+    parser.add_argument("--app-port", type=int, default=8900)
+    parser.add_argument("--stub-port", type=int, default=8901)
+    parser.add_argument("--stub-args", default="", help="extra arguments for stub_server.py")
+    parser.add_argument("--baseline", default="", help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed p95 increase vs baseline")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = set(names) - set(scenarios())
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    procs = []
+    workdir = tempfile.mkdtemp(prefix="nocta-bench-")
+    try:
+        base_url = args.target
+        if not base_url:
+            stub = subprocess.Popen([sys.executable, os.path.join(ROOT, "benchmarks", "stub_server.py"),
+                                     "--port", str(args.stub_port), *shlex.split(args.stub_args)], cwd=ROOT)
+            procs.append(stub)
+            wait_ready(f"http://127.0.0.1:{args.stub_port}/_stats", stub)
+            env = {
+                **os.environ,
+                "RAPIDAPI_BASE_URL": f"http://127.0.0.1:{args.stub_port}",
+                "RAPIDAPI_KEY": "stub",
+                "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                "THUMB_CACHE_DIR": os.path.join(workdir, "thumbs"),
+                "SEARCH_PROVIDERS": "rapidapi",
+            }
+            app = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port),
+                                    "--log-level", "warning"], cwd=ROOT, env=env)
+            procs.append(app)
+            base_url = f"http://127.0.0.1:{args.app_port}"
+            wait_ready(base_url + "/", app)
+
+        results = asyncio.run(run_benchmark(base_url, names, levels, args.requests, args.timeout))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "args": {"concurrency": levels, "requests": args.requests, "stub_args": args.stub_args, "target": args.target},
+        "results": results,
+    }
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"p95 regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
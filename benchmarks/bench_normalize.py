@@ -0,0 +1,150 @@
+"""
+Micro-benchmark for RapidAPI response normalization (parse + convert to reel dicts).
+
+Runs over responses recorded with RAPIDAPI_RECORD_DIR, or synthetic stub pages when
+no recordings are given, and reports items/second for the previous per-item key
+probing implementation ("legacy") and services.rapidapi_normalize:
+
+    python benchmarks/bench_normalize.py --recordings cache/recordings
+    python benchmarks/bench_normalize.py --accounts 200 --repeat 20
+
+Both paths are checked to produce identical reels before timing.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_server import synthetic_reels
+from services import rapidapi_normalize
+
+def _legacy_timestamp_from_pk(pk_str):
+    try:
+        pk_int = int(str(pk_str).split("_")[0])
+        return int(((pk_int >> 23) + 1314220021000) / 1000)
+    except Exception:
+        return None
+
+def _legacy_within_timeframe(taken_at, days):
+    if not days or not taken_at:
+        return True
+    try:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        return datetime.fromtimestamp(taken_at, tz=timezone.utc) >= cutoff
+    except Exception:
+        return True
+
+def legacy_normalize(raw: bytes, username: str, timeframe_days=None):
+    """The parsing loop fetch_reels_page_sync used before rapidapi_normalize, kept for comparison."""
+    data = json.loads(raw)
+    edges = data.get("result", {}).get("edges", []) if isinstance(data, dict) else []
+    if edges:
+        items = [edge.get("node", {}).get("media") or edge.get("node", {}) for edge in edges]
+    else:
+        items = data if isinstance(data, list) else data.get("items", data.get("data", []))
+    results = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        pk_val = item.get("pk") or item.get("id", "")
+        taken_at = item.get("taken_at") or item.get("takenAt") or item.get("device_timestamp")
+        if not taken_at and pk_val:
+            taken_at = _legacy_timestamp_from_pk(pk_val)
+        if not _legacy_within_timeframe(taken_at, timeframe_days):
+            continue
+        likes = int(item.get("like_count") or item.get("likeCount") or 0)
+        comments = int(item.get("comment_count") or item.get("commentCount") or 0)
+        views = item.get("play_count") or item.get("playCount") or item.get("view_count") or item.get("viewCount")
+        if views is None: views = likes * 3
+        views = int(views)
+        er = round(((likes + comments) / max(views, 1)) * 100, 2)
+        thumb = ""
+        image_versions = item.get("image_versions2") or item.get("imageVersions2") or {}
+        candidates = image_versions.get("candidates", [])
+        if candidates:
+            thumb = candidates[0].get("url", "")
+        code = item.get("code") or item.get("shortCode") or ""
+        video_url = f"https://www.instagram.com/reel/{code}/" if code else f"https://www.instagram.com/{username}/"
+        published_at = ""
+        if taken_at:
+            try:
+                published_at = datetime.fromtimestamp(taken_at).isoformat()
+            except Exception:
+                pass
+        caption_data = item.get("caption") or {}
+        caption_text = caption_data.get("text", "") if isinstance(caption_data, dict) else (caption_data if isinstance(caption_data, str) else "")
+        results.append({
+            "platform_id": str(item.get("id", "") or item.get("pk", "")),
+            "platform": "instagram",
+            "title": caption_text[:150] or f"Reel from @{username}",
+            "author": username,
+            "views": int(views),
+            "likes": int(likes),
+            "comments": int(comments),
+            "engagement_rate": er,
+            "thumbnail_url": thumb,
+            "video_url": video_url,
+            "published_at": published_at,
+            "transcript": caption_text,
+        })
+    return results
+
+def current_normalize(raw: bytes, username: str, timeframe_days=None):
+    return rapidapi_normalize.normalize_reels(rapidapi_normalize.loads(raw), username, timeframe_days)
+
+def load_payloads(recordings_dir: str, accounts: int):
+    """[(username, raw body)] from recordings, or synthetic pages when there are none."""
+    payloads = []
+    if recordings_dir and os.path.isdir(recordings_dir):
+        for name in sorted(os.listdir(recordings_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(recordings_dir, name), encoding="utf-8") as f:
+                record = json.load(f)
+            username = (record.get("request") or {}).get("username", "")
+            payloads.append((username, json.dumps(record["response"]).encode()))
+    if not payloads:
+        for i in range(accounts):
+            username = f"account{i}"
+            for page in range(3):
+                payloads.append((username, json.dumps(synthetic_reels(username, str(page))).encode()))
+    return payloads
+
+def bench(fn, payloads, repeat, timeframe_days):
+    items, best = 0, float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = sum(len(fn(raw, username, timeframe_days)) for username, raw in payloads)
+        best = min(best, time.perf_counter() - started)
+    return items, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", default=os.getenv("RAPIDAPI_RECORD_DIR", ""))
+    parser.add_argument("--accounts", type=int, default=100, help="synthetic accounts when there are no recordings")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--days", type=int, default=7, help="timeframe filter applied while normalizing (0 = none)")
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.recordings, args.accounts)
+    days = args.days or None
+    for username, raw in payloads:
+        if legacy_normalize(raw, username, days) != current_normalize(raw, username, days):
+            sys.exit(f"Output mismatch for @{username}")
+
+    print(f"{len(payloads)} payloads, {sum(len(r) for _, r in payloads) / 1024:.0f} KiB, "
+          f"json parser: {'orjson' if rapidapi_normalize.orjson else 'json'}")
+    baseline = None
+    for name, fn in (("legacy", legacy_normalize), ("normalize", current_normalize)):
+        items, elapsed = bench(fn, payloads, args.repeat, days)
+        rate = items / elapsed if elapsed else 0.0
+        speedup = f"  x{rate / baseline:.2f}" if baseline else ""
+        baseline = baseline or rate
+        print(f"{name:<10} {items:>7} items  {elapsed * 1000:8.1f} ms  {rate:>12,.0f} items/s{speedup}")
+
+if __name__ == "__main__":
+    main()
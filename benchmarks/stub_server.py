@@ -0,0 +1,124 @@
+"""
+Local stand-in for the instagram120 RapidAPI, for offline benchmarks and debugging.
+
+Serves responses recorded with RAPIDAPI_RECORD_DIR when one matches the request,
+otherwise deterministic synthetic reels, with configurable latency, errors and 429s:
+
+    python benchmarks/stub_server.py --port 8901 --recordings cache/recordings \\
+        --latency-ms 150 --tail-rate 0.05 --tail-ms 4000 --error-rate 0.02 --throttle-rate 0.05
+
+Then run the app against it:
+
+    RAPIDAPI_BASE_URL=http://127.0.0.1:8901 RAPIDAPI_KEY=stub uvicorn main:app
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from services import rapidapi_recorder
+
+PAGE_SIZE = 12
+MAX_PAGES = 5
+# Instagram epoch offset used by rapidapi_normalize.extract_timestamp_from_pk
+IG_EPOCH_MS = 1314220021000
+
+def synthetic_reels(username: str, max_id: str = "") -> dict:
+    """Deterministic page of reels for an account, in the edges/page_info shape the API uses."""
+    page = int(max_id) if max_id.isdigit() else 0
+    rng = random.Random(zlib.crc32(f"{username}|{page}".encode()))
+    now_ms = int(time.time() * 1000)
+    edges = []
+    for i in range(PAGE_SIZE):
+        taken_at = now_ms // 1000 - (page * PAGE_SIZE + i) * rng.randint(3600, 86400)
+        pk = ((taken_at * 1000 - IG_EPOCH_MS) << 23) + rng.randint(0, 1 << 22)
+        views = int(rng.lognormvariate(11, 1.5))
+        likes = int(views * rng.uniform(0.005, 0.12))
+        edges.append({"node": {"media": {
+            "pk": str(pk),
+            "id": f"{pk}_{zlib.crc32(username.encode())}",
+            "code": f"S{zlib.crc32(f'{username}{page}{i}'.encode()):x}",
+            "taken_at": taken_at,
+            "play_count": views,
+            "like_count": likes,
+            "comment_count": int(likes * rng.uniform(0.01, 0.1)),
+            "caption": {"text": f"{username} reel {page * PAGE_SIZE + i} #viral #trending"},
+            "image_versions2": {"candidates": [{"url": f"https://scontent.cdninstagram.com/v/{pk}.jpg"}]},
+        }}})
+    has_next = page + 1 < MAX_PAGES
+    return {"result": {
+        "edges": edges,
+        "page_info": {"has_next_page": has_next, "end_cursor": str(page + 1) if has_next else ""},
+    }}
+
+def create_app(recordings_dir: str = "", latency_ms: float = 150, jitter_ms: float = 50,
+               tail_rate: float = 0.0, tail_ms: float = 4000, error_rate: float = 0.0,
+               throttle_rate: float = 0.0, synthetic: bool = True, seed: int = None) -> FastAPI:
+    app = FastAPI(title="RapidAPI stub")
+    recordings = rapidapi_recorder.load(recordings_dir)
+    rng = random.Random(seed)
+    stats = {"requests": 0, "recorded": 0, "synthetic": 0, "errors": 0, "throttled": 0}
+    print(f"Stub: {len(recordings)} recordings loaded")
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/{path:path}")
+    async def handle(path: str, request: Request):
+        stats["requests"] += 1
+        delay = max(0.0, rng.gauss(latency_ms, jitter_ms))
+        if tail_rate and rng.random() < tail_rate:
+            delay += tail_ms
+        await asyncio.sleep(delay / 1000)
+
+        roll = rng.random()
+        if roll < throttle_rate:
+            stats["throttled"] += 1
+            return JSONResponse({"message": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+        if roll < throttle_rate + error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"message": "Upstream error"}, status_code=502)
+
+        body = await request.json()
+        recorded = rapidapi_recorder.lookup(recordings, "/" + path, body)
+        if recorded is not None:
+            stats["recorded"] += 1
+            return recorded
+        if not synthetic:
+            return JSONResponse({"message": "No recording for this request"}, status_code=404)
+        stats["synthetic"] += 1
+        return synthetic_reels(str(body.get("username", "")), str(body.get("maxId") or ""))
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--recordings", default="", help="directory written with RAPIDAPI_RECORD_DIR")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="share of requests that get --tail-ms extra delay")
+    parser.add_argument("--tail-ms", type=float, default=4000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--no-synthetic", action="store_true", help="404 instead of synthesizing unrecorded requests")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_app(args.recordings, args.latency_ms, args.jitter_ms, args.tail_rate, args.tail_ms,
+                     args.error_rate, args.throttle_rate, not args.no_synthetic, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+import os
+import time
+from dotenv import load_dotenv
+
+# Loaded once per process. main.py imports this module first, so every other
+# module's os.getenv() at import time already sees values from .env.
+load_dotenv()
+
+# Process boot reference point for the startup report
+BOOT_STARTED = time.perf_counter()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nocta_trends.db")
+RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY", "")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+APIFY_API_TOKEN = os.getenv("APIFY_API_TOKEN")
+# Set to 1 to log a per-module import timing breakdown on startup
+IMPORT_TIMING = os.getenv("IMPORT_TIMING", "0").lower() in ("1", "true", "yes")
@@ -1,14 +1,30 @@
+import time
+from sqlalchemy import event
 from sqlmodel import SQLModel, create_engine, Session
+from core.config import DATABASE_URL
+from services.metrics import ENABLED as METRICS_ENABLED, DB_QUERY_LATENCY, DB_SESSIONS
 # Import all models so SQLModel knows about them before create_all()
-from models.database import User, Video, Favorite, SearchHistory, RadarKeyword
+from models.database import (User, Video, Favorite, SearchHistory, RadarKeyword, VideoAnalysis, AnalysisJob,
+                             UsageCounter, DailyUsage, UserDayActivity, UserUsage, QueryStat)
 
-sqlite_url = "sqlite:///./nocta_trends.db"
+sqlite_url = DATABASE_URL
 # Use check_same_thread=False for FastAPI + SQLite
 engine = create_engine(sqlite_url, echo=False, connect_args={"check_same_thread": False})
 
+if METRICS_ENABLED:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _query_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _query_finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_LATENCY.observe(elapsed, op=statement.split(None, 1)[0].upper())
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
 
 def get_session():
+    DB_SESSIONS.inc()
     with Session(engine) as session:
         yield session
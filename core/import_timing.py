@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+from importlib.abc import MetaPathFinder
+from typing import Dict, List, Tuple
+
+class _TimedLoader:
+    """Delegating loader wrapper that times exec_module (i.e. the module body)."""
+    def __init__(self, loader, timer: "ImportTimer"):
+        self._loader = loader
+        self._timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self._timer._stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            self._timer.record(module.__name__, total, total - children)
+
+class ImportTimer(MetaPathFinder):
+    """
+    In-process equivalent of `python -X importtime`: records cumulative and self
+    time of every module imported after install(). Opt-in (IMPORT_TIMING=1), since
+    every loader is wrapped while it is active.
+    """
+    def __init__(self):
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self._local = threading.local()
+
+    def _stack(self) -> List[float]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def record(self, name: str, total: float, self_time: float):
+        self.timings[name] = (total, self_time)
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def report(self, top: int = 15) -> Dict[str, object]:
+        """Slowest modules by self time, plus self time summed per top-level package."""
+        by_self = sorted(self.timings.items(), key=lambda i: i[1][1], reverse=True)[:top]
+        packages: Dict[str, float] = {}
+        for name, (_, self_time) in self.timings.items():
+            root = name.split(".", 1)[0]
+            packages[root] = packages.get(root, 0.0) + self_time
+        by_package = sorted(packages.items(), key=lambda i: i[1], reverse=True)[:top]
+        return {
+            "modules": len(self.timings),
+            "slowest_self_ms": [(n, round(t[1] * 1000, 1)) for n, t in by_self],
+            "slowest_packages_ms": [(n, round(t * 1000, 1)) for n, t in by_package],
+        }
+
+# Global instance
+import_timer = ImportTimer()
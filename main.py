@@ -1,48 +1,183 @@
+# Load .env once, before any module reads its settings, and optionally time every import after it
+from core import config
+from core.import_timing import import_timer
+if config.IMPORT_TIMING:
+    import_timer.install()
+
 from fastapi import FastAPI, Request, Form, Query, Depends, Response, HTTPException, status
-from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from sqlmodel import Session, select
-from dotenv import load_dotenv
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from urllib.parse import quote
+from sqlmodel import Session, select, delete
 import os
+import logging
 import json
 import time
+import asyncio
+from functools import lru_cache
+from markupsafe import Markup
 
-from core.database import create_db_and_tables, get_session
+from core.database import create_db_and_tables, get_session, engine
+from core.logging_config import setup_logging, RequestIdMiddleware
 from models.database import User, SearchHistory, Favorite
 from services.social_api import SocialAPIWrapper
 from services.ai_agent import AIAgent
 from services import rapidapi_service
 from services import auth
-from services.cache import app_cache
-
-load_dotenv()
+from services import usage_stats
+from services.cache import app_cache, json_cache, LRUCache
+from services import api_format
+from services.static_assets import CachedStaticFiles, static_url, IMMUTABLE_MAX_AGE
+from services.thumbnail_cache import thumbnail_cache
+from services.job_queue import job_queue, QueueFullError
+from services.admission import admission, UpstreamBusyError
+from services.profile_service import ProfileFetchError, ProfileService
+from services.feed_builder import FeedBuilder
+from services.providers import REEL_DEFAULTS
+from services.query_normalize import canonical_query
+from services.live_updates import live_hub, LiveLimitError
+from services.autocomplete import query_index
+from services.export import (export_response, available_formats, favorite_rows, history_rows,
+                             ExportFormatError, REEL_FIELDS, FAVORITE_FIELDS, HISTORY_FIELDS)
+from services import metrics
+from services.profiling import ProfilingMiddleware, trace_store, stage
+
+setup_logging()
+log = logging.getLogger("nocta")
 
 app = FastAPI(title="Nocta Trends Pro")
 
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """GZip, except for server-sent event streams: the compressor would hold events back until its buffer fills."""
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and b"text/event-stream" in dict(scope["headers"]).get(b"accept", b""):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1000)
+app.add_middleware(ProfilingMiddleware)
+# Outermost, so every log line of a request (profiling and search fan-out included) carries its id
+app.add_middleware(RequestIdMiddleware)
+
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
     # Initialize default admin
     with next(get_session()) as session:
+        usage_stats.backfill(session)
         auth.init_admin_user(session)
+        query_index.load(session, rapidapi_service.HASHTAG_TO_ACCOUNTS)
+
+_loop_monitor = None
+
+@app.on_event("startup")
+async def start_background_workers():
+    global _loop_monitor
+    await job_queue.start()
+    feed_builder.start()
+    if metrics.ENABLED:
+        _loop_monitor = asyncio.create_task(metrics.monitor_event_loop())
 
-app.mount("/static", StaticFiles(directory="frontend/static"), name="static")
-templates = Jinja2Templates(directory="frontend/templates")
+@app.on_event("startup")
+async def report_startup_time():
+    boot_ms = round((time.perf_counter() - config.BOOT_STARTED) * 1000)
+    if config.IMPORT_TIMING:
+        import_timer.uninstall()
+        log.info("Startup complete", extra={"boot_ms": boot_ms, **import_timer.report()})
+    else:
+        log.info("Startup complete", extra={"boot_ms": boot_ms})
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await job_queue.stop()
+    await feed_builder.stop()
+    await live_hub.stop()
+    if _loop_monitor:
+        _loop_monitor.cancel()
+
+app.mount("/static", CachedStaticFiles(directory="frontend/static"), name="static")
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates that records render time per template."""
+    def TemplateResponse(self, *args, **kwargs):
+        name = kwargs.get("name") or next((a for a in args if isinstance(a, str)), "")
+        with metrics.TEMPLATE_RENDER.time(template=name):
+            return super().TemplateResponse(*args, **kwargs)
+
+templates = InstrumentedTemplates(directory="frontend/templates")
+templates.env.globals["static_url"] = static_url
+
+# Changes on every deploy/restart so ETags never outlive a template change
+BOOT_ID = os.urandom(4).hex()
 
 # Custom Jinja2 filters
+@lru_cache(maxsize=4096)
+def _format_int(n: int) -> str:
+    if n >= 1_000_000: return f"{n/1_000_000:.1f}M"
+    if n >= 1_000: return f"{n/1_000:.1f}K"
+    return str(n)
+
 def format_num(value):
     try:
-        n = int(value)
-        if n >= 1_000_000: return f"{n/1_000_000:.1f}M"
-        if n >= 1_000: return f"{n/1_000:.1f}K"
-        return str(n)
+        return _format_int(int(value))
     except (TypeError, ValueError): return str(value)
 
 templates.env.filters["format_num"] = format_num
 
+def thumb(url, width: int = 360):
+    """Route CDN thumbnails through the caching/resizing proxy (/api/thumb)."""
+    if not url or not thumbnail_cache.is_allowed(url):
+        return url
+    return f"/api/thumb?w={width}&src={quote(url, safe='')}"
+
+templates.env.filters["thumb"] = thumb
+
+# Rendered card fragments, keyed by reel id + the values of the canonical reel fields. The card
+# embeds the whole record (tojson) for the modal and favorites, so a changed counter, caption or
+# re-signed thumbnail must produce a new entry; reading a dozen fields is far cheaper than
+# serializing the record. A grid page is then just a join of cached strings instead of 12
+# template executions.
+_card_template = templates.env.get_template("partials/video_card.html")
+_card_cache = LRUCache(maxsize=5000, name="card")
+
+def _card_version(video: dict) -> tuple:
+    # The field count stands in for any non-canonical extras a source adds
+    return (len(video), *(video.get(field) for field in REEL_DEFAULTS))
+
+def _render_card(video) -> Markup:
+    with metrics.TEMPLATE_RENDER.time(template="partials/video_card.html"):
+        return Markup(_card_template.render(video=video))
+
+def video_card(video):
+    reel_id = video.get("platform_id") or video.get("video_url")
+    if not reel_id:
+        # Nothing identifies the reel: rendering is cheaper than risking a shared key
+        return _render_card(video)
+    key = (reel_id, *_card_version(video))
+    html = _card_cache.get(key)
+    if html is None:
+        html = _render_card(video)
+        _card_cache.set(key, html)
+    return html
+
+templates.env.filters["video_card"] = video_card
+
 social_api = SocialAPIWrapper()
 ai_agent = AIAgent()
+profile_service = ProfileService(ai_agent=ai_agent)
+feed_builder = FeedBuilder(social_api.search_trends)
+live_hub.register("radar", lambda keyword: social_api.search_trends(keyword, "all", "recent"))
+live_hub.register("spy", lambda username: rapidapi_service.search_reels_by_keyword_async(username, 20, None, "recent"))
+
+metrics.registry.gauge("nocta_job_queue_depth", "Analysis jobs waiting for a worker", lambda: job_queue.depth)
+metrics.registry.gauge("nocta_app_cache_entries", "Entries in the result-pool cache", lambda: len(app_cache))
+metrics.registry.gauge("nocta_card_cache_entries", "Rendered video cards cached", lambda: len(_card_cache))
+metrics.registry.gauge("nocta_upstream_inflight", "Upstream fan-outs running for user requests", lambda: admission.inflight)
+metrics.registry.gauge("nocta_upstream_waiting", "User requests queued for an upstream slot", lambda: admission.waiting)
+metrics.registry.gauge("nocta_live_subscribers", "Open radar/spy event streams", lambda: live_hub.subscriber_count)
+metrics.registry.gauge("nocta_live_topics", "Keywords and accounts being scanned for live subscribers", lambda: live_hub.topic_count)
 
 # --- Auth Decorator Dependency ---
 def get_user_from_cookie(request: Request, session: Session = Depends(get_session)):
@@ -56,6 +191,52 @@ def get_auth_context(request: Request, user: User):
         "is_authenticated": user is not None
     }
 
+def auth_required_response(fmt: str = "html"):
+    if api_format.wants_data(fmt):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return HTMLResponse("<div class='auth-required'>Пожалуйста, войдите в систему</div>")
+
+def pool_etag(cache_key: str, *parts) -> str:
+    """
+    ETag for a page sliced out of a cached result pool.
+    Derived from the pool's cache version, so it is known before sorting or rendering.
+    """
+    version = app_cache.get_version(cache_key)
+    if version is None:
+        return None
+    return api_format.make_etag(BOOT_ID, cache_key, version, *parts)
+
+@app.exception_handler(UpstreamBusyError)
+async def upstream_busy_handler(request: Request, exc: UpstreamBusyError):
+    """Admission control rejected the request: 429 with a Retry-After hint, in the format the caller asked for."""
+    headers = {"Retry-After": str(exc.retry_after)}
+    if api_format.wants_data(request.query_params.get("format", "html")):
+        return JSONResponse({"error": "Too many requests", "retry_after": exc.retry_after}, status_code=429, headers=headers)
+    return HTMLResponse(f"<div class='auth-required'>Слишком много запросов, попробуйте через {exc.retry_after} с</div>",
+                        status_code=429, headers=headers)
+
+@app.exception_handler(ExportFormatError)
+async def export_format_handler(request: Request, exc: ExportFormatError):
+    return JSONResponse({"error": str(exc), "formats": available_formats()}, status_code=400)
+
+def grid_response(request: Request, user: User, videos: list, page: int, section: str,
+                  template: str = "partials/video_grid.html", fmt: str = "html", fields: str = "",
+                  etag: str = None, **extra):
+    """Render a page of videos as the HTML partial, or as JSON/msgpack when `format` asks for it."""
+    if api_format.wants_data(fmt):
+        payload = {"section": section, "page": page, "count": len(videos),
+                   "items": api_format.select_fields(videos, fields), **extra}
+        with stage("serialize"):
+            return api_format.data_response(request, payload, fmt, etag=etag)
+    ctx = get_auth_context(request, user)
+    ctx.update({"videos": videos, "page": page, "section": section, **extra})
+    with stage("render"):
+        response = templates.TemplateResponse(template, ctx)
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
 # --- Main Page ---
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request, user: User = Depends(get_user_from_cookie)):
@@ -80,6 +261,7 @@ async def register(request: Request, response: Response, email: str = Form(...),
     
     new_user = User(email=email, name=name, password_hash=auth.hash_password(password), tokens=100)
     session.add(new_user)
+    usage_stats.record_signup(session)
     session.commit()
     session.refresh(new_user)
     
@@ -105,30 +287,52 @@ async def home_feed(request: Request, user: User = Depends(get_user_from_cookie)
     ctx = get_auth_context(request, user)
     return templates.TemplateResponse("partials/home.html", ctx)
 
+# How often a client waiting for the first feed build asks again
+FEED_POLL_SECONDS = 5
+
 @app.get("/api/home/feed", response_class=HTMLResponse)
-async def home_feed_data(request: Request, page: int = Query(1), user: User = Depends(get_user_from_cookie)):
-    if not user: return HTMLResponse("<div class='auth-required'>Пожалуйста, войдите в систему</div>")
+async def home_feed_data(request: Request, page: int = Query(1), v: str = "", format: str = "html", fields: str = "", user: User = Depends(get_user_from_cookie)):
+    if not user: return auth_required_response(format)
     
-    cache_key = f"home_feed_p{page}"
-    videos = app_cache.get(cache_key)
-    
-    if not videos:
-        import random
-        trending_keywords = ["travel", "fitness", "fashion", "food", "luxury", "tech", "business", "motivation"]
-        keyword = random.choice(trending_keywords)
-        videos = await social_api.search_trends(keyword, "all", "views")
-        random.shuffle(videos)
-        app_cache.set(cache_key, videos, ttl_seconds=600) # Cache for 10 min
-        
-        # Deduct 1 token per feed load
-        if len(videos) > 0 and page == 1:
-            auth.deduct_tokens(user, 1, next(get_session()))
-
-    ctx = get_auth_context(request, user)
-    ctx.update({"videos": videos, "page": page, "section": "home"})
-    return templates.TemplateResponse("partials/video_grid.html", ctx)
+    # Pages are slices of one prebuilt snapshot; `v` pins the version the client started scrolling
+    feed_builder.ensure_fresh()
+    snapshot = feed_builder.get(v)
+    if snapshot is None and v:
+        # The pinned version was evicted: end this scroll rather than mix in pages of a newer ordering
+        return grid_response(request, user, [], page, "home", fmt=format, fields=fields,
+                             next_url=None, last_page=True, restart=True)
+    if snapshot is None:
+        # Cold start: the first build is running (or backing off); the sentinel polls until it lands
+        return grid_response(request, user, [], page, "home", fmt=format, fields=fields,
+                             empty_msg="Лента собирается…", poll_url="/api/home/feed?page=1",
+                             retry_after=max(FEED_POLL_SECONDS, round(feed_builder.retry_delay)))
+
+    # BOOT_ID: a snapshot loaded from disk after a deploy keeps its version but renders with new templates
+    etag = api_format.make_etag(BOOT_ID, "home_feed", snapshot.version, page, format, fields)
+    if api_format.is_not_modified(request, etag):
+        return api_format.not_modified(etag)
+
+    next_url = f"/api/home/feed?v={snapshot.version}&page={page + 1}" if snapshot.has_page(page + 1) else None
+    return grid_response(request, user, snapshot.page(page), page, "home", fmt=format, fields=fields, etag=etag,
+                         version=snapshot.version, next_url=next_url, last_page=next_url is None)
 
 # --- Search (Поиск по слову) ---
+# A pool the search deadline cut short is only kept briefly, so the next search can fill it in
+PARTIAL_POOL_TTL = 30
+
+def pool_ttl(videos, ttl: int) -> int:
+    return PARTIAL_POOL_TTL if getattr(videos, "partial", False) else ttl
+
+def search_cache_key(canonical: str, timeframe: str) -> str:
+    return f"search_{canonical}_{timeframe}_master"
+
+@app.get("/api/search/suggest")
+async def search_suggest(q: str = "", limit: int = Query(8, le=20), user: User = Depends(get_user_from_cookie)):
+    """Autocomplete: known queries starting with `q`, ones with cached results first (they cost no fan-out)."""
+    if not user: return auth_required_response("json")
+    suggestions = query_index.suggest(q, limit, is_cached=lambda query: app_cache.get_version(search_cache_key(query, "all")) is not None)
+    return JSONResponse({"suggestions": suggestions})
+
 @app.get("/api/search", response_class=HTMLResponse)
 async def search(
     request: Request,
@@ -136,41 +340,54 @@ async def search(
     timeframe: str = "all",
     sort_by: str = "views",
     page: int = Query(1),
+    format: str = "html",
+    fields: str = "",
     user: User = Depends(get_user_from_cookie),
     db: Session = Depends(get_session)
 ):
-    if not user: return HTMLResponse("<div class='auth-required'>Пожалуйста, войдите в систему</div>")
+    if not user: return auth_required_response(format)
     
-    if not q:
-        ctx = get_auth_context(request, user)
-        ctx.update({"videos": [], "page": page, "section": "search", "empty_msg": "Введите запрос для поиска"})
-        return templates.TemplateResponse("partials/search_view.html" if page == 1 else "partials/video_grid.html", ctx)
+    # Variants of one query ("Fitness", "#fitness ", "фитнес") share a cache entry and a fan-out
+    canonical = canonical_query(q)
+    if not canonical:
+        return grid_response(request, user, [], page, "search",
+                             "partials/search_view.html" if page == 1 else "partials/video_grid.html",
+                             fmt=format, fields=fields, empty_msg="Введите запрос для поиска")
         
-    cache_key = f"search_{q}_{timeframe}_master"
+    cache_key = search_cache_key(canonical, timeframe)
+    etag = pool_etag(cache_key, sort_by, page, format, fields)
+    if etag and api_format.is_not_modified(request, etag):
+        return api_format.not_modified(etag)
     videos = app_cache.get(cache_key)
     
     if not videos:
         # Fetch unsorted base results and cache
-        videos = await social_api.search_trends(q, timeframe, "views")
-        app_cache.set(cache_key, videos, ttl_seconds=300) # Cache 5 mins
+        async with admission.slot(user):
+            with stage("fanout"):
+                videos = await social_api.search_trends(canonical, timeframe, "views")
+        app_cache.set(cache_key, videos, ttl_seconds=pool_ttl(videos, 300)) # Cache 5 mins
         
         # Log to DB history & deduct 2 tokens for a search only on new fetch
         if videos and page == 1:
-            previews = json.dumps([v.get("thumbnail_url") for v in videos[:4]])
-            history = SearchHistory(user_id=user.id, query=q, results_count=len(videos), preview_thumbnails=previews)
-            db.add(history)
-            auth.deduct_tokens(user, 2, db)
-            db.commit()
+            with stage("db_commit"):
+                previews = json.dumps([v.get("thumbnail_url") for v in videos[:4]])
+                history = SearchHistory(user_id=user.id, query=q, results_count=len(videos), preview_thumbnails=previews)
+                db.add(history)
+                usage_stats.record_search(db, user.id, q)
+                query_index.record(q)
+                auth.deduct_tokens(user, 2, db)
+                db.commit()
 
     # Sort the massive cached list on the fly based on user selection
-    if sort_by == "views":
-        videos.sort(key=lambda x: x.get("views", 0) or 0, reverse=True)
-    elif sort_by == "er":
-        videos.sort(key=lambda x: x.get("engagement_rate", 0) or 0, reverse=True)
-    elif sort_by == "likes":
-        videos.sort(key=lambda x: x.get("likes", 0) or 0, reverse=True)
-    elif sort_by == "recent":
-        videos.sort(key=lambda x: x.get("published_at", "") or "", reverse=True)
+    with stage("sort"):
+        if sort_by == "views":
+            videos.sort(key=lambda x: x.get("views", 0) or 0, reverse=True)
+        elif sort_by == "er":
+            videos.sort(key=lambda x: x.get("engagement_rate", 0) or 0, reverse=True)
+        elif sort_by == "likes":
+            videos.sort(key=lambda x: x.get("likes", 0) or 0, reverse=True)
+        elif sort_by == "recent":
+            videos.sort(key=lambda x: x.get("published_at", "") or "", reverse=True)
 
     # Pagination slicing (12 per page)
     per_page = 12
@@ -178,9 +395,10 @@ async def search(
     end_idx = start_idx + per_page
     paginated_videos = videos[start_idx:end_idx]
 
-    ctx = get_auth_context(request, user)
-    ctx.update({"videos": paginated_videos, "page": page, "section": "search", "query": q})
-    return templates.TemplateResponse("partials/search_view.html" if page == 1 else "partials/video_grid.html", ctx)
+    etag = pool_etag(cache_key, sort_by, page, format, fields)
+    return grid_response(request, user, paginated_videos, page, "search",
+                         "partials/search_view.html" if page == 1 else "partials/video_grid.html",
+                         fmt=format, fields=fields, etag=etag, query=q, last_page=end_idx >= len(videos))
 
 # --- Anomalous Videos (Аномальные видео) ---
 @app.get("/api/anomalous-page", response_class=HTMLResponse)
@@ -193,16 +411,24 @@ async def anomalous(
     sort_by: str = "anomaly",
     timeframe: str = "3d",
     page: int = Query(1),
+    format: str = "html",
+    fields: str = "",
     user: User = Depends(get_user_from_cookie),
     db: Session = Depends(get_session)
 ):
-    if not user: return HTMLResponse("<div class='auth-required'>Пожалуйста, войдите в систему</div>")
+    if not user: return auth_required_response(format)
     
-    cache_key = f"anomalous_{timeframe}_{sort_by}_p{page}"
+    # One pool per scan, sliced per page (prefetching page N+1 must not start another scan)
+    cache_key = f"anomalous_{timeframe}_{sort_by}"
+    etag = pool_etag(cache_key, page, format, fields)
+    if etag and api_format.is_not_modified(request, etag):
+        return api_format.not_modified(etag)
     videos = app_cache.get(cache_key)
     
     if not videos:
-        videos = await social_api.search_trends("viral trending wow epic", timeframe, "views")
+        async with admission.slot(user):
+            with stage("fanout"):
+                videos = await social_api.search_trends("viral trending wow epic", timeframe, "views")
         for v in videos:
             likes = v.get("likes", 1) or 1
             views = v.get("views", 0) or 0
@@ -213,7 +439,7 @@ async def anomalous(
         elif sort_by == "views":
             videos.sort(key=lambda x: x.get("views", 0), reverse=True)
             
-        app_cache.set(cache_key, videos, ttl_seconds=600)
+        app_cache.set(cache_key, videos, ttl_seconds=pool_ttl(videos, 600))
         auth.deduct_tokens(user, 3, db) # Anomalous scan is expensive
 
     # Pagination slicing (12 per page)
@@ -222,9 +448,9 @@ async def anomalous(
     end_idx = start_idx + per_page
     paginated_videos = videos[start_idx:end_idx]
 
-    ctx = get_auth_context(request, user)
-    ctx.update({"videos": paginated_videos, "page": page, "section": "anomalous"})
-    return templates.TemplateResponse("partials/video_grid.html", ctx)
+    etag = pool_etag(cache_key, page, format, fields)
+    return grid_response(request, user, paginated_videos, page, "anomalous", fmt=format, fields=fields, etag=etag,
+                         last_page=end_idx >= len(videos))
 
 # --- Profile Analysis ---
 @app.get("/api/profile-page", response_class=HTMLResponse)
@@ -234,20 +460,20 @@ async def profile_page(request: Request, user: User = Depends(get_user_from_cook
 @app.post("/api/analyze-profile", response_class=HTMLResponse)
 async def analyze_profile(request: Request, username: str = Form(...), user: User = Depends(get_user_from_cookie), db: Session = Depends(get_session)):
     if not user: return HTMLResponse("Needs login")
-    import asyncio
-    from concurrent.futures import ThreadPoolExecutor
-    loop = asyncio.get_event_loop()
     clean_username = username.replace("@", "").strip()
-    with ThreadPoolExecutor() as pool:
-        videos = await loop.run_in_executor(pool, rapidapi_service.fetch_reels_from_account_sync, clean_username, None)
-        
-    total_views = sum(v.get("views", 0) for v in videos)
-    avg_er = round(sum(v.get("engagement_rate", 0) for v in videos) / max(len(videos), 1), 2)
-    
-    auth.deduct_tokens(user, 5, db) # Profile scan
+    # Paged, incrementally cached reel history + one-pass aggregate stats
+    try:
+        async with admission.slot(user):
+            profile = await profile_service.get_profile(clean_username)
+    except ProfileFetchError:
+        # Nothing was cached and nothing is charged: the user can simply retry
+        return HTMLResponse("<div class='auth-required'>Не удалось загрузить профиль, попробуйте позже</div>")
+
+    auth.deduct_tokens(user, 5, db) # Profile scan, charged only once it succeeded
 
     ctx = get_auth_context(request, user)
-    ctx.update({"username": username, "videos": videos, "total_views": total_views, "avg_er": avg_er, "video_count": len(videos)})
+    ctx.update(profile)
+    ctx.update({"username": username, "videos": profile["videos"][:48]})
     return templates.TemplateResponse("partials/profile_result.html", ctx)
 
 # --- Admin Panel ---
@@ -256,13 +482,32 @@ async def admin_page(request: Request, user: User = Depends(get_user_from_cookie
     if not user or user.role != "admin":
         return HTMLResponse("<div class='auth-required'>Доступ запрещен. Только для администраторов.</div>")
     
-    users = db.exec(select(User)).all()
-    searches = db.exec(select(SearchHistory)).all()
-    
     ctx = get_auth_context(request, user)
-    ctx.update({"total_users": len(users), "total_searches": len(searches), "users": users})
+    ctx.update(usage_stats.dashboard(db))
+    ctx.update(usage_stats.user_page(db))
+    ctx.update({"metrics_enabled": metrics.ENABLED, "metrics_rows": metrics.registry.summary(),
+                "slow_traces": [t for t in trace_store.slowest() if not t.explicit],
+                "profiled_traces": trace_store.explicit()})
     return templates.TemplateResponse("partials/admin_page.html", ctx)
 
+@app.get("/api/admin/users", response_class=HTMLResponse)
+async def admin_users(request: Request, page: int = Query(1), q: str = "", user: User = Depends(get_user_from_cookie), db: Session = Depends(get_session)):
+    if not user or user.role != "admin":
+        return HTMLResponse("<div class='auth-required'>Доступ запрещен. Только для администраторов.</div>")
+    ctx = get_auth_context(request, user)
+    ctx.update(usage_stats.user_page(db, page, q))
+    return templates.TemplateResponse("partials/admin_users.html", ctx)
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request, user: User = Depends(get_user_from_cookie)):
+    """Prometheus scrape endpoint: admin session or `Authorization: Bearer $METRICS_TOKEN`."""
+    if not metrics.ENABLED:
+        return Response(status_code=404)
+    token_ok = bool(metrics.METRICS_TOKEN) and request.headers.get("authorization") == f"Bearer {metrics.METRICS_TOKEN}"
+    if not token_ok and (not user or user.role != "admin"):
+        return Response(status_code=403)
+    return Response(metrics.registry.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/api/admin/add-tokens")
 async def admin_add_tokens(user_id: int = Form(...), amount: int = Form(...), request: Request = None, user: User = Depends(get_user_from_cookie), db: Session = Depends(get_session)):
     if not user or user.role != "admin": return JSONResponse({"error": "Unauthorized"}, status_code=403)
@@ -278,7 +523,7 @@ async def admin_add_tokens(user_id: int = Form(...), amount: int = Form(...), re
 async def favorites_page(request: Request, user: User = Depends(get_user_from_cookie), db: Session = Depends(get_session)):
     if not user: return HTMLResponse("Needs login")
     favs = db.exec(select(Favorite).where(Favorite.user_id == user.id)).all()
-    videos = [json.loads(f.video_data) for f in favs]
+    videos = [f.video for f in favs]
     ctx = get_auth_context(request, user)
     ctx.update({"favorites": videos})
     return templates.TemplateResponse("partials/favorites_page.html", ctx)
@@ -303,6 +548,7 @@ async def favorites_remove(request: Request, user: User = Depends(get_user_from_
     url = data.get("video_url", "")
     existing = db.exec(select(Favorite).where(Favorite.user_id == user.id, Favorite.video_url == url).limit(1)).first()
     if existing:
+        json_cache.pop(("fav", existing.id, existing.saved_at))
         db.delete(existing)
         db.commit()
     return JSONResponse({"status": "ok"})
@@ -313,19 +559,40 @@ async def history_page(request: Request, user: User = Depends(get_user_from_cook
     if not user: return HTMLResponse("Needs login")
     history = db.exec(select(SearchHistory).where(SearchHistory.user_id == user.id).order_by(SearchHistory.searched_at.desc()).limit(50)).all()
     ctx = get_auth_context(request, user)
-    # Parse json previews
-    for h in history: h.previews = json.loads(h.preview_thumbnails)
+    # Previews are decoded lazily via SearchHistory.previews (cached per row)
     ctx.update({"history": history})
     return templates.TemplateResponse("partials/history_page.html", ctx)
 
 @app.delete("/api/history/clear")
 async def history_clear(user: User = Depends(get_user_from_cookie), db: Session = Depends(get_session)):
     if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
-    history = db.exec(select(SearchHistory).where(SearchHistory.user_id == user.id)).all()
-    for h in history: db.delete(h)
+    # Single set-based DELETE instead of loading and deleting row by row
+    db.exec(delete(SearchHistory).where(SearchHistory.user_id == user.id))
     db.commit()
     return JSONResponse({"status": "ok"})
 
+# --- Export (streamed downloads) ---
+@app.get("/api/export/search")
+async def export_search(q: str = "", timeframe: str = "all", format: str = "ndjson", user: User = Depends(get_user_from_cookie)):
+    """Download a whole search pool. Only pools already in the cache: an export never starts a fan-out."""
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    canonical = canonical_query(q)
+    videos = app_cache.get(search_cache_key(canonical, timeframe)) if canonical else None
+    if not videos:
+        return JSONResponse({"error": "Сначала выполните поиск по этому запросу"}, status_code=404)
+    # Snapshot: the cached list is re-sorted in place by concurrent /api/search calls
+    return export_response(list(videos), REEL_FIELDS, format, f"search-{canonical.replace(' ', '_')}")
+
+@app.get("/api/export/favorites")
+async def export_favorites(format: str = "ndjson", user: User = Depends(get_user_from_cookie)):
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return export_response(favorite_rows(user.id), FAVORITE_FIELDS, format, "favorites")
+
+@app.get("/api/export/history")
+async def export_history(format: str = "ndjson", user: User = Depends(get_user_from_cookie)):
+    if not user: return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return export_response(history_rows(user.id), HISTORY_FIELDS, format, "history")
+
 # --- Radar & Spy (In-memory for simplicity) ---
 _radar_keywords = []
 _spy_accounts = []
@@ -338,20 +605,25 @@ async def radar_page(request: Request, user: User = Depends(get_user_from_cookie
 
 @app.post("/api/radar/add")
 async def radar_add(request: Request, keyword: str = Form(...), user: User = Depends(get_user_from_cookie)):
-    if user and keyword not in _radar_keywords: _radar_keywords.append(keyword.strip())
+    if user and canonical_query(keyword) not in {canonical_query(k) for k in _radar_keywords}: _radar_keywords.append(keyword.strip())
     return HTMLResponse("OK")
 
 @app.post("/api/radar/remove")
 async def radar_remove(request: Request, keyword: str = Form(...), user: User = Depends(get_user_from_cookie)):
-    if user and keyword in _radar_keywords: _radar_keywords.remove(keyword)
+    if user:
+        # Same canonical comparison as radar_add, so any spelling removes the stored one
+        canonical = canonical_query(keyword)
+        _radar_keywords[:] = [k for k in _radar_keywords if canonical_query(k) != canonical]
     return HTMLResponse("OK")
 
 @app.get("/api/radar/results", response_class=HTMLResponse)
-async def radar_results(request: Request, keyword: str = "", sort_by: str = "views", user: User = Depends(get_user_from_cookie)):
-    videos = await social_api.search_trends(keyword, "all", sort_by) if keyword else []
-    ctx = get_auth_context(request, user)
-    ctx.update({"videos": videos, "page": 1, "section": "radar", "query": keyword})
-    return templates.TemplateResponse("partials/video_grid.html", ctx)
+async def radar_results(request: Request, keyword: str = "", sort_by: str = "views", format: str = "html", fields: str = "", user: User = Depends(get_user_from_cookie)):
+    if not user: return auth_required_response(format)
+    videos = []
+    if keyword:
+        async with admission.slot(user):
+            videos = await social_api.search_trends(keyword, "all", sort_by)
+    return grid_response(request, user, videos, 1, "radar", fmt=format, fields=fields, query=keyword)
 
 @app.get("/api/spy-page", response_class=HTMLResponse)
 async def spy_page(request: Request, user: User = Depends(get_user_from_cookie)):
@@ -370,13 +642,116 @@ async def spy_remove(request: Request, username: str = Form(...), user: User = D
     return HTMLResponse("OK")
 
 @app.get("/api/spy/results", response_class=HTMLResponse)
-async def spy_results(request: Request, username: str = "", sort_by: str = "views", user: User = Depends(get_user_from_cookie)):
-    videos = await rapidapi_service.search_reels_by_keyword_async(username, 20, None, sort_by) if username else []
-    ctx = get_auth_context(request, user)
-    ctx.update({"videos": videos, "page": 1, "section": "spy", "query": username})
-    return templates.TemplateResponse("partials/video_grid.html", ctx)
+async def spy_results(request: Request, username: str = "", sort_by: str = "views", format: str = "html", fields: str = "", user: User = Depends(get_user_from_cookie)):
+    if not user: return auth_required_response(format)
+    videos = []
+    if username:
+        async with admission.slot(user):
+            videos = await rapidapi_service.search_reels_by_keyword_async(username, 20, None, sort_by)
+    return grid_response(request, user, videos, 1, "spy", fmt=format, fields=fields, query=username)
+
+# --- Live radar/spy updates (server-sent events) ---
+LIVE_HEARTBEAT_SECONDS = 15
+
+def live_topics(channel: str) -> list:
+    """Topics a live channel watches; equivalent spellings share one topic (and one scan)."""
+    if channel == "radar":
+        names = [canonical_query(k) for k in _radar_keywords]
+    elif channel == "spy":
+        names = [a.strip().lstrip("@").lower() for a in _spy_accounts]
+    else:
+        return []
+    return [(channel, name) for name in dict.fromkeys(names) if name]
+
+@app.get("/api/live/stream")
+async def live_stream(request: Request, channel: str = "radar", format: str = "html", user: User = Depends(get_user_from_cookie)):
+    """Pushes reels newly found by the background scans of the channel's keywords/accounts."""
+    if not user: return auth_required_response("json")
+    try:
+        subscription = live_hub.subscribe(live_topics(channel), user)
+    except LiveLimitError:
+        return JSONResponse({"error": "Слишком много открытых live-подключений"}, status_code=429)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = await subscription.get(LIVE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                data = {"kind": event["kind"], "topic": event["topic"], "count": len(event["reels"])}
+                if api_format.wants_data(format):
+                    data["reels"] = event["reels"]
+                else:
+                    data["html"] = "".join(video_card(r) for r in event["reels"])
+                yield f"event: reels\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            live_hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Thumbnail proxy ---
+@app.get("/api/thumb")
+async def thumbnail(request: Request, src: str, w: int = Query(360)):
+    if not thumbnail_cache.is_allowed(src):
+        return JSONResponse({"error": "Unsupported thumbnail host"}, status_code=400)
+    width = thumbnail_cache.normalize_width(w)
+    etag = f'"{thumbnail_cache.key_for(src, width)}"'
+    cache_headers = {"Cache-Control": f"public, max-age={IMMUTABLE_MAX_AGE}, immutable", "ETag": etag}
+    if api_format.is_not_modified(request, etag):
+        return api_format.not_modified(etag, cache_headers)
+    cached = await run_in_threadpool(thumbnail_cache.get, src, width)
+    if not cached:
+        return Response(status_code=404, headers={"Cache-Control": "no-store"})
+    path, media_type = cached
+    return FileResponse(path, media_type=media_type, headers=cache_headers)
 
 # --- Video Analysis ---
+# Tokens per video analysis or growth report: taken when the job is queued, refunded if it fails
+ANALYSIS_COST = 10
+
+def no_tokens_response():
+    return HTMLResponse("<div class='auth-required'>Недостаточно токенов для анализа</div>", status_code=402)
+
+def queue_full_response():
+    return HTMLResponse("<div class='auth-required'>Очередь анализа переполнена, попробуйте через минуту</div>", status_code=429)
+
+def refund(user_id: int, amount: int):
+    with Session(engine) as session:
+        auth.refund_tokens(user_id, amount, session)
+
+def refund_on_failure(user_id: int, amount: int, fn):
+    """Wrap a job whose tokens were already taken so that a failed or cancelled run gives them back."""
+    async def run():
+        try:
+            return await fn()
+        except asyncio.CancelledError:
+            await asyncio.shield(run_in_threadpool(refund, user_id, amount))
+            raise
+        except Exception:
+            await run_in_threadpool(refund, user_id, amount)
+            raise
+    return run
+
+async def submit_paid_job(user: User, db: Session, kind: str, fn, params: dict, key=None):
+    """
+    Charge ANALYSIS_COST up front and queue the job; returns the job id, or an error response.
+    A job joining an identical one already in the queue (same `key`) is free: only the
+    submitter whose job actually runs pays.
+    """
+    if not auth.deduct_tokens(user, ANALYSIS_COST, db):
+        return no_tokens_response()
+    try:
+        job_id, created = await job_queue.submit(user, kind, refund_on_failure(user.id, ANALYSIS_COST, fn), params, key=key)
+    except QueueFullError:
+        await run_in_threadpool(refund, user.id, ANALYSIS_COST)
+        return queue_full_response()
+    if not created:
+        await run_in_threadpool(refund, user.id, ANALYSIS_COST)
+    return job_id
+
 @app.get("/api/video-analysis-page", response_class=HTMLResponse)
 async def video_analysis_page(request: Request, user: User = Depends(get_user_from_cookie)):
     return templates.TemplateResponse("partials/video_analysis_page.html", get_auth_context(request, user))
@@ -384,13 +759,57 @@ async def video_analysis_page(request: Request, user: User = Depends(get_user_fr
 @app.post("/api/analyze", response_class=HTMLResponse)
 async def analyze(request: Request, video_url: str = Form(""), video_id: str = Form(""), platform: str = Form("instagram"), user: User = Depends(get_user_from_cookie), db: Session = Depends(get_session)):
     if not user: return HTMLResponse("Needs login")
-    auth.deduct_tokens(user, 10, db) # Analysis is expensive
     vid = video_url or video_id
     video_data = {"platform_id": vid, "platform": platform, "video_url": vid}
-    analysis = await ai_agent.analyze_video(video_data)
+    # Cached analyses are served immediately and for free
+    cached = await ai_agent.get_cached(video_data)
+    if cached is not None:
+        ctx = get_auth_context(request, user)
+        ctx.update({"analysis": cached, "video_id": vid})
+        return templates.TemplateResponse("partials/analysis_result.html", ctx)
+
+    job_id = await submit_paid_job(user, db, "video", lambda: ai_agent.analyze_video(video_data), {"video": video_data},
+                                   key=("video", ai_agent.cache_key(video_data, None, ai_agent.media_analysis)))
+    if isinstance(job_id, Response):
+        return job_id
+    return render_job(request, user, await job_queue.get(job_id))
+
+@app.post("/api/profile-report", response_class=HTMLResponse)
+async def profile_report(request: Request, username: str = Form(...), user: User = Depends(get_user_from_cookie), db: Session = Depends(get_session)):
+    if not user: return HTMLResponse("Needs login")
+    clean_username = username.replace("@", "").strip()
+    job_id = await submit_paid_job(user, db, "profile_report",
+                                   lambda: profile_service.generate_growth_report(clean_username, "instagram"),
+                                   {"username": clean_username}, key=("profile_report", clean_username.lower()))
+    if isinstance(job_id, Response):
+        return job_id
+    return render_job(request, user, await job_queue.get(job_id))
+
+# --- Background jobs (polled by HTMX from partials/job_status.html) ---
+JOB_RESULT_TEMPLATES = {
+    "video": ("partials/analysis_result.html", "analysis"),
+    "profile_report": ("partials/profile_report.html", "report"),
+}
+
+def render_job(request: Request, user: User, job):
     ctx = get_auth_context(request, user)
-    ctx.update({"analysis": analysis, "video_id": vid})
-    return templates.TemplateResponse("partials/analysis_result.html", ctx)
+    template, result_name = JOB_RESULT_TEMPLATES[job.kind]
+    if job.status == "done":
+        ctx.update({result_name: json.loads(job.result)})
+        return templates.TemplateResponse(template, ctx)
+    if job.status == "failed":
+        # 200 so the HTMX poll swaps it in and stops polling
+        return HTMLResponse("<div class='auth-required'>Анализ не удался, попробуйте позже. Токены возвращены.</div>")
+    ctx.update({"job": job, "position": job_queue.position(job.id)})
+    return templates.TemplateResponse("partials/job_status.html", ctx)
+
+@app.get("/api/jobs/{job_id}", response_class=HTMLResponse)
+async def job_status(request: Request, job_id: int, user: User = Depends(get_user_from_cookie)):
+    if not user: return HTMLResponse("Needs login")
+    job = await job_queue.get(job_id)
+    if not job or job.user_id != user.id:
+        return HTMLResponse("<div class='auth-required'>Задача не найдена</div>", status_code=404)
+    return render_job(request, user, job)
 
 if __name__ == "__main__":
     import uvicorn
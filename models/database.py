@@ -1,7 +1,8 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List, Dict, Any
 from sqlmodel import SQLModel, Field, Relationship
 import json
+from services.cache import decode_json_cached
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -38,6 +39,11 @@ class Favorite(SQLModel, table=True):
 
     user: User = Relationship(back_populates="favorites")
 
+    @property
+    def video(self) -> Dict[str, Any]:
+        """Decoded video_data, parsed once per row and then served from the JSON cache."""
+        return decode_json_cached(("fav", self.id, self.saved_at), self.video_data) or {}
+
 class SearchHistory(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id", index=True)
@@ -48,8 +54,65 @@ class SearchHistory(SQLModel, table=True):
 
     user: User = Relationship(back_populates="history_records")
 
+    @property
+    def previews(self) -> List[str]:
+        """Decoded preview_thumbnails, parsed once per row and then served from the JSON cache."""
+        return decode_json_cached(("history", self.id, self.searched_at), self.preview_thumbnails) or []
+
 class RadarKeyword(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     keyword: str = Field(unique=True, index=True)
     active: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class VideoAnalysis(SQLModel, table=True):
+    """Persisted Gemini analysis, keyed by video (platform_id/URL) and a hash of the prompt metadata."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    video_key: str = Field(index=True)
+    content_hash: str = Field(index=True)
+    result: str # JSON representation of the analysis dict
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class AnalysisJob(SQLModel, table=True):
+    """Background LLM job (video analysis, growth report) processed by services.job_queue."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    kind: str # 'video' or 'profile_report'
+    status: str = Field(default="queued", index=True) # queued | running | done | failed
+    priority: int = 1
+    params: str = "{}" # JSON of the job input (video_data, username...)
+    result: Optional[str] = None # JSON of the job output
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+# --- Usage rollups (maintained on write by services.usage_stats, read by the admin page) ---
+
+class UsageCounter(SQLModel, table=True):
+    """Running totals ('users', 'searches', 'tokens_spent')."""
+    name: str = Field(primary_key=True)
+    value: int = 0
+
+class DailyUsage(SQLModel, table=True):
+    day: date = Field(primary_key=True)
+    searches: int = 0
+    tokens_spent: int = 0
+    active_users: int = 0
+
+class UserDayActivity(SQLModel, table=True):
+    """Marker row per (day, user), so active_users is only counted once per user per day."""
+    day: date = Field(primary_key=True)
+    user_id: int = Field(primary_key=True, foreign_key="user.id")
+
+class UserUsage(SQLModel, table=True):
+    user_id: int = Field(primary_key=True, foreign_key="user.id")
+    searches: int = 0
+    tokens_spent: int = 0
+    last_active_at: Optional[datetime] = None
+
+class QueryStat(SQLModel, table=True):
+    """Search count per canonical query (see services.query_normalize)."""
+    query: str = Field(primary_key=True)
+    searches: int = Field(default=0, index=True)
+    last_searched_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+from models.database import User
+from services.job_queue import JobQueue
+from services.metrics import UPSTREAM_ADMISSIONS, UPSTREAM_QUEUE_WAIT
+
+log = logging.getLogger(__name__)
+
+# Upstream fan-outs (search, spy, anomalous scans...) running at once across all users
+UPSTREAM_SLOTS = int(os.getenv("UPSTREAM_SLOTS", "4"))
+# ...and per user
+UPSTREAM_PER_USER = int(os.getenv("UPSTREAM_PER_USER", "1"))
+# Requests a single user may have waiting; more are rejected straight away
+UPSTREAM_USER_QUEUE = int(os.getenv("UPSTREAM_USER_QUEUE", "3"))
+# Waiting requests across all users before everyone gets 429
+UPSTREAM_QUEUE_MAX = int(os.getenv("UPSTREAM_QUEUE_MAX", "50"))
+# Give up on a queued request after this long (the client would have timed out anyway)
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "20"))
+
+class UpstreamBusyError(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Admission control in front of upstream fan-outs. At most `slots` run at
+    once and at most `per_user` per user; the rest wait in a fair queue: by
+    priority class (as in the job queue), then round-robin across users, so
+    one user firing dozens of searches only ever holds their own share.
+    Requests beyond the per-user or global queue limits are rejected at once
+    with a Retry-After estimate.
+    """
+    def __init__(self, slots: int = UPSTREAM_SLOTS, per_user: int = UPSTREAM_PER_USER,
+                 user_queue: int = UPSTREAM_USER_QUEUE, max_waiting: int = UPSTREAM_QUEUE_MAX,
+                 queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT):
+        self.slots = slots
+        self.per_user = per_user
+        self.user_queue = user_queue
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self._running: Dict[int, int] = {}
+        self._inflight = 0
+        # priority -> user_id -> waiters (futures resolved when granted a slot)
+        self._classes: Dict[int, "OrderedDict[int, Deque[asyncio.Future]]"] = {}
+        self._waiting = 0
+        # Smoothed slot hold time, for Retry-After
+        self._avg_hold = 2.0
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self._avg_hold * (self._waiting + 1) / max(self.slots, 1)))
+
+    def _can_run(self, user_id: int) -> bool:
+        return self._inflight < self.slots and self._running.get(user_id, 0) < self.per_user
+
+    def _acquire(self, user_id: int):
+        self._inflight += 1
+        self._running[user_id] = self._running.get(user_id, 0) + 1
+
+    def _release(self, user_id: int):
+        self._inflight -= 1
+        self._running[user_id] -= 1
+        if not self._running[user_id]:
+            del self._running[user_id]
+        self._grant_next()
+
+    def _grant_next(self):
+        """Hand free slots to waiters: highest priority class first, round-robin across its users."""
+        for priority in sorted(self._classes):
+            users = self._classes[priority]
+            for user_id in list(users):
+                if self._inflight >= self.slots:
+                    return
+                if self._running.get(user_id, 0) >= self.per_user:
+                    continue
+                waiters = users.pop(user_id)
+                waiter = waiters.popleft()
+                # Rotate this user to the back of their class
+                if waiters:
+                    users[user_id] = waiters
+                self._waiting -= 1
+                self._acquire(user_id)
+                waiter.set_result(None)
+
+    def _user_waiting(self, priority: int, user_id: int) -> int:
+        return len(self._classes.get(priority, {}).get(user_id, ()))
+
+    @asynccontextmanager
+    async def slot(self, user: User):
+        """Hold an upstream slot for the duration of the block, or raise UpstreamBusyError."""
+        user_id, priority = user.id, JobQueue.priority_for(user)
+        started = time.perf_counter()
+        if self._can_run(user_id) and not self._waiting:
+            self._acquire(user_id)
+            UPSTREAM_ADMISSIONS.inc(result="admitted")
+        else:
+            if self._user_waiting(priority, user_id) >= self.user_queue or self._waiting >= self.max_waiting:
+                UPSTREAM_ADMISSIONS.inc(result="rejected")
+                log.warning("Upstream request rejected", extra={"user_id": user_id, "waiting": self._waiting, "inflight": self._inflight})
+                raise UpstreamBusyError("Too many upstream requests", self._retry_after())
+            waiter = asyncio.get_running_loop().create_future()
+            self._classes.setdefault(priority, OrderedDict()).setdefault(user_id, deque()).append(waiter)
+            self._waiting += 1
+            UPSTREAM_ADMISSIONS.inc(result="queued")
+            # Slots may be free but held back for fairness; this may grant the new waiter at once
+            self._grant_next()
+            # asyncio.wait rather than wait_for: before 3.12, wait_for swallows a cancel that
+            # arrives together with the grant, and the cancelled request would run anyway
+            try:
+                done, _ = await asyncio.wait({waiter}, timeout=self.queue_timeout)
+            except asyncio.CancelledError:
+                self._abandon(priority, user_id, waiter)
+                raise
+            if not done:
+                self._abandon(priority, user_id, waiter)
+                UPSTREAM_ADMISSIONS.inc(result="timeout")
+                raise UpstreamBusyError("Timed out waiting for an upstream slot", self._retry_after())
+        UPSTREAM_QUEUE_WAIT.observe(time.perf_counter() - started)
+        held = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * (time.perf_counter() - held)
+            self._release(user_id)
+
+    def _abandon(self, priority: int, user_id: int, waiter: asyncio.Future):
+        """A waiter gave up: drop it from the queue, or hand back the slot it was granted meanwhile."""
+        if waiter.done() and not waiter.cancelled():
+            self._release(user_id)
+        else:
+            waiter.cancel()
+            self._forget(priority, user_id, waiter)
+
+    def _forget(self, priority: int, user_id: int, waiter: asyncio.Future):
+        users = self._classes.get(priority, {})
+        waiters = users.get(user_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._waiting -= 1
+            if not waiters:
+                del users[user_id]
+
+# Global instance
+admission = AdmissionController()
@@ -1,30 +1,168 @@
 import os
 import json
-import google.generativeai as genai
-from typing import List, Dict, Any
-from dotenv import load_dotenv
+import logging
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from sqlmodel import Session, select
+from core.config import GEMINI_API_KEY
+from core.database import engine
+from models.database import VideoAnalysis
+from services.cache import LRUCache
+from services.media_utils import MediaUtils
+from services.metrics import AI_REQUESTS, AI_LATENCY
 
-load_dotenv()
+log = logging.getLogger(__name__)
+
+# Max simultaneous Gemini calls per process
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+# Download analyzed reels and send keyframes + transcript along with the metadata (needs ffmpeg)
+MEDIA_ANALYSIS = os.getenv("MEDIA_ANALYSIS", "0").lower() in ("1", "true", "yes")
+
+class AnalysisError(Exception):
+    """The model call failed or returned no usable JSON; nothing was cached."""
 
 class AIAgent:
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        if self.api_key:
+    def __init__(self, model: Any = None, persist: bool = True, media_analysis: bool = MEDIA_ANALYSIS):
+        """
+        `model` may be any object exposing generate_content(prompt) (and optionally
+        generate_content_async) - pass a local fake to test without the Gemini API.
+        """
+        self.api_key = GEMINI_API_KEY
+        # The Gemini SDK is slow to import, so the real client is created on first use
+        self._model = model
+        self.persist = persist
+        self.media_analysis = media_analysis
+        self._executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._memory = LRUCache(maxsize=2000, name="ai")
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    @property
+    def model(self) -> Any:
+        if self._model is None and self.api_key:
+            import google.generativeai as genai
             genai.configure(api_key=self.api_key)
             # Using 1.5 Pro for depth
-            self.model = genai.GenerativeModel('gemini-1.5-pro')
-        else:
-            self.model = None
+            self._model = genai.GenerativeModel('gemini-1.5-pro')
+        return self._model
+
+    @property
+    def is_mocked(self) -> bool:
+        # Checked without touching self.model, so mocked setups never import the SDK
+        return (self._model is None and not self.api_key) or self.api_key == "mocked_gemini_api_key"
+
+    @staticmethod
+    def cache_key(video_data: Dict[str, Any], extra_meta: Dict[str, Any] = None, media: bool = False) -> Tuple[str, str]:
+        """(video_key, content_hash): the video's platform_id/URL plus a hash of everything sent to the model."""
+        metadata = {**video_data, **(extra_meta or {})}
+        video_key = str(metadata.get("platform_id") or metadata.get("video_url") or "")
+        # Analyses that saw the frames and transcript are kept apart from metadata-only ones
+        hashed = {**metadata, "_media": True} if media else metadata
+        content_hash = hashlib.sha256(json.dumps(hashed, sort_keys=True, default=str).encode()).hexdigest()
+        return video_key, content_hash
+
+    async def get_cached(self, video_data: Dict[str, Any], extra_meta: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """Previously computed analysis for this exact video metadata (memory first, then DB)."""
+        key = self.cache_key(video_data, extra_meta, self.media_analysis)
+        result = self._memory.get(key)
+        if result is not None or not self.persist:
+            return result
+        # SQLite calls block, so they run in a worker thread rather than on the event loop
+        result = await asyncio.to_thread(self._load, key)
+        if result is not None:
+            self._memory.set(key, result)
+        return result
+
+    def _load(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with Session(engine) as session:
+            row = session.exec(select(VideoAnalysis).where(
+                VideoAnalysis.video_key == key[0], VideoAnalysis.content_hash == key[1]
+            ).limit(1)).first()
+        return json.loads(row.result) if row else None
+
+    async def _store(self, key: Tuple[str, str], result: Dict[str, Any]):
+        self._memory.set(key, result)
+        if self.persist:
+            await asyncio.to_thread(self._save, key, result)
+
+    def _save(self, key: Tuple[str, str], result: Dict[str, Any]):
+        with Session(engine) as session:
+            session.add(VideoAnalysis(video_key=key[0], content_hash=key[1], result=json.dumps(result)))
+            session.commit()
 
     async def analyze_video(self, video_data: Dict[str, Any], extra_meta: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Analyze an Instagram Reel using Gemini 1.5 Pro.
+        Results are cached per video/metadata hash, and concurrent requests for the
+        same video share a single in-flight model call. Raises AnalysisError when
+        Gemini fails; only the keyless (mocked) setup returns the sample analysis.
         """
-        if not self.model or self.api_key == "mocked_gemini_api_key":
+        if self.is_mocked:
+            AI_REQUESTS.inc(result="mock")
             return self._get_mock_analysis()
 
+        key = self.cache_key(video_data, extra_meta, self.media_analysis)
+        cached = await self.get_cached(video_data, extra_meta)
+        if cached is not None:
+            AI_REQUESTS.inc(result="cached")
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None and self._memory.get(key) is not None:
+            # Generated by a call that finished while this one was reading the DB
+            AI_REQUESTS.inc(result="cached")
+            return self._memory.get(key)
+        if task is not None:
+            AI_REQUESTS.inc(result="coalesced")
+        else:
+            AI_REQUESTS.inc(result="generated")
+            task = asyncio.ensure_future(self._analyze_uncached(key, video_data, extra_meta))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        # shield: one caller disconnecting must not cancel the shared call for the others
+        return await asyncio.shield(task)
+
+    async def _generate(self, prompt: str):
+        """Run the model call without blocking the event loop, bounded by GEMINI_MAX_CONCURRENCY."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        async with self._semaphore:
+            with AI_LATENCY.time():
+                if hasattr(self.model, "generate_content_async"):
+                    return await self.model.generate_content_async(prompt)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, self.model.generate_content, prompt)
+
+    async def _media_parts(self, video_data: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        """Transcript and keyframe images of the reel; empty when it cannot be fetched or processed."""
+        url = str(video_data.get("video_url") or "")
+        if not url.startswith("https://"):
+            return "", []
+        def read_frames(paths: List[str]) -> List[Dict[str, Any]]:
+            frames = []
+            for path in paths:
+                with open(path, "rb") as f:
+                    frames.append({"mime_type": "image/jpeg", "data": f.read()})
+            return frames
+
+        try:
+            media = await MediaUtils.process_async(url)
+            return media["transcript"], await asyncio.to_thread(read_frames, media["keyframes"])
+        except Exception as e:
+            log.warning("Media pipeline failed, analyzing metadata only", extra={"url": url[:200], "error": str(e)})
+            return "", []
+
+    async def _analyze_uncached(self, key: Tuple[str, str], video_data: Dict[str, Any], extra_meta: Dict[str, Any] = None) -> Dict[str, Any]:
         # Build a robust prompt for 1.5 Pro
         metadata_str = json.dumps({**video_data, **(extra_meta or {})}, indent=2)
+        transcript, frames = await self._media_parts(video_data) if self.media_analysis else ("", [])
+        media_str = ""
+        if transcript:
+            media_str += f"\n        Transcript:\n        {transcript}\n"
+        if frames:
+            media_str += f"\n        {len(frames)} keyframes of the video are attached as images, in order.\n"
         
         prompt = f"""
         Role: Expert Social Media Strategist and Video Editor.
@@ -32,7 +170,7 @@ class AIAgent:
         
         Metadata:
         {metadata_str}
-        
+        {media_str}
         Instructions:
         Extract the core 'winning formula' of this video. Return a valid JSON object with EXACTLY these keys:
         1. visual_hook: Focus on the first 3 seconds. What visual or text element grabs attention immediately?
@@ -44,20 +182,21 @@ class AIAgent:
         """
 
         try:
-            # Note: For real multimodal, we could pass the video file here
-            # But for the MVP/Specified flow, we analyze metadata/descriptions
-            response = self.model.generate_content(prompt)
-            
+            # Keyframes (when media analysis is on) go along as inline image parts
+            response = await self._generate([prompt, *frames] if frames else prompt)
+
             text = response.text
             start = text.find('{')
             end = text.rfind('}') + 1
-            if start != -1 and end != -1:
-                return json.loads(text[start:end])
-            
-            return self._get_mock_analysis()
+            if start == -1 or end == 0:
+                raise ValueError("no JSON object in the model response")
+            result = json.loads(text[start:end])
         except Exception as e:
-            print(f"Gemini 1.5 Pro Error: {e}")
-            return self._get_mock_analysis()
+            AI_REQUESTS.inc(result="error")
+            log.error("Gemini analysis failed", extra={"video_key": key[0], "error": str(e)})
+            raise AnalysisError(str(e)) from e
+        await self._store(key, result)
+        return result
 
     def _get_mock_analysis(self) -> Dict[str, Any]:
         return {
@@ -0,0 +1,84 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import Request, Response
+
+# Optional fast paths: orjson for serialization, msgpack for the binary mode
+# and brotli for compression. Everything falls back to the stdlib.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DATA_FORMATS = ("json", "msgpack")
+
+def wants_data(fmt: str) -> bool:
+    """True if the caller asked for a machine-readable payload instead of HTML."""
+    return fmt in DATA_FORMATS
+
+def select_fields(videos: List[Dict[str, Any]], fields: str) -> List[Dict[str, Any]]:
+    """Project each video dict onto a comma-separated field list (`fields=views,likes`)."""
+    keys = [f.strip() for f in fields.split(",") if f.strip()] if fields else []
+    if not keys:
+        return videos
+    return [{k: v.get(k) for k in keys} for v in videos]
+
+def dumps(payload: Any, fmt: str = "json") -> Tuple[bytes, str]:
+    """Serialize payload, returning (body, media_type)."""
+    if fmt == "msgpack" and msgpack is not None:
+        return msgpack.packb(payload, use_bin_type=True), "application/msgpack"
+    if orjson is not None:
+        return orjson.dumps(payload), "application/json"
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode(), "application/json"
+
+def make_etag(*parts: Any) -> str:
+    """
+    Weak ETag from an arbitrary list of version parts (or a raw body). Weak because one
+    version is served brotli-, gzip- or un-encoded, and those bodies are not byte-identical.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    for p in parts:
+        h.update(p if isinstance(p, bytes) else str(p).encode())
+        h.update(b"\x00")
+    return f'W/"{h.hexdigest()}"'
+
+def _opaque(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match check with weak comparison (RFC 9110), so W/ and strong forms of a tag match."""
+    inm = request.headers.get("if-none-match", "")
+    if inm.strip() == "*":
+        return True
+    return _opaque(etag) in [_opaque(t) for t in inm.split(",")]
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding", **(headers or {})})
+
+def data_response(request: Request, payload: Any, fmt: str = "json", etag: Optional[str] = None) -> Response:
+    """
+    Build a compact JSON/msgpack response with ETag revalidation.
+    Brotli is applied here when the client accepts it; otherwise the app-wide
+    GZipMiddleware compresses the body.
+    """
+    body, media_type = dumps(payload, fmt)
+    etag = etag or make_etag(body)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if is_not_modified(request, etag):
+        return not_modified(etag, headers)
+
+    if brotli is not None and "br" in request.headers.get("accept-encoding", "") and len(body) > 500:
+        body = brotli.compress(body, quality=5)
+        headers["Content-Encoding"] = "br"
+    return Response(content=body, media_type=media_type, headers=headers)
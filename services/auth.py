@@ -3,9 +3,11 @@ import os
 import time
 from typing import Optional
 from fastapi import Request, Response, HTTPException, status
+from sqlalchemy import update
 from sqlmodel import Session, select
 from core.database import get_session, engine
 from models.database import User
+from services import usage_stats
 
 # In-memory session store for simplicity
 # Maps session_id (str) -> user_id (int)
@@ -73,13 +75,25 @@ def deduct_tokens(user: User, amount: int, session: Session) -> bool:
     """Deduct tokens and save. Returns True if successful, False if insufficient tokens."""
     if user.role == "admin":
         return True # Admin has unlimited
-        
-    if user.tokens >= amount:
-        user.tokens -= amount
-        session.add(user)
-        session.commit()
-        return True
-    return False
+
+    # Check and decrement in one statement, so two requests cannot both spend the same balance
+    stmt = update(User).where(User.id == user.id, User.tokens >= amount).values(tokens=User.tokens - amount)
+    if not session.execute(stmt).rowcount:
+        return False
+    usage_stats.record_tokens(session, user.id, amount)
+    session.commit()
+    if user in session:
+        session.refresh(user)
+    return True
+
+def refund_tokens(user_id: int, amount: int, session: Session):
+    """Give back tokens taken by deduct_tokens for work that did not complete."""
+    user = session.get(User, user_id)
+    if not user or user.role == "admin":
+        return
+    session.execute(update(User).where(User.id == user_id).values(tokens=User.tokens + amount))
+    usage_stats.record_tokens(session, user_id, -amount)
+    session.commit()
 
 def init_admin_user(session: Session):
     """Ensure at least one admin exists"""
@@ -93,4 +107,5 @@ def init_admin_user(session: Session):
             tokens=999999
         )
         session.add(new_admin)
+        usage_stats.record_signup(session)
         session.commit()
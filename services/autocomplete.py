@@ -0,0 +1,105 @@
+import heapq
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from sqlmodel import Session, select
+from models.database import QueryStat
+from services.query_normalize import SPELLINGS, canonical_query, query_tokens
+
+# Most searched queries kept per token prefix; suggestions are ranked from these
+TOP_PER_PREFIX = 50
+# Recently searched queries are always scored too: cached result pools are among them
+RECENT_QUERIES = 500
+# Ranking bonus (in searches) for queries whose results are already cached
+CACHED_BOOST = 1000
+# Niche keywords have seed accounts behind them, so rank them above one-off queries
+NICHE_WEIGHT = 2
+
+class QueryIndex:
+    """
+    Prefix index for search suggestions. Every prefix of every token of a
+    canonical query (and of the token's spellings in SYNONYMS, so typing "фит"
+    still suggests "fitness") maps to the TOP_PER_PREFIX most searched queries
+    with that prefix, kept ranked as searches are recorded. Each typed token is
+    matched against the query's tokens separately, so "gym fi" finds
+    "fitness gym" even though canonical queries sort their tokens.
+    """
+    def __init__(self):
+        self._searches: Dict[str, int] = {}
+        self._top: Dict[str, List[str]] = {}
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._searches)
+
+    @staticmethod
+    def _keys(query: str) -> Set[str]:
+        tokens = query.split()
+        return set(tokens) | {alias for t in tokens for alias in SPELLINGS.get(t, ())}
+
+    def _rank(self, query: str):
+        """Re-rank `query` in the top list of each of its prefixes after its count changed."""
+        searches = self._searches[query]
+        for key in self._keys(query):
+            for n in range(1, len(key) + 1):
+                top = self._top.setdefault(key[:n], [])
+                if query in top:
+                    top.remove(query)
+                elif len(top) >= TOP_PER_PREFIX and self._searches[top[-1]] >= searches:
+                    continue
+                top.append(query)
+                top.sort(key=lambda q: -self._searches[q])
+                del top[TOP_PER_PREFIX:]
+
+    def add(self, query: str, searches: int = 0):
+        """Add a canonical query (or more searches of a known one)."""
+        self._searches[query] = self._searches.get(query, 0) + searches
+        self._rank(query)
+
+    def record(self, raw_query: str):
+        """A new search happened."""
+        query = canonical_query(raw_query)
+        if not query:
+            return
+        self.add(query, 1)
+        self._recent[query] = None
+        self._recent.move_to_end(query)
+        while len(self._recent) > RECENT_QUERIES:
+            self._recent.popitem(last=False)
+
+    def load(self, session: Session, niches: Iterable[str]):
+        """(Re)build from the per-query rollup and the niche keywords (ranked once, not per insert)."""
+        searches = {niche: NICHE_WEIGHT for niche in niches if niche != "default"}
+        for stat in session.exec(select(QueryStat)):
+            searches[stat.query] = searches.get(stat.query, 0) + stat.searches
+        by_prefix: Dict[str, Set[str]] = {}
+        for query in searches:
+            for key in self._keys(query):
+                for n in range(1, len(key) + 1):
+                    by_prefix.setdefault(key[:n], set()).add(query)
+        self._top = {prefix: heapq.nlargest(TOP_PER_PREFIX, queries, key=lambda q: (searches[q], q))
+                     for prefix, queries in by_prefix.items()}
+        self._searches = searches
+
+    def _matches(self, query: str, typed: List[str]) -> bool:
+        keys = self._keys(query)
+        return all(any(k.startswith(t) for k in keys) for t in typed)
+
+    def suggest(self, text: str, limit: int = 8, is_cached: Optional[Callable[[str], bool]] = None) -> List[Dict[str, object]]:
+        """Most searched queries matching every typed token as a prefix (cached ones first)."""
+        typed = query_tokens(text)
+        if not typed:
+            return []
+        candidates = set(self._recent)
+        for token in typed:
+            candidates.update(self._top.get(token, ()))
+        scored = []
+        for query in candidates:
+            if not self._matches(query, typed):
+                continue
+            cached = bool(is_cached and is_cached(query))
+            scored.append((self._searches[query] + (CACHED_BOOST if cached else 0), query, cached))
+        return [{"query": q, "cached": cached, "searches": self._searches[q]}
+                for _, q, cached in heapq.nlargest(limit, scored)]
+
+# Global instance
+query_index = QueryIndex()
@@ -1,32 +1,119 @@
+import itertools
+import json
+import threading
 import time
-from typing import Any, Dict
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from services.metrics import CACHE_REQUESTS
 
 class TTLCache:
-    def __init__(self):
+    def __init__(self, name: str = "app"):
+        self.name = name
         self._cache: Dict[str, Dict[str, Any]] = {}
+        self._versions = itertools.count(1)
 
     def set(self, key: str, value: Any, ttl_seconds: int = 600):
         """Set a value in the cache with a Time-To-Live in seconds (default 10 mins)."""
         self._cache[key] = {
             "value": value,
-            "expires_at": time.time() + ttl_seconds
+            "expires_at": time.time() + ttl_seconds,
+            "version": next(self._versions),
         }
 
     def get(self, key: str) -> Any:
         """Get a value from the cache, if it exists and is not expired. Return None otherwise."""
         item = self._cache.get(key)
         if not item:
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
             return None
         
         if time.time() > item["expires_at"]:
             # Expired
             del self._cache[key]
+            CACHE_REQUESTS.inc(cache=self.name, result="expired")
             return None
             
+        CACHE_REQUESTS.inc(cache=self.name, result="hit")
         return item["value"]
 
+    def get_version(self, key: str) -> Optional[int]:
+        """Monotonic version of the current entry (changes every time the key is re-set)."""
+        item = self._cache.get(key)
+        if not item or time.time() > item["expires_at"]:
+            return None
+        return item["version"]
+
     def clear(self):
         self._cache.clear()
 
+    def __len__(self):
+        return len(self._cache)
+
+class LRUCache:
+    """
+    Bounded cache that evicts the least recently used entry once full.
+    Thread-safe: threadpool code (exports, card rendering) shares instances with the event loop.
+    """
+    def __init__(self, maxsize: int = 1024, name: Optional[str] = None):
+        self.maxsize = maxsize
+        # Named caches report hits/misses to metrics
+        self.name = name
+        self._cache: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value (marking it as recently used) or None."""
+        with self._lock:
+            try:
+                self._cache.move_to_end(key)
+                value = self._cache[key]
+            except KeyError:
+                value = None
+                hit = False
+            else:
+                hit = True
+        if self.name:
+            CACHE_REQUESTS.inc(cache=self.name, result="hit" if hit else "miss")
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+def decode_json_cached(key: Hashable, raw: str) -> Any:
+    """
+    Decode a JSON column once per row and reuse the result on later views.
+    The key must identify an immutable row version, e.g. (table, id, created_at),
+    so a recycled SQLite rowid never serves a stale blob.
+    Each caller gets its own top-level dict/list, so adding, removing or replacing
+    keys and items is safe; nested values are shared with the cache and read-only.
+    """
+    value = json_cache.get(key)
+    if value is None:
+        value = json.loads(raw) if raw else None
+        json_cache.set(key, value)
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
 # Global cache instance
 app_cache = TTLCache()
+
+# Decoded JSON columns (Favorite.video_data, SearchHistory.preview_thumbnails)
+json_cache = LRUCache(maxsize=5000, name="json")
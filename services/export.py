@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+from urllib.parse import quote
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select
+from core.database import engine
+from models.database import Favorite, SearchHistory
+
+# Optional fast paths: orjson for NDJSON lines, pyarrow for the Parquet format
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+# Rows fetched per DB round trip (yield_per) and per Parquet row group
+EXPORT_BATCH = 1000
+# Serialized output is flushed to the client in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+
+REEL_FIELDS = ["platform_id", "platform", "title", "author", "views", "likes", "comments",
+               "engagement_rate", "thumbnail_url", "video_url", "published_at"]
+FAVORITE_FIELDS = REEL_FIELDS + ["saved_at"]
+HISTORY_FIELDS = ["query", "results_count", "searched_at"]
+# Parquet column types; everything else (dates included) is written as text
+NUMERIC_FIELDS = {"views": "int64", "likes": "int64", "comments": "int64", "results_count": "int64",
+                  "engagement_rate": "float64"}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+class ExportFormatError(ValueError):
+    pass
+
+def available_formats() -> List[str]:
+    return [f for f in MEDIA_TYPES if f != "parquet" or pyarrow is not None]
+
+# --- Row sources (sync generators: StreamingResponse iterates them in a worker thread) ---
+
+def favorite_rows(user_id: int) -> Iterator[Dict[str, Any]]:
+    """A user's favorites, oldest first, streamed from the DB in EXPORT_BATCH-row batches."""
+    with Session(engine) as session:
+        stmt = (select(Favorite).where(Favorite.user_id == user_id).order_by(Favorite.id)
+                .execution_options(yield_per=EXPORT_BATCH))
+        for fav in session.exec(stmt):
+            # Decoded directly: going through the JSON cache would evict every hot entry
+            try:
+                video = json.loads(fav.video_data) or {}
+            except ValueError:
+                video = {}
+            yield {**video, "saved_at": fav.saved_at}
+
+def history_rows(user_id: int) -> Iterator[Dict[str, Any]]:
+    with Session(engine) as session:
+        stmt = (select(SearchHistory.query, SearchHistory.results_count, SearchHistory.searched_at)
+                .where(SearchHistory.user_id == user_id).order_by(SearchHistory.id)
+                .execution_options(yield_per=EXPORT_BATCH))
+        for query, results_count, searched_at in session.exec(stmt):
+            yield {"query": query, "results_count": results_count, "searched_at": searched_at}
+
+# --- Encoders: rows in, byte chunks out, never more than one chunk or batch in memory ---
+
+def _plain(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def _chunked(parts: Iterable[bytes]) -> Iterator[bytes]:
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def to_ndjson(rows: Iterable[Dict[str, Any]], fields: List[str]) -> Iterator[bytes]:
+    def lines():
+        for row in rows:
+            record = {f: _plain(row.get(f)) for f in fields}
+            if orjson is not None:
+                yield orjson.dumps(record) + b"\n"
+            else:
+                yield json.dumps(record, ensure_ascii=False).encode() + b"\n"
+    return _chunked(lines())
+
+# Spreadsheet apps evaluate cells starting with these as formulas (captions are third-party text)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _csv_cell(value: Any) -> Any:
+    value = _plain(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def to_csv(rows: Iterable[Dict[str, Any]], fields: List[str]) -> Iterator[bytes]:
+    def lines():
+        out = io.StringIO()
+        writer = csv.writer(out)
+        # BOM so Excel opens the UTF-8 (Cyrillic) text correctly
+        yield "\ufeff".encode()
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_csv_cell(row.get(f)) for f in fields])
+            if out.tell() >= CHUNK_BYTES:
+                yield out.getvalue().encode()
+                out.seek(0)
+                out.truncate()
+        yield out.getvalue().encode()
+    return _chunked(lines())
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file for ParquetWriter that hands written bytes back out in chunks."""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+def to_parquet(rows: Iterable[Dict[str, Any]], fields: List[str]) -> Iterator[bytes]:
+    """One row group per EXPORT_BATCH rows, written out as soon as it is full."""
+    schema = pyarrow.schema([(f, NUMERIC_FIELDS.get(f, "string")) for f in fields])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    batch: List[Dict[str, Any]] = []
+
+    def flush() -> bytes:
+        columns = {f: [_plain(r.get(f)) for r in batch] for f in fields}
+        for f in fields:
+            if f not in NUMERIC_FIELDS:
+                columns[f] = [None if v is None else str(v) for v in columns[f]]
+        writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+        batch.clear()
+        return sink.drain()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH:
+            yield flush()
+    if batch:
+        yield flush()
+    writer.close()
+    yield sink.drain()
+
+ENCODERS = {"ndjson": to_ndjson, "csv": to_csv, "parquet": to_parquet}
+
+def export_response(rows: Iterable[Dict[str, Any]], fields: List[str], fmt: str, name: str) -> StreamingResponse:
+    """Chunked download of `rows` as NDJSON, CSV or Parquet. Raises ExportFormatError for other formats."""
+    if fmt not in available_formats():
+        raise ExportFormatError(f"Unsupported export format: {fmt}")
+    filename = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return StreamingResponse(ENCODERS[fmt](rows, fields), media_type=MEDIA_TYPES[fmt],
+                             headers={"Content-Disposition": content_disposition(filename)})
+
+def content_disposition(filename: str) -> str:
+    """
+    Attachment header for any filename (e.g. a Cyrillic search query). Headers are
+    latin-1, so send an ASCII fallback plus the real name per RFC 5987/6266.
+    """
+    stem, ext = os.path.splitext(filename)
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", stem.encode("ascii", "ignore").decode()).strip("._-")
+    fallback = f"{stem or 'export'}{ext}"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
@@ -0,0 +1,231 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import IO, Any, Awaitable, Callable, Dict, List, Optional
+from services.providers import dedup_key
+
+# fcntl is POSIX-only: elsewhere there is a single worker and no lock is needed
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# Niches the home feed is assembled from
+FEED_KEYWORDS = ["travel", "fitness", "fashion", "food", "luxury", "tech", "business", "motivation"]
+# A snapshot older than this is rebuilt in the background on the next feed request
+FEED_REFRESH_SECONDS = int(os.getenv("FEED_REFRESH_SECONDS", "900"))
+# Last snapshot on disk, so a restarted worker serves the feed immediately. Worker processes
+# share it: one of them builds (under FEED_SNAPSHOT_PATH.lock), the others load its result
+FEED_SNAPSHOT_PATH = os.getenv("FEED_SNAPSHOT_PATH", "cache/home_feed.json")
+# Older versions stay addressable so clients scrolling through one keep consistent pages
+FEED_KEEP_VERSIONS = 3
+# After a build that fails or finds nothing, wait this long before the next attempt,
+# doubling with every consecutive failure up to FEED_RETRY_MAX_SECONDS
+FEED_RETRY_SECONDS = int(os.getenv("FEED_RETRY_SECONDS", "30"))
+FEED_RETRY_MAX_SECONDS = int(os.getenv("FEED_RETRY_MAX_SECONDS", "900"))
+# Niches fetched at once (each is a full seed-account fan-out)
+FEED_BUILD_CONCURRENCY = 2
+FEED_PER_PAGE = 12
+
+SearchFn = Callable[[str, str, str], Awaitable[List[Dict[str, Any]]]]
+
+class FeedSnapshot:
+    def __init__(self, version: str, built_at: float, videos: List[Dict[str, Any]]):
+        self.version = version
+        self.built_at = built_at
+        self.videos = videos
+
+    def page(self, page: int, per_page: int = FEED_PER_PAGE) -> List[Dict[str, Any]]:
+        start = (max(page, 1) - 1) * per_page
+        return self.videos[start:start + per_page]
+
+    def has_page(self, page: int, per_page: int = FEED_PER_PAGE) -> bool:
+        return (max(page, 1) - 1) * per_page < len(self.videos)
+
+def rank_feed(pools: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Merge per-niche results into one feed: each niche ranked by views, then
+    interleaved round-robin so no single niche dominates a page. A reel that
+    shows up in several niches is kept once, at its first position.
+    """
+    ranked = [sorted(videos, key=lambda v: v.get("views", 0) or 0, reverse=True) for videos in pools.values()]
+    seen, feed = set(), []
+    for row in range(max((len(r) for r in ranked), default=0)):
+        for videos in ranked:
+            if row >= len(videos):
+                continue
+            key = dedup_key(videos[row])
+            if key in seen:
+                continue
+            if key:
+                seen.add(key)
+            feed.append(videos[row])
+    return feed
+
+class FeedBuilder:
+    """
+    Materializes the home feed in the background into versioned, immutable
+    snapshots. Requests only ever slice a snapshot, so the feed never calls the
+    upstream APIs on the request path, and a cursor (version + page) always
+    pages through the same ordering. Rebuilds are lazy: a stale snapshot is only
+    refreshed when someone requests the feed, and only by one process at a time.
+    A failed or empty build backs off (FEED_RETRY_SECONDS, doubling per failure),
+    so feed requests against a failing upstream don't rebuild back to back.
+    """
+    def __init__(self, search_fn: SearchFn, keywords: List[str] = None,
+                 refresh_seconds: int = FEED_REFRESH_SECONDS, path: str = FEED_SNAPSHOT_PATH):
+        self.search_fn = search_fn
+        self.keywords = keywords or FEED_KEYWORDS
+        self.refresh_seconds = refresh_seconds
+        self.path = path
+        self._snapshots: "OrderedDict[str, FeedSnapshot]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._last_attempt = 0.0
+        self._failures = 0
+
+    @property
+    def current(self) -> Optional[FeedSnapshot]:
+        return next(reversed(self._snapshots.values()), None)
+
+    @property
+    def is_stale(self) -> bool:
+        current = self.current
+        return current is None or time.time() - current.built_at >= self.refresh_seconds
+
+    @property
+    def retry_delay(self) -> float:
+        """Seconds to wait after the last attempt before building again (0 after a success)."""
+        if not self._failures:
+            return 0
+        return min(FEED_RETRY_SECONDS * 2 ** (self._failures - 1), FEED_RETRY_MAX_SECONDS)
+
+    @property
+    def building(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def get(self, version: str = "") -> Optional[FeedSnapshot]:
+        """The pinned snapshot (None once it has been evicted), or the current one when no version is given."""
+        if version:
+            return self._snapshots.get(version)
+        return self.current
+
+    def publish(self, snapshot: FeedSnapshot):
+        self._snapshots[snapshot.version] = snapshot
+        while len(self._snapshots) > FEED_KEEP_VERSIONS:
+            self._snapshots.popitem(last=False)
+
+    def ensure_fresh(self):
+        """Start a background refresh if the current snapshot is stale and no cooldown applies. Never waits for it."""
+        if not self.is_stale or self.building:
+            return
+        if time.time() - self._last_attempt < self.retry_delay:
+            return
+        self._last_attempt = time.time()
+        self._task = asyncio.create_task(self._refresh())
+
+    async def _refresh(self):
+        built = None
+        try:
+            # Another worker may already have written a fresh snapshot
+            await asyncio.to_thread(self.load)
+            if not self.is_stale:
+                return
+            lock = await asyncio.to_thread(self._try_lock)
+            if lock is None:
+                log.info("Feed build already running in another worker")
+                return
+            try:
+                await asyncio.to_thread(self.load)
+                if not self.is_stale:
+                    return
+                built = await self.build()
+            finally:
+                lock.close()
+        except Exception:
+            log.exception("Feed build failed")
+        if built is None:
+            self._failures += 1
+            log.warning("Feed build failed, backing off", extra={"failures": self._failures, "retry_in": self.retry_delay})
+        else:
+            self._failures = 0
+
+    def _try_lock(self) -> Optional[IO]:
+        """Non-blocking exclusive build lock shared by all worker processes; None while another one holds it."""
+        if not self.path or fcntl is None:
+            return io.StringIO()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock = open(self.path + ".lock", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    async def build(self) -> Optional[FeedSnapshot]:
+        semaphore = asyncio.Semaphore(FEED_BUILD_CONCURRENCY)
+
+        async def fetch(keyword: str):
+            async with semaphore:
+                try:
+                    return keyword, await self.search_fn(keyword, "all", "views")
+                except Exception as e:
+                    log.warning("Feed niche fetch failed", extra={"keyword": keyword, "error": str(e)})
+                    return keyword, []
+
+        started = time.perf_counter()
+        pools = dict(await asyncio.gather(*(fetch(k) for k in self.keywords)))
+        videos = rank_feed(pools)
+        if not videos:
+            log.warning("Feed build returned nothing, keeping the previous snapshot")
+            return None
+        snapshot = FeedSnapshot(format(int(time.time() * 1000), "x"), time.time(), videos)
+        self.publish(snapshot)
+        await asyncio.to_thread(self._save, snapshot)
+        log.info("Feed snapshot built", extra={
+            "version": snapshot.version, "reels": len(videos),
+            "niches": sum(1 for v in pools.values() if v), "elapsed_ms": round((time.perf_counter() - started) * 1000),
+        })
+        return snapshot
+
+    def _save(self, snapshot: FeedSnapshot):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": snapshot.version, "built_at": snapshot.built_at, "videos": snapshot.videos}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """Publish the snapshot saved by a previous process or another worker, if it is newer than ours."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Could not load saved feed snapshot", extra={"error": str(e)})
+            return
+        current = self.current
+        try:
+            if data["version"] in self._snapshots or (current and data["built_at"] <= current.built_at):
+                return
+            self.publish(FeedSnapshot(data["version"], data["built_at"], data["videos"]))
+        except (KeyError, TypeError) as e:
+            log.warning("Could not load saved feed snapshot", extra={"error": str(e)})
+
+    def start(self):
+        """Serve the saved snapshot right away; building waits for the first feed request."""
+        self.load()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
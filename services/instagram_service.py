@@ -1,23 +1,28 @@
-import os
 import json
+import logging
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any, Optional
-from dotenv import load_dotenv
-from apify_client import ApifyClient
+from core.config import APIFY_API_TOKEN
 
-load_dotenv()
+log = logging.getLogger(__name__)
 
 class InstagramService:
     """Service for interacting with Instagram data via Apify."""
     
     def __init__(self):
-        self.api_token = os.getenv("APIFY_API_TOKEN")
-        if not self.api_token:
-            print("WARNING: APIFY_API_TOKEN is missing. Scraper will return mock data.")
-            self.client = None
-        else:
-            print("Apify Client Initialized")
-            self.client = ApifyClient(self.api_token)
+        self.api_token = APIFY_API_TOKEN
+        self._client = None
+
+    @property
+    def client(self):
+        """ApifyClient, created (and apify_client imported) on first use."""
+        if self._client is None:
+            if not self.api_token:
+                return None
+            from apify_client import ApifyClient
+            self._client = ApifyClient(self.api_token)
+            log.info("Apify client initialized")
+        return self._client
             
     def _is_within_timeframe(self, timestamp_str: str, days: Optional[int]) -> bool:
         """Helper to check if a post is within the requested timeframe."""
@@ -37,7 +42,7 @@ class InstagramService:
         Searches Instagram via Apify for a specific hashtag.
         """
         if not self.client:
-             print("Apify token not configured. Returning empty list.")
+             log.warning("Apify token not configured, returning empty list")
              return []
 
         # Clean hashtag
@@ -50,7 +55,7 @@ class InstagramService:
             "resultsType": "reels",  # CRITICAL: Force scraper to target the Reels feed
         }
         
-        print(f"Starting Apify Hashtag Scraper for #{clean_target}...")
+        log.info("Apify hashtag scrape started", extra={"hashtag": clean_target})
         results = []
         try:
             # Run the Actor and wait for it to finish
@@ -105,7 +110,7 @@ class InstagramService:
                 if len(results) >= count:
                     break
         except Exception as e:
-            print(f"Apify scraping error: {e}")
+            log.error("Apify scraping failed", extra={"hashtag": hashtag, "error": str(e)})
             return []
 
         # Sorting
@@ -116,7 +121,7 @@ class InstagramService:
         elif sort_by == "likes":
             results.sort(key=lambda x: x["likes"], reverse=True)
             
-        print(f"Extracted {len(results)} valid Reels from Apify.")
+        log.info("Apify reels extracted", extra={"hashtag": hashtag, "reels": len(results)})
         return results
 
 # Global instance
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+from sqlmodel import Session, select
+from core.database import engine
+from models.database import AnalysisJob, User
+
+log = logging.getLogger(__name__)
+
+# Number of jobs processed at once (each one is at least one model API call)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Reject new jobs once this many are waiting, or once one user has this many waiting
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "200"))
+JOB_QUEUE_PER_USER = int(os.getenv("JOB_QUEUE_PER_USER", "5"))
+
+# Lower value = served first
+PRIORITY_BY_ROLE = {"admin": 0}
+DEFAULT_PRIORITY = 1
+
+JobFn = Callable[[], Awaitable[Any]]
+
+class QueueFullError(Exception):
+    pass
+
+class JobQueue:
+    """
+    In-process queue for long LLM work with a fixed worker pool.
+
+    Jobs are grouped by priority class (admins, then everyone else). Inside a
+    class, users are served round-robin so one user queueing 50 analyses cannot
+    starve the others, and each user may have at most JOB_QUEUE_PER_USER waiting.
+    Job state is persisted in the AnalysisJob table (from a thread, off the event
+    loop) so the frontend can poll it and results survive after the request that
+    created them. A job submitted with the `key` of one already queued or running
+    is not run again: its row follows that job's status and result.
+    """
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX,
+                 max_per_user: int = JOB_QUEUE_PER_USER):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        # priority -> user_id -> deque of (job_id, fn, key)
+        self._classes: Dict[int, "OrderedDict[int, Deque]"] = {}
+        self._queued = 0
+        # key -> {"leader": job id (None until written), "followers": [job ids]}, while the leader is pending
+        self._groups: Dict[Hashable, Dict[str, Any]] = {}
+        self._follows: Dict[int, Hashable] = {}
+        self._wakeup: Optional[asyncio.Condition] = None
+        self._tasks = []
+
+    @staticmethod
+    def priority_for(user: User) -> int:
+        return PRIORITY_BY_ROLE.get(user.role, DEFAULT_PRIORITY)
+
+    @property
+    def depth(self) -> int:
+        return self._queued
+
+    def queued_for(self, user_id: int) -> int:
+        return sum(len(users.get(user_id, ())) for users in self._classes.values())
+
+    async def start(self):
+        """Spawn the worker tasks (call from the app's startup event)."""
+        if self._tasks:
+            return
+        await asyncio.to_thread(self._fail_interrupted)
+        self._wakeup = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    @staticmethod
+    def _fail_interrupted():
+        # Jobs from a previous process cannot be resumed: their closures are gone
+        with Session(engine) as session:
+            stale = session.exec(select(AnalysisJob).where(AnalysisJob.status.in_(["queued", "running"]))).all()
+            for job in stale:
+                job.status, job.error, job.finished_at = "failed", "interrupted by restart", datetime.utcnow()
+                session.add(job)
+            session.commit()
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+
+    async def submit(self, user: User, kind: str, fn: JobFn, params: Dict[str, Any] = None,
+                     key: Hashable = None) -> Tuple[int, bool]:
+        """
+        Persist a job and queue it. `fn` is an async callable returning a JSON-serializable result.
+        Returns (job_id, created): created is False when an identical job (same `key`) is already
+        queued or running; the new row then follows it and `fn` is never called.
+        """
+        priority = self.priority_for(user)
+        job = AnalysisJob(user_id=user.id, kind=kind, priority=priority, params=json.dumps(params or {}))
+        group = self._groups.get(key) if key is not None else None
+        if group is not None:
+            job_id = await asyncio.to_thread(self._insert, job)
+            if self._groups.get(key) is group:
+                group["followers"].append(job_id)
+                self._follows[job_id] = key
+            elif group["leader"] is None:
+                await self._update([job_id], status="failed", error="could not be queued", finished_at=datetime.utcnow())
+            else:
+                # The leader finished while this row was being written
+                await asyncio.to_thread(self._copy_outcome, group["leader"], job_id)
+            return job_id, False
+
+        if self._queued >= self.max_queued:
+            raise QueueFullError("Analysis queue is full")
+        if self.queued_for(user.id) >= self.max_per_user:
+            raise QueueFullError("Too many analyses queued for this user")
+        if key is not None:
+            # Claimed before the insert, so identical submissions meanwhile follow this one
+            group = self._groups[key] = {"leader": None, "followers": []}
+        try:
+            job_id = await asyncio.to_thread(self._insert, job)
+        except Exception:
+            if key is not None:
+                await self._finish_group(key, status="failed", error="could not be queued", finished_at=datetime.utcnow())
+            raise
+        if group is not None:
+            group["leader"] = job_id
+
+        users = self._classes.setdefault(priority, OrderedDict())
+        users.setdefault(user.id, deque()).append((job_id, fn, key))
+        self._queued += 1
+        if self._wakeup is not None:
+            async with self._wakeup:
+                self._wakeup.notify()
+        return job_id, True
+
+    @staticmethod
+    def _insert(job: AnalysisJob) -> int:
+        with Session(engine) as session:
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            return job.id
+
+    def _pop_next(self):
+        for priority in sorted(self._classes):
+            users = self._classes[priority]
+            if not users:
+                continue
+            user_id, jobs = next(iter(users.items()))
+            item = jobs.popleft()
+            # Rotate this user to the back of their class (round-robin fairness)
+            del users[user_id]
+            if jobs:
+                users[user_id] = jobs
+            self._queued -= 1
+            return item
+        return None
+
+    def position(self, job_id: int) -> Optional[int]:
+        """Approximate 1-based position of a queued job (or of the job it follows), for progress display."""
+        key = self._follows.get(job_id)
+        if key is not None:
+            job_id = self._groups[key]["leader"]
+        pos = 0
+        for priority in sorted(self._classes):
+            for jobs in self._classes[priority].values():
+                for i, (jid, _, _) in enumerate(jobs):
+                    if jid == job_id:
+                        return pos + i + 1
+                pos += len(jobs)
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._queued > 0)
+                item = self._pop_next()
+            if item is None:
+                continue
+            job_id, fn, key = item
+            await self._update([job_id, *self._followers_of(key)], status="running", started_at=datetime.utcnow())
+            try:
+                result = await fn()
+                await self._finish(job_id, key, status="done", result=json.dumps(result), finished_at=datetime.utcnow())
+            except asyncio.CancelledError:
+                await asyncio.shield(self._finish(job_id, key, status="failed", error="cancelled", finished_at=datetime.utcnow()))
+                raise
+            except Exception as e:
+                log.error("Job failed", extra={"job_id": job_id, "error": str(e)})
+                await self._finish(job_id, key, status="failed", error=str(e)[:500], finished_at=datetime.utcnow())
+
+    def _followers_of(self, key: Hashable) -> List[int]:
+        group = self._groups.get(key) if key is not None else None
+        return list(group["followers"]) if group else []
+
+    async def _finish(self, job_id: int, key: Hashable, **fields):
+        await self._update([job_id], **fields)
+        if key is not None:
+            await self._finish_group(key, **fields)
+
+    async def _finish_group(self, key: Hashable, **fields):
+        """Write the final state to every follower of `key`, including ones that joined meanwhile."""
+        done = 0
+        while True:
+            followers = self._groups[key]["followers"]
+            if done == len(followers):
+                break
+            pending, done = followers[done:], len(followers)
+            await self._update(pending, **fields)
+        for job_id in self._groups.pop(key)["followers"]:
+            self._follows.pop(job_id, None)
+
+    async def _update(self, job_ids: List[int], **fields):
+        await asyncio.to_thread(self._update_sync, job_ids, fields)
+
+    @staticmethod
+    def _update_sync(job_ids: List[int], fields: Dict[str, Any]):
+        with Session(engine) as session:
+            for job_id in job_ids:
+                job = session.get(AnalysisJob, job_id)
+                if not job:
+                    continue
+                for k, v in fields.items():
+                    setattr(job, k, v)
+                session.add(job)
+            session.commit()
+
+    @staticmethod
+    def _copy_outcome(source_id: int, job_id: int):
+        with Session(engine) as session:
+            source, job = session.get(AnalysisJob, source_id), session.get(AnalysisJob, job_id)
+            if not source or not job:
+                return
+            job.status, job.result, job.error = source.status, source.result, source.error
+            job.started_at, job.finished_at = source.started_at, source.finished_at
+            session.add(job)
+            session.commit()
+
+    async def get(self, job_id: int) -> Optional[AnalysisJob]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    @staticmethod
+    def _get(job_id: int) -> Optional[AnalysisJob]:
+        with Session(engine) as session:
+            return session.get(AnalysisJob, job_id)
+
+# Global instance
+job_queue = JobQueue()
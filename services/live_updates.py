@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+from services.admission import AdmissionController, admission
+from services.providers import dedup_key
+from services.metrics import LIVE_EVENTS, LIVE_SCANS
+
+log = logging.getLogger(__name__)
+
+# How often a watched keyword/account is rescanned while someone is subscribed to it
+LIVE_SCAN_SECONDS = int(os.getenv("LIVE_SCAN_SECONDS", "120"))
+# Events buffered per connection; a client that falls further behind loses the oldest ones
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "32"))
+# Latest reels per topic replayed to a viewer who joins a scan that is already running
+LIVE_BACKLOG = 24
+# Topics one stream may watch, and open streams per user (each topic is a recurring upstream scan)
+LIVE_MAX_TOPICS = int(os.getenv("LIVE_MAX_TOPICS", "5"))
+LIVE_STREAMS_PER_USER = int(os.getenv("LIVE_STREAMS_PER_USER", "2"))
+# Reel keys remembered per topic to recognise already pushed reels
+LIVE_SEEN_MAX = 2000
+
+Topic = Tuple[str, str]  # (kind, name), e.g. ("radar", "fitness") or ("spy", "nike")
+ScanFn = Callable[[str], Awaitable[List[Dict[str, Any]]]]
+
+class LiveLimitError(Exception):
+    pass
+
+class BoundedSet:
+    """Set that forgets its oldest members beyond `maxsize`."""
+    def __init__(self, maxsize: int = LIVE_SEEN_MAX):
+        self._order: Deque[Hashable] = deque()
+        self._members: Set[Hashable] = set()
+        self.maxsize = maxsize
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._members
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def add(self, item: Hashable):
+        if item in self._members:
+            return
+        self._order.append(item)
+        self._members.add(item)
+        if len(self._order) > self.maxsize:
+            self._members.discard(self._order.popleft())
+
+class Subscription:
+    """One connection's bounded event queue. put() never blocks the scan that publishes."""
+    def __init__(self, topics: List[Topic], user: Any = None, maxsize: int = LIVE_QUEUE_SIZE):
+        self.topics = topics
+        self.user = user
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event: Dict[str, Any]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            LIVE_EVENTS.inc(result="dropped")
+        self.queue.put_nowait(event)
+        LIVE_EVENTS.inc(result="queued")
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None after `timeout` seconds without one (time for a heartbeat)."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class LiveHub:
+    """
+    Fans background scans out to connected viewers. Each topic (radar keyword or
+    spied account) has at most one scan loop, running only while it has
+    subscribers, so N viewers of the same keyword cost one upstream scan per
+    interval. Only reels not seen by earlier scans of the topic are pushed.
+
+    Scans are user work: each one takes an admission slot of one of the topic's
+    subscribers, a stream watches at most `max_topics` topics and a user keeps
+    at most `streams_per_user` streams open.
+    """
+    def __init__(self, scan_seconds: int = LIVE_SCAN_SECONDS, admission: Optional[AdmissionController] = None,
+                 max_topics: int = LIVE_MAX_TOPICS, streams_per_user: int = LIVE_STREAMS_PER_USER):
+        self.scan_seconds = scan_seconds
+        self.admission = admission
+        self.max_topics = max_topics
+        self.streams_per_user = streams_per_user
+        self._scanners: Dict[str, ScanFn] = {}
+        self._subscribers: Dict[Topic, Set[Subscription]] = {}
+        self._tasks: Dict[Topic, asyncio.Task] = {}
+        self._backlog: Dict[Topic, Deque[Dict[str, Any]]] = {}
+        self._streams: Dict[Any, int] = {}
+
+    def register(self, kind: str, scan_fn: ScanFn):
+        self._scanners[kind] = scan_fn
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    @property
+    def topic_count(self) -> int:
+        return len(self._tasks)
+
+    def subscribe(self, topics: List[Topic], user: Any = None) -> Subscription:
+        """Watch the first `max_topics` topics. Raises LiveLimitError when the user has too many streams open."""
+        for kind, _ in topics:
+            if kind not in self._scanners:
+                raise ValueError(f"Unknown live topic kind: {kind}")
+        user_id = getattr(user, "id", None)
+        if user_id is not None:
+            if self._streams.get(user_id, 0) >= self.streams_per_user:
+                raise LiveLimitError("Too many live streams open")
+            self._streams[user_id] = self._streams.get(user_id, 0) + 1
+        sub = Subscription(topics[:self.max_topics], user)
+        for topic in sub.topics:
+            self._subscribers.setdefault(topic, set()).add(sub)
+            backlog = self._backlog.get(topic)
+            if backlog:
+                sub.put({"kind": topic[0], "topic": topic[1], "reels": list(backlog)})
+            if topic not in self._tasks:
+                self._tasks[topic] = asyncio.create_task(self._scan_loop(topic))
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        user_id = getattr(sub.user, "id", None)
+        if user_id is not None and user_id in self._streams:
+            self._streams[user_id] -= 1
+            if not self._streams[user_id]:
+                del self._streams[user_id]
+        for topic in sub.topics:
+            subs = self._subscribers.get(topic)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                # Last viewer gone: stop scanning and forget what was seen
+                del self._subscribers[topic]
+                self._backlog.pop(topic, None)
+                task = self._tasks.pop(topic, None)
+                if task:
+                    task.cancel()
+
+    def publish(self, topic: Topic, reels: List[Dict[str, Any]]):
+        backlog = self._backlog.setdefault(topic, deque(maxlen=LIVE_BACKLOG))
+        backlog.extend(reels)
+        event = {"kind": topic[0], "topic": topic[1], "reels": reels}
+        for sub in list(self._subscribers.get(topic, ())):
+            sub.put(event)
+
+    async def _scan(self, topic: Topic) -> List[Dict[str, Any]]:
+        kind, name = topic
+        owner = next((sub.user for sub in self._subscribers.get(topic, ()) if sub.user is not None), None)
+        if self.admission is None or owner is None:
+            return await self._scanners[kind](name)
+        # Charged to a current subscriber, so live topics count against their upstream share
+        async with self.admission.slot(owner):
+            return await self._scanners[kind](name)
+
+    async def _scan_loop(self, topic: Topic):
+        kind, name = topic
+        seen = BoundedSet()
+        while True:
+            try:
+                reels = await self._scan(topic)
+                LIVE_SCANS.inc(kind=kind)
+            except Exception as e:
+                log.warning("Live scan failed", extra={"kind": kind, "topic": name, "error": str(e)})
+                reels = []
+            # A reel without a key can't be told apart from last scan's: not announced
+            fresh = [r for r in reels if dedup_key(r) and dedup_key(r) not in seen]
+            for r in fresh:
+                seen.add(dedup_key(r))
+            if fresh:
+                self.publish(topic, fresh)
+                log.info("Live scan found reels", extra={
+                    "kind": kind, "topic": name, "reels": len(fresh),
+                    "subscribers": len(self._subscribers.get(topic, ())),
+                })
+            await asyncio.sleep(self.scan_seconds)
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+# Global instance
+live_hub = LiveHub(admission=admission)
@@ -1,22 +1,303 @@
 import os
+import asyncio
+import logging
+import hashlib
+import ipaddress
+import shutil
+import socket
 import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+import requests
+
+log = logging.getLogger(__name__)
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "cache/media")
+# ffmpeg/yt-dlp are CPU and IO heavy: keep them off the web process and bounded
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+MAX_KEYFRAMES = 12
+FFMPEG_TIMEOUT = 120
+CHUNK_SIZE = 1024 * 1024
+# Reels are short: refuse anything bigger, and never process more than the first MEDIA_MAX_SECONDS
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_MB", "100")) * 1024 * 1024
+MEDIA_MAX_SECONDS = int(os.getenv("MEDIA_MAX_SECONDS", "180"))
+
+# URLs come from user input, so only Instagram pages and its CDNs are ever fetched (SSRF)
+ALLOWED_HOSTS = ("instagram.com",)
+ALLOWED_HOST_SUFFIXES = (".instagram.com", ".cdninstagram.com", ".fbcdn.net")
+
+_pool: Optional[ProcessPoolExecutor] = None
+# One speech model per worker process, loaded on first use
+_whisper = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS)
+    return _pool
 
 class MediaUtils:
+    """
+    Download -> audio + keyframes -> transcript pipeline for reels.
+
+    Everything is stored under MEDIA_CACHE_DIR/<sha256 of the video file>/, so the
+    same video is only ever processed once, whichever URL it was reached through.
+    MEDIA_CACHE_DIR/urls/ maps each URL (host + path, without the expiring CDN
+    signature) to its cached file, so repeat requests skip the download entirely.
+    `url` may be a direct media URL (streamed to disk in chunks) or a post/reel page
+    URL (resolved by yt-dlp). Since it comes from user input, only https URLs on
+    Instagram hosts that resolve to public addresses are fetched, within
+    MEDIA_MAX_BYTES. Local sample files go through import_file() instead.
+    """
+
+    @staticmethod
+    def check_url(url: str):
+        """Raise ValueError unless `url` is an https Instagram/CDN URL resolving only to public IPs."""
+        try:
+            parts = urlparse(url)
+            port = parts.port or 443
+        except ValueError:
+            raise ValueError(f"Unsupported media URL: {url[:100]}")
+        host = (parts.hostname or "").lower()
+        if parts.scheme != "https" or not (host in ALLOWED_HOSTS or host.endswith(ALLOWED_HOST_SUFFIXES)):
+            raise ValueError(f"Unsupported media URL: {url[:100]}")
+        try:
+            infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+        except OSError as e:
+            raise ValueError(f"Cannot resolve media host {host}: {e}")
+        for info in infos:
+            if not ipaddress.ip_address(info[4][0].split("%")[0]).is_global:
+                raise ValueError(f"Media host {host} resolves to a non-public address")
+
+    @staticmethod
+    def _index_path(url: str) -> str:
+        parts = urlparse(url)
+        identity = f"{parts.hostname}{parts.path}"
+        return os.path.join(MEDIA_CACHE_DIR, "urls", hashlib.sha256(identity.encode()).hexdigest())
+
+    @staticmethod
+    def _lookup(url: str) -> Optional[str]:
+        """Cached video path previously downloaded from this URL, if it is still on disk."""
+        try:
+            with open(MediaUtils._index_path(url), encoding="utf-8") as f:
+                path = os.path.join(MEDIA_CACHE_DIR, f.read().strip())
+        except OSError:
+            return None
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def _remember(url: str, video_path: str):
+        index = MediaUtils._index_path(url)
+        os.makedirs(os.path.dirname(index), exist_ok=True)
+        tmp = f"{index}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(os.path.relpath(video_path, MEDIA_CACHE_DIR))
+        os.replace(tmp, index)
+
     @staticmethod
-    def extract_audio(video_url: str) -> str:
+    def _sha256_file(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def _stream_download(url: str, dest: str) -> str:
+        """Stream a direct media URL to disk, never holding the whole file in memory."""
+        # Redirects are not followed: the target would bypass check_url()
+        with requests.get(url, stream=True, timeout=30, allow_redirects=False) as resp:
+            if resp.status_code != 200:
+                raise ValueError(f"Media download failed with HTTP {resp.status_code}")
+            if int(resp.headers.get("Content-Length") or 0) > MEDIA_MAX_BYTES:
+                raise ValueError("Media file exceeds MEDIA_MAX_BYTES")
+            written = 0
+            with open(dest, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                    written += len(chunk)
+                    if written > MEDIA_MAX_BYTES:
+                        raise ValueError("Media file exceeds MEDIA_MAX_BYTES")
+                    f.write(chunk)
+        return dest
+
+    @staticmethod
+    def _ytdlp_download(url: str, workdir: str) -> str:
+        import yt_dlp
+        from yt_dlp.utils import match_filter_func
+        opts = {
+            "outtmpl": os.path.join(workdir, "video.%(ext)s"),
+            "format": "mp4/best",
+            "quiet": True,
+            "noprogress": True,
+            "max_filesize": MEDIA_MAX_BYTES,
+            "match_filter": match_filter_func(f"!duration | duration <= {MEDIA_MAX_SECONDS}"),
+        }
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            path = ydl.prepare_filename(info)
+        if not os.path.exists(path):
+            raise ValueError("Video was skipped: too long or too large")
+        return path
+
+    @staticmethod
+    def _store(tmp: str) -> str:
+        """Move a downloaded file into its content-addressed directory and return the cached path."""
+        digest = MediaUtils._sha256_file(tmp)
+        target_dir = os.path.join(MEDIA_CACHE_DIR, digest)
+        target = os.path.join(target_dir, os.path.basename(tmp))
+        if not os.path.exists(target):
+            os.makedirs(target_dir, exist_ok=True)
+            os.replace(tmp, target)
+        return target
+
+    @staticmethod
+    def import_file(path: str) -> str:
+        """Copy a local video (e.g. a test sample) into the cache. Never called with user input."""
+        digest = MediaUtils._sha256_file(path)
+        target_dir = os.path.join(MEDIA_CACHE_DIR, digest)
+        target = os.path.join(target_dir, "video" + (os.path.splitext(path)[1] or ".mp4"))
+        if not os.path.exists(target):
+            os.makedirs(target_dir, exist_ok=True)
+            shutil.copyfile(path, target)
+        return target
+
+    @staticmethod
+    def download(url: str) -> str:
         """
-        Placeholder for logic that would download video and extract audio.
-        In a real app, this would use yt-dlp and ffmpeg.
+        Fetch an allowed `url` into the content-addressed cache and return the cached video path.
+        Raises ValueError for anything else (local paths, other schemes or hosts, private
+        addresses, oversized or overlong videos).
         """
-        # For the MVP, we assume we return a path to a dummy audio file
-        # or we rely on Gemini's multimodal ability if we were to pass the video URL.
-        # Since we are in a sandbox, we will return None and let the AI agent 
-        # use metadata or mock transcription.
-        return None
+        cached = MediaUtils._lookup(url)
+        if cached:
+            return cached
+        MediaUtils.check_url(url)
+        os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+        workdir = tempfile.mkdtemp(dir=MEDIA_CACHE_DIR, prefix="dl-")
+        try:
+            path = urlparse(url).path.lower()
+            if path.endswith((".mp4", ".mov", ".m4v", ".webm")):
+                tmp = MediaUtils._stream_download(url, os.path.join(workdir, "video" + os.path.splitext(path)[1]))
+            else:
+                tmp = MediaUtils._ytdlp_download(url, workdir)
+            video_path = MediaUtils._store(tmp)
+            MediaUtils._remember(url, video_path)
+            return video_path
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
 
     @staticmethod
-    def transcribe_audio(audio_path: str) -> str:
+    def _run_ffmpeg(args: List[str]) -> bool:
+        try:
+            subprocess.run(["ffmpeg", "-y", "-v", "error", *args], check=True, timeout=FFMPEG_TIMEOUT,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            return True
+        except (OSError, subprocess.SubprocessError) as e:
+            log.warning("ffmpeg failed", extra={"error": str(e)})
+            return False
+
+    @staticmethod
+    def extract_audio(video_path: str) -> Optional[str]:
         """
-        Placeholder for Whisper or other transcription services.
+        Extract a 16 kHz mono WAV track (the input format speech models expect).
+        Returns the audio path, or None if ffmpeg is unavailable or the video has no audio.
         """
-        return "This is a placeholder transcript for the video content."
+        audio_path = os.path.join(os.path.dirname(video_path), "audio.wav")
+        if os.path.exists(audio_path):
+            return audio_path
+        # Written under a private name and renamed when complete: a crashed or concurrent
+        # run never leaves a partial audio.wav that later calls would take as done
+        tmp = f"{audio_path}.{os.getpid()}.tmp.wav"
+        try:
+            ok = MediaUtils._run_ffmpeg(["-i", video_path, "-t", str(MEDIA_MAX_SECONDS), "-vn", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", tmp])
+            if not ok or not os.path.exists(tmp):
+                return None
+            os.replace(tmp, audio_path)
+            return audio_path
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @staticmethod
+    def extract_keyframes(video_path: str, max_frames: int = MAX_KEYFRAMES) -> List[str]:
+        """Decode only keyframes (I-frames) and save up to max_frames downscaled JPEGs."""
+        frames_dir = os.path.join(os.path.dirname(video_path), "frames")
+        if os.path.isdir(frames_dir):
+            frames = sorted(os.path.join(frames_dir, f) for f in os.listdir(frames_dir))
+            if frames:
+                return frames
+        # Extracted into a private directory that is renamed into place once ffmpeg has finished
+        workdir = tempfile.mkdtemp(dir=os.path.dirname(video_path), prefix="frames-")
+        try:
+            ok = MediaUtils._run_ffmpeg([
+                "-skip_frame", "nokey", "-i", video_path, "-t", str(MEDIA_MAX_SECONDS), "-vsync", "vfr",
+                "-vf", "scale=480:-2", "-frames:v", str(max_frames), "-q:v", "4",
+                os.path.join(workdir, "%03d.jpg"),
+            ])
+            if not ok or not os.listdir(workdir):
+                return []
+            try:
+                os.rename(workdir, frames_dir)  # Also replaces an empty leftover directory
+            except OSError:
+                if not os.path.isdir(frames_dir):
+                    raise
+                # Another run finished first: keep its frames
+            return sorted(os.path.join(frames_dir, f) for f in os.listdir(frames_dir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    @staticmethod
+    def transcribe_audio(audio_path: Optional[str]) -> str:
+        """
+        Transcribe with faster-whisper when it is installed; otherwise return an empty
+        transcript so callers fall back to the caption. Cached next to the audio file.
+        """
+        if not audio_path:
+            return ""
+        transcript_path = os.path.join(os.path.dirname(audio_path), "transcript.txt")
+        if os.path.exists(transcript_path):
+            with open(transcript_path, encoding="utf-8") as f:
+                return f.read()
+        model = MediaUtils._speech_model()
+        if model is None:
+            return ""
+        segments, _ = model.transcribe(audio_path)
+        text = " ".join(s.text.strip() for s in segments)
+        tmp = f"{transcript_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, transcript_path)
+        return text
+
+    @staticmethod
+    def _speech_model():
+        """The faster-whisper model of this worker process (loaded once), or None when it is not installed."""
+        global _whisper
+        if _whisper is None:
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError:
+                return None
+            _whisper = WhisperModel(os.getenv("WHISPER_MODEL", "base"), device="cpu", compute_type="int8")
+        return _whisper
+
+    @staticmethod
+    def process(url: str) -> Dict[str, Any]:
+        """Full pipeline, synchronous. Runs inside a worker process via process_async()."""
+        video_path = MediaUtils.download(url)
+        audio_path = MediaUtils.extract_audio(video_path)
+        return {
+            "sha256": os.path.basename(os.path.dirname(video_path)),
+            "video_path": video_path,
+            "audio_path": audio_path,
+            "keyframes": MediaUtils.extract_keyframes(video_path),
+            "transcript": MediaUtils.transcribe_audio(audio_path),
+        }
+
+    @staticmethod
+    async def process_async(url: str) -> Dict[str, Any]:
+        """Run the pipeline in the bounded process pool without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_pool(), MediaUtils.process, url)
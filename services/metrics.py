@@ -0,0 +1,219 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Set METRICS_ENABLED=0 to turn every inc/observe into an immediate return
+ENABLED = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+# Optional bearer token for scraping /metrics without an admin session
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Seconds; covers cache lookups (sub-ms) up to slow upstream calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def items(self) -> List[Tuple[LabelKey, float]]:
+        """Sorted copy of all series, safe against worker threads adding label sets meanwhile."""
+        with self._lock:
+            return sorted(self._values.items())
+
+    def value(self, **labels) -> float:
+        """Sum over all series matching the given labels."""
+        return sum(v for k, v in self.items()
+                   if all(k[self.labelnames.index(n)] == str(lv) for n, lv in labels.items()))
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in self.items()]
+
+class Gauge:
+    """Value read from a callback at scrape time (queue depth, cache size...)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name, self.help, self.labelnames = name, help, ()
+        self._fn = fn
+
+    def value(self) -> float:
+        try:
+            return float(self._fn())
+        except Exception:
+            return float("nan")
+
+    def render(self) -> List[str]:
+        return [f"{self.name} {self.value()}"]
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), count, sum]
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not ENABLED:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        if not ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def items(self) -> List[Tuple[LabelKey, list]]:
+        """Sorted copy of all series (bucket lists included), taken under the lock."""
+        with self._lock:
+            return sorted((k, [list(c), n, s]) for k, (c, n, s) in self._series.items())
+
+    def totals(self) -> Tuple[List[int], int, float]:
+        """Bucket counts, count and sum aggregated over all label sets."""
+        counts, n, total = [0] * (len(self.buckets) + 1), 0, 0.0
+        for _, (c, cnt, s) in self.items():
+            counts = [a + b for a, b in zip(counts, c)]
+            n += cnt
+            total += s
+        return counts, n, total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile over all label sets by interpolating inside the bucket."""
+        counts, n, _ = self.totals()
+        if not n:
+            return None
+        rank, seen = q * n, 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, n, total) in self.items():
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {n}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        # Re-registering (e.g. module reload) returns the existing metric
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, help, fn))
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for m in list(self._metrics.values()):
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[Dict[str, object]]:
+        """Compact rows for the admin panel: histograms aggregated over labels, counters per label set."""
+        rows = []
+        for m in list(self._metrics.values()):
+            if isinstance(m, Histogram):
+                _, n, total = m.totals()
+                if not n:
+                    continue
+                rows.append({"name": m.name, "labels": "", "count": n,
+                             "avg_ms": round(total / n * 1000, 1),
+                             "p95_ms": round((m.quantile(0.95) or 0) * 1000, 1)})
+            elif isinstance(m, Counter):
+                for key, v in m.items():
+                    rows.append({"name": m.name, "labels": ", ".join(f"{n}={lv}" for n, lv in zip(m.labelnames, key)),
+                                 "count": int(v), "avg_ms": None, "p95_ms": None})
+            else:
+                rows.append({"name": m.name, "labels": "", "count": m.value(), "avg_ms": None, "p95_ms": None})
+        return rows
+
+# Global instance
+registry = MetricsRegistry()
+
+# Hot-path metrics shared across services
+CACHE_REQUESTS = registry.counter("nocta_cache_requests_total", "In-process cache lookups", ("cache", "result"))
+RAPIDAPI_LATENCY = registry.histogram("nocta_rapidapi_request_seconds", "RapidAPI reels request latency per seed account", ("account",))
+RAPIDAPI_RESPONSES = registry.counter("nocta_rapidapi_responses_total", "RapidAPI responses by status", ("status",))
+DB_QUERY_LATENCY = registry.histogram("nocta_db_query_seconds", "SQL statement execution time", ("op",))
+DB_SESSIONS = registry.counter("nocta_db_sessions_total", "Request-scoped DB sessions opened")
+TEMPLATE_RENDER = registry.histogram("nocta_template_render_seconds", "Jinja template render time", ("template",))
+AI_REQUESTS = registry.counter("nocta_ai_requests_total", "Video analysis requests by outcome", ("result",))
+AI_LATENCY = registry.histogram("nocta_ai_generate_seconds", "Gemini generate_content latency")
+LIVE_EVENTS = registry.counter("nocta_live_events_total", "Server-push events per connection queue", ("result",))
+LIVE_SCANS = registry.counter("nocta_live_scans_total", "Background radar/spy scans shared by live subscribers", ("kind",))
+UPSTREAM_ADMISSIONS = registry.counter("nocta_upstream_admissions_total", "Upstream fan-out admission decisions", ("result",))
+UPSTREAM_QUEUE_WAIT = registry.histogram("nocta_upstream_queue_wait_seconds", "Time a request waited for an upstream slot")
+LOOP_LAG = registry.histogram("nocta_event_loop_lag_seconds", "Event loop scheduling delay",
+                              buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Measure how late a sleep(interval) wakes up: time the loop was busy with other work."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
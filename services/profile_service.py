@@ -1,33 +1,196 @@
 import os
-from dotenv import load_dotenv
+import time
+import asyncio
+import statistics
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 from services.social_api import SocialAPIWrapper
 from services.ai_agent import AIAgent
+from services import rapidapi_service
+from services.cache import LRUCache
 
-load_dotenv()
+# How many reels pages (~12 reels each) to walk on the first scan of an account
+PROFILE_MAX_PAGES = int(os.getenv("PROFILE_MAX_PAGES", "10"))
+# How long a cached account history is served before checking for new reels
+PROFILE_REFRESH_SECONDS = int(os.getenv("PROFILE_REFRESH_SECONDS", "900"))
+PROFILE_MAX_REELS = 1000
+# Accounts whose history is kept (least recently scanned ones are dropped first)
+PROFILE_CACHE_ACCOUNTS = int(os.getenv("PROFILE_CACHE_ACCOUNTS", "200"))
+# Total time a scan may spend paging; it keeps the pages it got by then
+PROFILE_SCAN_SECONDS = float(os.getenv("PROFILE_SCAN_SECONDS", "20"))
+
+ER_BUCKETS = [(0, 1), (1, 3), (3, 5), (5, 10), (10, None)]
+
+def _pk(reel: Dict[str, Any]) -> int:
+    try:
+        return int(str(reel.get("platform_id", "")).split("_")[0])
+    except ValueError:
+        return 0
+
+def compute_profile_stats(reels: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate stats for a reel history in a single pass (plus one sort for the median)."""
+    total_views = total_likes = total_comments = 0
+    er_sum = 0.0
+    er_dist = [0] * len(ER_BUCKETS)
+    views, timestamps = [], []
+
+    for r in reels:
+        v = r.get("views", 0) or 0
+        er = r.get("engagement_rate", 0) or 0
+        total_views += v
+        total_likes += r.get("likes", 0) or 0
+        total_comments += r.get("comments", 0) or 0
+        er_sum += er
+        views.append(v)
+        for i, (lo, hi) in enumerate(ER_BUCKETS):
+            if er >= lo and (hi is None or er < hi):
+                er_dist[i] += 1
+                break
+        if r.get("published_at"):
+            try:
+                timestamps.append(datetime.fromisoformat(r["published_at"]).timestamp())
+            except ValueError:
+                pass
+
+    n = len(reels)
+    cadence_days = None
+    posts_per_week = None
+    if len(timestamps) >= 2:
+        timestamps.sort()
+        gaps = [b - a for a, b in zip(timestamps, timestamps[1:])]
+        cadence_days = round(statistics.median(gaps) / 86400, 1)
+        span_weeks = max((timestamps[-1] - timestamps[0]) / (7 * 86400), 1 / 7)
+        posts_per_week = round(len(timestamps) / span_weeks, 1)
+
+    return {
+        "video_count": n,
+        "total_views": total_views,
+        "total_likes": total_likes,
+        "total_comments": total_comments,
+        "avg_views": round(total_views / n) if n else 0,
+        "median_views": int(statistics.median(views)) if views else 0,
+        "avg_er": round(er_sum / n, 2) if n else 0,
+        "er_distribution": [
+            {"label": f"{lo}–{hi}%" if hi is not None else f"{lo}%+", "count": c}
+            for (lo, hi), c in zip(ER_BUCKETS, er_dist)
+        ],
+        "cadence_days": cadence_days,
+        "posts_per_week": posts_per_week,
+    }
+
+class ProfileFetchError(Exception):
+    """The account's reels could not be fetched and there is no earlier history to fall back on."""
 
 class ProfileService:
-    def __init__(self):
+    def __init__(self, ai_agent: AIAgent = None):
         self.social_api = SocialAPIWrapper()
-        self.ai_agent = AIAgent()
+        # Share the app's agent so reports reuse its analysis cache and concurrency limit
+        self.ai_agent = ai_agent or AIAgent()
+        # username -> {"reels": [...newest first], "newest_pk": int, "checked_at": float}
+        self._history = LRUCache(maxsize=PROFILE_CACHE_ACCOUNTS, name="profile_history")
+        # username -> (lock, scans holding or awaiting it); dropped when the last one is done
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def _lock(self, username: str) -> asyncio.Lock:
+        lock, users = self._locks.get(username) or (asyncio.Lock(), 0)
+        self._locks[username] = (lock, users + 1)
+        return lock
+
+    def _unlock(self, username: str):
+        lock, users = self._locks[username]
+        if users <= 1:
+            del self._locks[username]
+        else:
+            self._locks[username] = (lock, users - 1)
+
+    async def get_reels(self, username: str, max_pages: int = PROFILE_MAX_PAGES) -> List[Dict[str, Any]]:
+        """
+        Full reel history of an account, paging through the API via maxId.
+        The history is cached per account; refreshes only walk pages until they reach
+        the newest reel seen last time, so a re-scan usually costs a single request.
+        Paging stops after PROFILE_SCAN_SECONDS. A failed refresh serves the cached
+        history; a failed first scan raises ProfileFetchError and caches nothing.
+        """
+        username = username.replace("@", "").strip().lower()
+        entry = self._history.get(username)
+        if entry and time.time() - entry["checked_at"] < PROFILE_REFRESH_SECONDS:
+            return entry["reels"]
+
+        lock = self._lock(username)
+        try:
+            async with lock:
+                return await self._scan(username, max_pages)
+        finally:
+            self._unlock(username)
+
+    async def _scan(self, username: str, max_pages: int) -> List[Dict[str, Any]]:
+        entry = self._history.get(username)
+        if entry and time.time() - entry["checked_at"] < PROFILE_REFRESH_SECONDS:
+            return entry["reels"]
+
+        newest_pk = entry["newest_pk"] if entry else 0
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PROFILE_SCAN_SECONDS
+        fresh: List[Dict[str, Any]] = []
+        max_id = ""
+        for n in range(max_pages):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                page, max_id = await asyncio.wait_for(loop.run_in_executor(
+                    rapidapi_service.account_executor, rapidapi_service.fetch_reels_page, username, max_id, None
+                ), remaining)
+            except (rapidapi_service.RapidAPIError, asyncio.TimeoutError) as e:
+                if n:
+                    break  # Keep the pages fetched so far
+                if entry:
+                    return entry["reels"]  # Stale but real; checked_at is left as is, so the next request retries
+                raise ProfileFetchError(f"Could not fetch reels of @{username}") from e
+            if not page:
+                break
+            fresh.extend(r for r in page if _pk(r) > newest_pk)
+            # Pinned reels sit at the top of page 1, so judge by the page's last item
+            if not max_id or (newest_pk and _pk(page[-1]) <= newest_pk):
+                break
+
+        seen = set()
+        merged = []
+        for r in fresh + (entry["reels"] if entry else []):
+            if r["platform_id"] in seen:
+                continue
+            seen.add(r["platform_id"])
+            merged.append(r)
+        merged.sort(key=_pk, reverse=True)
+        merged = merged[:PROFILE_MAX_REELS]
+
+        self._history.set(username, {
+            "reels": merged,
+            "newest_pk": max([newest_pk] + [_pk(r) for r in fresh]),
+            "checked_at": time.time(),
+        })
+        return merged
+
+    async def get_profile(self, username: str) -> Dict[str, Any]:
+        reels = await self.get_reels(username)
+        return {"username": username, "videos": reels, **compute_profile_stats(reels)}
 
     async def generate_growth_report(self, username: str, platform: str) -> dict:
         """
-        Fetch last N videos for a profile and generate a Gemini growth report.
+        Fetch the account's reel history and generate a Gemini growth report.
         """
-        # In a real app, we'd have a specific profile fetch endpoint
-        # Here we simulate by searching for the username
-        results = await self.social_api.search_trends(username)
-        
-        # Aggregate stats
-        total_views = sum(v['views'] for v in results)
-        avg_er = sum(v['engagement_rate'] for v in results) / len(results) if results else 0
+        reels = await self.get_reels(username)
+        stats = compute_profile_stats(reels)
         
         summary_data = {
             "username": username,
             "platform": platform,
-            "total_videos_analyzed": len(results),
-            "total_views": total_views,
-            "avg_engagement_rate": round(avg_er, 2)
+            "total_videos_analyzed": stats["video_count"],
+            "total_views": stats["total_views"],
+            "median_views": stats["median_views"],
+            "avg_engagement_rate": stats["avg_er"],
+            "er_distribution": stats["er_distribution"],
+            "posts_per_week": stats["posts_per_week"],
         }
         
         # Ask Gemini to analyze the pattern
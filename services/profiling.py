@@ -0,0 +1,159 @@
+import cProfile
+import heapq
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+from sqlmodel import Session
+from starlette.requests import Request
+from core.database import engine
+from models.database import User
+from services import auth
+
+# Share of /api requests that get a stage breakdown (0 = only explicit ?profile=1)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# How many of the slowest traces the admin page keeps
+PROFILE_SLOWEST_N = int(os.getenv("PROFILE_SLOWEST_N", "20"))
+PROFILE_TOP_FUNCTIONS = 40
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("profiling_trace", default=None)
+# cProfile hooks the whole interpreter, so only one request is profiled at a time
+_cprofile_lock = threading.Lock()
+
+class Trace:
+    def __init__(self, method: str, path: str, query: str, explicit: bool):
+        self.method, self.path, self.query = method, path, query
+        self.explicit = explicit
+        self.started_at = datetime.now()
+        self.status = 0
+        self.total_ms = 0.0
+        self.stages: List[Dict[str, Any]] = []
+        self.profile_text = ""
+
+    def add_stage(self, name: str, ms: float):
+        self.stages.append({"name": name, "ms": round(ms, 1)})
+
+    def server_timing(self) -> str:
+        parts = [f'{s["name"].replace(":", "-")};dur={s["ms"]}' for s in self.stages]
+        return ", ".join(parts)
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the current traced request (no-op when not tracing)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, (time.perf_counter() - start) * 1000)
+
+class TraceStore:
+    """Keeps the N slowest traces plus the N most recent explicitly profiled ones."""
+    def __init__(self, size: int = PROFILE_SLOWEST_N):
+        self.size = size
+        self._heap: List[tuple] = []
+        self._explicit: deque = deque(maxlen=size)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            if trace.explicit:
+                self._explicit.appendleft(trace)
+            item = (trace.total_ms, next(self._seq), trace)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            elif trace.total_ms > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def slowest(self) -> List[Trace]:
+        with self._lock:
+            return [t for _, _, t in sorted(self._heap, key=lambda i: i[0], reverse=True)]
+
+    def explicit(self) -> List[Trace]:
+        with self._lock:
+            return list(self._explicit)
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+            self._explicit.clear()
+
+def _format_profile(profiler: cProfile.Profile) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    return out.getvalue()
+
+def _is_admin(scope) -> bool:
+    user_id = auth.get_current_user_id(Request(scope))
+    if not user_id:
+        return False
+    with Session(engine) as session:
+        user = session.get(User, user_id)
+        return bool(user and user.role == "admin")
+
+class ProfilingMiddleware:
+    """
+    Opt-in request profiling for /api endpoints.
+
+    A PROFILE_SAMPLE_RATE share of requests record per-stage timings (see stage()).
+    Admins can add ?profile=1 to any request to also run cProfile over it. The
+    breakdown is returned in a Server-Timing header and traces are kept in
+    trace_store for the admin page.
+    """
+    def __init__(self, app, store: "TraceStore" = None):
+        self.app = app
+        self.store = store or trace_store
+
+    async def __call__(self, scope, receive, send):
+        # Event streams stay open for minutes and would flood the slow-request list
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or scope["path"].startswith("/api/live/"):
+            await self.app(scope, receive, send)
+            return
+        query = scope.get("query_string", b"").decode("latin-1")
+        explicit = "profile=1" in query and parse_qs(query).get("profile") == ["1"] and _is_admin(scope)
+        if not explicit and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"], query, explicit)
+        token = _current.set(trace)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                elapsed = (time.perf_counter() - start) * 1000
+                timing = ", ".join(filter(None, [trace.server_timing(), f"app;dur={elapsed:.1f}"]))
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        profiler = cProfile.Profile() if explicit and _cprofile_lock.acquire(blocking=False) else None
+        if profiler:
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if profiler:
+                profiler.disable()
+                _cprofile_lock.release()
+                # Async: other requests running concurrently show up in this profile too
+                trace.profile_text = _format_profile(profiler)
+            trace.total_ms = round((time.perf_counter() - start) * 1000, 1)
+            _current.reset(token)
+            self.store.add(trace)
+
+# Global instance
+trace_store = TraceStore()
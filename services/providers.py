@@ -0,0 +1,184 @@
+import os
+import re
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from sqlmodel import Session, select, or_
+from core.database import engine
+from models.database import Video
+from services import rapidapi_service
+from services.rapidapi_service import SearchResults
+from services.query_normalize import filter_terms
+from services.profiling import stage
+
+log = logging.getLogger(__name__)
+
+# Comma-separated list of enabled sources, queried concurrently for every search. localdb is
+# opt-in: the Video table is only filled by the radar monitor, which is not started by default
+SEARCH_PROVIDERS = [p.strip() for p in os.getenv("SEARCH_PROVIDERS", "rapidapi").split(",") if p.strip()]
+
+_SHORTCODE_RE = re.compile(r"instagram\.com/(?:reel|reels|p|tv)/([A-Za-z0-9_-]+)")
+
+# Canonical record shape shared by every provider
+REEL_DEFAULTS = {
+    "platform_id": "",
+    "platform": "instagram",
+    "title": "",
+    "author": "",
+    "views": 0,
+    "likes": 0,
+    "comments": 0,
+    "engagement_rate": 0.0,
+    "thumbnail_url": "",
+    "video_url": "",
+    "published_at": "",
+    "transcript": "",
+}
+
+def normalize_reel(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill missing fields with defaults and coerce numeric fields, so every source looks the same."""
+    reel = {**REEL_DEFAULTS, **{k: v for k, v in raw.items() if v is not None}}
+    for k in ("views", "likes", "comments"):
+        try:
+            reel[k] = int(reel[k] or 0)
+        except (TypeError, ValueError):
+            reel[k] = 0
+    if not reel["engagement_rate"] and reel["views"]:
+        reel["engagement_rate"] = round((reel["likes"] + reel["comments"]) / reel["views"] * 100, 2)
+    reel["platform_id"] = str(reel["platform_id"])
+    return reel
+
+def dedup_key(reel: Dict[str, Any]) -> str:
+    """
+    Shortcode when the URL has one (stable across sources), else the media pk.
+    "" when the reel has neither: callers must not merge such reels with each other
+    (their video_url is often just the author's profile page).
+    """
+    m = _SHORTCODE_RE.search(reel.get("video_url") or "")
+    if m:
+        return m.group(1)
+    return str(reel.get("platform_id", "") or "").split("_")[0]
+
+def sort_reels(reels: List[Dict[str, Any]], sort_by: str):
+    if sort_by == "views":
+        reels.sort(key=lambda x: x["views"], reverse=True)
+    elif sort_by == "er":
+        reels.sort(key=lambda x: x["engagement_rate"], reverse=True)
+    elif sort_by == "likes":
+        reels.sort(key=lambda x: x["likes"], reverse=True)
+    elif sort_by == "recent":
+        reels.sort(key=lambda x: x["published_at"] or "", reverse=True)
+
+class ReelsProvider:
+    """A source of reels for a keyword query. Subclasses implement search()."""
+    name = "base"
+    # Seconds the fan-out waits for this provider before dropping it
+    deadline = 15.0
+    # The fan-out never returns early while a primary provider is still running
+    primary = False
+
+    async def search(self, query: str, days: Optional[int], sort_by: str, count: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+class RapidAPIProvider(ReelsProvider):
+    """Seed-account fan-out over the instagram120 RapidAPI (fast, the primary source)."""
+    name = "rapidapi"
+    deadline = 15.0
+    primary = True
+
+    async def search(self, query, days, sort_by, count):
+        return await rapidapi_service.search_reels_by_keyword_async(query, count=count, timeframe_days=days, sort_by=sort_by)
+
+class ApifyProvider(ReelsProvider):
+    """Apify hashtag scraper: accurate but slow, so it only contributes if it beats its deadline."""
+    name = "apify"
+    deadline = 60.0
+
+    async def search(self, query, days, sort_by, count):
+        from services.instagram_service import instagram_service
+        loop = asyncio.get_running_loop()
+        hashtag = query.split()[0] if query.split() else query
+        items = await loop.run_in_executor(None, instagram_service.search_by_hashtag, hashtag, count, days, sort_by)
+        # Strip any "_<owner>" suffix so ids match the other sources; missing comments are filled by normalize_reel
+        return [{**r, "platform_id": str(r.get("platform_id", "")).split("_")[0]} for r in items]
+
+class LocalDBProvider(ReelsProvider):
+    """Reels already stored in the Video table (e.g. radar finds). Always available, never throttled."""
+    name = "localdb"
+    deadline = 2.0
+
+    def _query(self, query: str, count: int) -> List[Dict[str, Any]]:
+        words = sorted(filter_terms(query))
+        if not words:
+            return []
+        with Session(engine) as session:
+            conditions = [or_(Video.title.ilike(f"%{w}%"), Video.author.ilike(f"%{w}%")) for w in words]
+            rows = session.exec(select(Video).where(or_(*conditions)).order_by(Video.views.desc()).limit(count)).all()
+            return [{
+                "platform_id": r.platform_id, "platform": r.platform, "title": r.title or "",
+                "author": r.author, "views": r.views, "likes": r.likes, "comments": r.comments,
+                "engagement_rate": r.engagement_rate, "thumbnail_url": r.thumbnail_url,
+                "video_url": r.video_url, "published_at": "", "transcript": r.title or "",
+            } for r in rows]
+
+    async def search(self, query, days, sort_by, count):
+        if days:
+            return [] # No publish dates stored locally, so timeframe filters can't be honoured
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._query, query, count)
+
+PROVIDER_CLASSES = {cls.name: cls for cls in (RapidAPIProvider, ApifyProvider, LocalDBProvider)}
+
+def get_providers(names: List[str] = None) -> List[ReelsProvider]:
+    return [PROVIDER_CLASSES[n]() for n in (names or SEARCH_PROVIDERS) if n in PROVIDER_CLASSES]
+
+async def fan_out_search(
+    providers: List[ReelsProvider], query: str, days: Optional[int] = None, sort_by: str = "views", count: int = 100
+) -> SearchResults:
+    """
+    Query all providers concurrently, each bounded by its own deadline, then merge.
+    Once every primary provider has answered and enough unique reels have arrived, the
+    secondary ones still running are cancelled: a secondary source may add to the primary
+    one but never cut it short. A throttled or failing source just contributes nothing.
+    The result is marked partial when a provider timed out, failed or was itself cut
+    short and there are fewer than `count` reels.
+    """
+    cut_short = False
+
+    async def run(p: ReelsProvider):
+        nonlocal cut_short
+        try:
+            with stage(f"provider:{p.name}"):
+                reels = await asyncio.wait_for(p.search(query, days, sort_by, count), timeout=p.deadline)
+            cut_short = cut_short or getattr(reels, "partial", False)
+            return reels
+        except asyncio.TimeoutError:
+            log.warning("Search provider missed its deadline", extra={"provider": p.name, "deadline_s": p.deadline})
+        except Exception as e:
+            log.warning("Search provider failed", extra={"provider": p.name, "error": str(e)})
+        cut_short = True
+        return []
+
+    merged: Dict[Any, Dict[str, Any]] = {}
+    tasks = {asyncio.ensure_future(run(p)): p for p in providers}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for raw in task.result():
+                    reel = normalize_reel(raw)
+                    # Reels without a key can't be matched across sources: keep each one
+                    key = dedup_key(reel) or ("unkeyed", len(merged))
+                    # On duplicates keep the record with the freshest (highest) metrics
+                    if key not in merged or reel["views"] > merged[key]["views"]:
+                        merged[key] = reel
+            if len(merged) >= count and not any(tasks[t].primary for t in pending):
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+
+    results = list(merged.values())
+    sort_reels(results, sort_by)
+    return SearchResults(results[:count], partial=cut_short and len(results) < count)
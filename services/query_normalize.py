@@ -0,0 +1,103 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Set
+
+# Spellings of the same query that should share one cache entry and one
+# fan-out (translations of niche names typed into the Russian UI, mostly).
+SYNONYMS = {
+    "technology": "tech", "videogames": "gaming",
+    "фитнес": "fitness", "зал": "gym",
+    "путешествия": "travel", "путешествие": "travel",
+    "еда": "food", "кулинария": "cooking",
+    "мода": "fashion", "стиль": "style", "люкс": "luxury", "роскошь": "luxury",
+    "бизнес": "business", "маркетинг": "marketing", "финансы": "finance",
+    "мотивация": "motivation", "технологии": "tech", "игры": "gaming",
+    "крипта": "crypto", "криптовалюта": "crypto", "природа": "nature",
+    "искусство": "art", "дизайн": "design", "анимация": "animation",
+}
+
+# Canonical token -> its other spellings ("fitness" -> ["фитнес"])
+SPELLINGS: Dict[str, List[str]] = {}
+for _alias, _token in SYNONYMS.items():
+    SPELLINGS.setdefault(_token, []).append(_alias)
+
+# Related words that pick a niche's seed accounts but stay distinct queries
+# (their keyword post-filter differs), so they are not canonicalized.
+NICHE_ALIASES = {
+    "gadgets": "tech", "workout": "fitness", "workouts": "fitness", "спорт": "fitness",
+    "recipe": "cooking", "recipes": "cooking", "рецепты": "cooking", "games": "gaming",
+    "cars": "luxury", "supercars": "luxury", "outfit": "fashion", "outfits": "fashion",
+    "entrepreneur": "business", "startup": "business", "cgi": "3d",
+}
+
+_SEPARATORS = re.compile(r"[\s,;#]+")
+_EDGE_PUNCTUATION = ".!?\"'«»()[]"
+
+def _raw_tokens(query: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", query or "").casefold()
+    tokens = (raw.strip(_EDGE_PUNCTUATION) for raw in _SEPARATORS.split(text))
+    return [t for t in tokens if t]
+
+def query_tokens(query: str) -> List[str]:
+    """Case-folded tokens of a query, with hashtags and surrounding punctuation stripped and synonyms applied."""
+    return [SYNONYMS.get(t, t) for t in _raw_tokens(query)]
+
+def filter_terms(query: str) -> Set[str]:
+    """
+    Words that make a reel's caption or author match `query`: the typed tokens,
+    their canonical forms and every other spelling of those. Variants of a query
+    ("фитнес", "fitness") get the same set, so they can share one result pool.
+    """
+    terms: Set[str] = set()
+    for raw in _raw_tokens(query):
+        token = SYNONYMS.get(raw, raw)
+        terms.update((raw, token), SPELLINGS.get(token, ()))
+    return terms
+
+def canonical_query(query: str) -> str:
+    """
+    One spelling per query, for cache keys: "Fitness", "#fitness ", "фитнес"
+    and "gym Fitness" vs "fitness gym" collapse to the same string.
+    """
+    return " ".join(sorted(set(query_tokens(query))))
+
+class NicheMatcher:
+    """
+    Maps query tokens to seed-account niches. Built once from the niche table:
+    whole tokens and typed prefixes ("fit", "fitn") resolve with a dict lookup,
+    and compound tokens ("fitnessmotivation") with one precompiled alternation.
+    """
+    def __init__(self, niches: Dict[str, List[str]], aliases: Dict[str, str] = None, default: str = "default",
+                 min_prefix: int = 3, min_compound: int = 4):
+        self.default = default
+        self._accounts = {key: list(dict.fromkeys(accs)) for key, accs in niches.items()}
+        keys = [k for k in niches if k != default]
+        self._index: Dict[str, List[str]] = {}
+        for key in keys:
+            for n in range(min(min_prefix, len(key)), len(key) + 1):
+                self._index.setdefault(key[:n], []).append(key)
+        for alias, key in (NICHE_ALIASES if aliases is None else aliases).items():
+            if key in self._accounts:
+                self._index[alias] = [key]
+        # Short keys ("ai", "3d", "art") only match whole tokens, not inside words like "chair" or "party"
+        compound = sorted((k for k in keys if len(k) >= min_compound), key=len, reverse=True)
+        self._compound = re.compile("|".join(map(re.escape, compound))) if compound else None
+
+    def match(self, query: str) -> List[str]:
+        """Matched niches in query order (the default niche when nothing matches)."""
+        niches: List[str] = []
+        for token in query_tokens(query):
+            hits = self._index.get(token)
+            if hits is None and self._compound is not None:
+                hits = self._compound.findall(token)
+            for niche in hits or ():
+                if niche not in niches:
+                    niches.append(niche)
+        return niches or [self.default]
+
+    def accounts(self, niches: Iterable[str]) -> List[str]:
+        """Seed accounts of the given niches, de-duplicated, in niche order."""
+        merged: Dict[str, None] = {}
+        for niche in niches:
+            merged.update(dict.fromkeys(self._accounts.get(niche, ())))
+        return list(merged)
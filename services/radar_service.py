@@ -1,16 +1,16 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from core.database import engine, get_session
 from sqlmodel import Session, select
-from models.database import Video, RadarKeyword, AnalysisReport
+from models.database import Video, RadarKeyword
 from services.social_api import SocialAPIWrapper
+from core.logging_config import sampled
 import asyncio
+import logging
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+log = logging.getLogger(__name__)
 
 social_api = SocialAPIWrapper()
-scheduler = AsyncIOScheduler()
+scheduler = None
 
 async def monitor_keywords():
     """
@@ -20,7 +20,7 @@ async def monitor_keywords():
         keywords = session.exec(select(RadarKeyword).where(RadarKeyword.active == True)).all()
         
         for k in keywords:
-            print(f"Radar: Scanning Instagram for '{k.keyword}'...")
+            log.info("Radar scan started", extra={"keyword": k.keyword})
             results = await social_api.search_trends(k.keyword)
             
             for r in results:
@@ -31,12 +31,17 @@ async def monitor_keywords():
                     if not existing:
                         video = Video(**r)
                         session.add(video)
-                        print(f"Radar: Found anomalous Reel: {r['platform_id']}")
+                        log.info("Radar found anomalous reel", extra=sampled(keyword=k.keyword, platform_id=r["platform_id"], views=r["views"]))
         
         session.commit()
 
 def start_radar_scheduler():
+    global scheduler
+    # apscheduler is only needed once the radar actually runs
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    if scheduler is None:
+        scheduler = AsyncIOScheduler()
     if not scheduler.running:
         scheduler.add_job(monitor_keywords, 'interval', minutes=30)
         scheduler.start()
-        print("Radar Scheduler Started (30min interval)")
+        log.info("Radar scheduler started", extra={"interval_minutes": 30})
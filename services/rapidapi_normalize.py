@@ -0,0 +1,156 @@
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Optional fast path: orjson parses the raw body several times faster than json
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+log = logging.getLogger(__name__)
+
+# Instagram media ids carry the creation time: bits 63:23 are ms since this epoch
+IG_EPOCH_MS = 1314220021000
+
+# Field -> candidate keys, per key convention. The convention is detected per item and
+# its keys are probed first; the other convention's keys are only tried for a missing field.
+SCHEMAS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "snake": {
+        "taken_at": ("taken_at", "device_timestamp"),
+        "likes": ("like_count",),
+        "comments": ("comment_count",),
+        "views": ("play_count", "view_count"),
+        "images": ("image_versions2",),
+        "code": ("code",),
+    },
+    "camel": {
+        "taken_at": ("takenAt",),
+        "likes": ("likeCount",),
+        "comments": ("commentCount",),
+        "views": ("playCount", "viewCount"),
+        "images": ("imageVersions2",),
+        "code": ("shortCode",),
+    },
+}
+
+def loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def extract_timestamp_from_pk(pk_str: str) -> Optional[int]:
+    try:
+        pk_int = int(str(pk_str).split("_")[0])
+        return ((pk_int >> 23) + IG_EPOCH_MS) // 1000
+    except Exception:
+        return None
+
+def extract_items(data: Any) -> List[Any]:
+    """The list of media objects, whichever envelope the payload uses."""
+    if isinstance(data, list):
+        return data
+    if not isinstance(data, dict):
+        return []
+    result = data.get("result")
+    edges = result.get("edges") if isinstance(result, dict) else None
+    if edges:
+        return [(e.get("node") or {}).get("media") or e.get("node") or {} for e in edges if isinstance(e, dict)]
+    items = data.get("items", data.get("data", []))
+    return items if isinstance(items, list) else []
+
+def detect_schema(item: Dict[str, Any]) -> str:
+    """Key convention of one media object (pages can mix both)."""
+    return "camel" if "likeCount" in item or "takenAt" in item or "shortCode" in item else "snake"
+
+def _getter(keys: Tuple[str, ...]) -> Callable[[Dict[str, Any]], Any]:
+    """First truthy value among `keys`, else the first one present (a real 0 beats a missing key)."""
+    def get(item: Dict[str, Any]) -> Any:
+        present = None
+        for key in keys:
+            value = item.get(key)
+            if value:
+                return value
+            if present is None:
+                present = value
+        return present
+    return get
+
+# Getters are built once at import, not per payload or per item: own keys, then the other convention's
+_COMPILED = {
+    name: {field: _getter(keys + other[field]) for field, keys in schema.items()}
+    for name, schema in SCHEMAS.items()
+    for other in [SCHEMAS["camel" if name == "snake" else "snake"]]
+}
+
+def _published_at(taken_at: Any) -> str:
+    try:
+        return datetime.fromtimestamp(taken_at).isoformat()
+    except Exception:
+        return ""
+
+def _normalize_item(item: Dict[str, Any], username: str, cutoff: Optional[float]) -> Optional[Dict[str, Any]]:
+    """One media object as a reel dict, or None when it is older than `cutoff`."""
+    get = _COMPILED[detect_schema(item)]
+    pk_val = item.get("pk") or item.get("id", "")
+    taken_at = get["taken_at"](item)
+    # If the API drops the date, reverse engineer it from the media ID (PK)
+    if not taken_at and pk_val:
+        taken_at = extract_timestamp_from_pk(pk_val)
+    if cutoff is not None and taken_at:
+        try:
+            if taken_at < cutoff:
+                return None
+        except TypeError:
+            pass
+
+    likes = int(get["likes"](item) or 0)
+    comments = int(get["comments"](item) or 0)
+    views = int(get["views"](item) or 0)
+    if not views and likes:
+        views = likes * 3  # Missing in both conventions (or a placeholder 0 next to real likes): rough estimate
+
+    candidates = (get["images"](item) or {}).get("candidates")
+    code = get["code"](item) or ""
+    caption = item.get("caption") or {}
+    caption_text = caption.get("text", "") if isinstance(caption, dict) else (caption if isinstance(caption, str) else "")
+
+    return {
+        "platform_id": str(item.get("id", "") or item.get("pk", "")),
+        "platform": "instagram",
+        "title": caption_text[:150] or f"Reel from @{username}",
+        "author": username,
+        "views": views,
+        "likes": likes,
+        "comments": comments,
+        "engagement_rate": round(((likes + comments) / max(views, 1)) * 100, 2),
+        "thumbnail_url": candidates[0].get("url", "") if candidates else "",
+        "video_url": f"https://www.instagram.com/reel/{code}/" if code else f"https://www.instagram.com/{username}/",
+        "published_at": _published_at(taken_at) if taken_at else "",
+        "transcript": caption_text,
+    }
+
+def normalize_reels(data: Any, username: str, timeframe_days: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Convert one reels payload into the app's reel dicts, dropping items older than
+    timeframe_days. A malformed item is skipped on its own; the rest of the page is kept.
+    """
+    items = extract_items(data)
+    # Computed once per payload instead of once per item
+    cutoff = time.time() - timeframe_days * 86400 if timeframe_days else None
+
+    results = []
+    skipped = 0
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            reel = _normalize_item(item, username, cutoff)
+        except (TypeError, ValueError, AttributeError, IndexError, OverflowError):
+            skipped += 1
+            continue
+        if reel is not None:
+            results.append(reel)
+    if skipped:
+        log.warning("Skipped malformed RapidAPI items", extra={"account": username, "skipped": skipped})
+    return results
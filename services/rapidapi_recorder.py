@@ -0,0 +1,42 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+_lock = threading.Lock()
+
+def request_key(path: str, body: Dict[str, Any]) -> str:
+    """Stable identity of an upstream request: endpoint path plus canonical JSON body."""
+    canonical = json.dumps(body or {}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(f"{path}|{canonical}".encode()).hexdigest()
+
+def save(directory: str, path: str, body: Dict[str, Any], data: Any):
+    """Write one recorded exchange as <directory>/<key>.json (atomic, last write wins)."""
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, request_key(path, body) + ".json")
+    record = {"path": path, "request": body, "response": data}
+    with _lock:
+        tmp = f"{target}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp, target)
+
+def load(directory: str) -> Dict[str, Any]:
+    """Load all recordings from a directory into {request_key: response}."""
+    recordings = {}
+    if not directory or not os.path.isdir(directory):
+        return recordings
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                record = json.load(f)
+            recordings[request_key(record["path"], record["request"])] = record["response"]
+        except (OSError, ValueError, KeyError):
+            continue
+    return recordings
+
+def lookup(recordings: Dict[str, Any], path: str, body: Dict[str, Any]) -> Optional[Any]:
+    return recordings.get(request_key(path, body))
@@ -1,15 +1,26 @@
 import os
+import logging
 import requests
 import asyncio
+import random
+import contextvars
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any, Optional
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Optional, Tuple
+from services import rapidapi_normalize, rapidapi_recorder
+from services.rapidapi_normalize import extract_timestamp_from_pk
+from services.query_normalize import NicheMatcher, filter_terms
+from services.metrics import RAPIDAPI_LATENCY, RAPIDAPI_RESPONSES
+from core.logging_config import sampled
+from core.config import RAPIDAPI_KEY
 
-load_dotenv()
+log = logging.getLogger(__name__)
 
-RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY", "")
 RAPIDAPI_HOST = "instagram120.p.rapidapi.com"
+# Override to point at a local stub (see benchmarks/stub_server.py)
+RAPIDAPI_BASE_URL = os.getenv("RAPIDAPI_BASE_URL", f"https://{RAPIDAPI_HOST}").rstrip("/")
+REELS_PATH = "/api/instagram/reels"
+# Set to a directory to save every successful response there, for offline replay
+RAPIDAPI_RECORD_DIR = os.getenv("RAPIDAPI_RECORD_DIR", "")
 
 HEADERS = {
     "Content-Type": "application/json",
@@ -17,6 +28,34 @@ HEADERS = {
     "x-rapidapi-key": RAPIDAPI_KEY,
 }
 
+# Shared pools for blocking per-account requests (one pair per process, not per request).
+# Together they cap concurrent upstream calls: keep it at 10, the free tier answers more with 429s.
+# Hedges get their own share of the workers so they never queue behind the slow calls they stand in for.
+RAPIDAPI_WORKERS = int(os.getenv("RAPIDAPI_WORKERS", "10"))
+RAPIDAPI_HEDGE_WORKERS = int(os.getenv("RAPIDAPI_HEDGE_WORKERS", "3"))
+account_executor = ThreadPoolExecutor(max_workers=max(1, RAPIDAPI_WORKERS - RAPIDAPI_HEDGE_WORKERS), thread_name_prefix="rapidapi")
+hedge_executor = ThreadPoolExecutor(max_workers=max(1, RAPIDAPI_HEDGE_WORKERS), thread_name_prefix="rapidapi-hedge")
+
+# Search fan-out budget: return whatever has arrived after SEARCH_DEADLINE seconds
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "6"))
+SEARCH_ACCOUNTS = 20
+# Accounts still pending after HEDGE_AFTER seconds (or failed) get a hedge request, up to HEDGE_SPARES per search
+HEDGE_AFTER = float(os.getenv("SEARCH_HEDGE_AFTER", "2.5"))
+HEDGE_SPARES = int(os.getenv("SEARCH_HEDGE_SPARES", "4"))
+# Stop waiting once this many times `count` raw reels are in (keyword filtering drops some)
+SEARCH_OVERSAMPLE = 2
+
+# Generic discovery tags: queries made only of these are not keyword-filtered
+UNFILTERED_WORDS = frozenset({"viral", "trending", "wow", "epic"})
+
+class SearchResults(list):
+    """A list of reels; `partial` is set when the deadline cut the fetch short, so callers cache it briefly."""
+    partial = False
+
+    def __init__(self, reels=(), partial: bool = False):
+        super().__init__(reels)
+        self.partial = partial
+
 # Massively expanded seed accounts to guarantee 100-200+ Reels per fetch
 HASHTAG_TO_ACCOUNTS = {
     # Luxury / Fashion / Lifestyle
@@ -49,170 +88,191 @@ HASHTAG_TO_ACCOUNTS = {
     # Travel / Nature
     "travel": ["natgeo", "earthpix", "beautifuldestinations", "lonelyplanet", "cntraveler", "travelchannel", "natgeotravel", "bucketlist", "wonderful_places", "bestvacations", "travelgram", "wanderlust", "roamtheplanet"],
     "nature": ["natgeowild", "discoverearth", "nature", "earthfocus", "ourplanetdaily", "wildlifeplanet"],
-    # Business / Motivation
-    "business": ["forbes", "entrepreneur", "incmagazine", "garyvee", "grantcardone", "tonyrobbins", "businessinsider", "hbr", "wsj", "bloomberg", "successmagazine", "millionaire_mentor", "investopedia"],
+    # Motivation
     "motivation": ["foundrmagazine", "quotes", "mindset", "hustle", "grind", "wealth", "leadership"],
     # Default (General Viral)
     "default": ["instagram", "creators", "9gag", "pubity", "complex", "meme", "viral", "trending", "tiktok", "reels", "funny", "comedy", "lmao", "epic", "wow"],
 }
 
+# Compiled once: query tokens -> niches without scanning every key per search
+niche_matcher = NicheMatcher(HASHTAG_TO_ACCOUNTS)
+# Latency is labelled per seed account; any other (user-supplied) username shares one "other" series
+SEED_ACCOUNTS = frozenset(a for accounts in HASHTAG_TO_ACCOUNTS.values() for a in accounts)
+
 def _pick_accounts(query: str, max_accounts=2) -> List[str]:
     """Pick up to max_accounts seed accounts based on the search query."""
-    q = query.lower().replace("#", "").strip()
-    accounts = []
-    
-    # Check words in query
-    for key, accs in HASHTAG_TO_ACCOUNTS.items():
-        if key in q or q in key:
-            accounts.extend(accs)
-            
-    if not accounts:
-        accounts = HASHTAG_TO_ACCOUNTS["default"]
-        
-    import random
+    accounts = niche_matcher.accounts(niche_matcher.match(query))
     # Return a random sample of max_accounts to ensure variety across searches
     return random.sample(accounts, min(len(accounts), max_accounts))
 
-def _is_within_timeframe(taken_at: Optional[int], days: Optional[int]) -> bool:
-    if not days or not taken_at:
-        return True
-    try:
-        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-        post_time = datetime.fromtimestamp(taken_at, tz=timezone.utc)
-        return post_time >= cutoff
-    except Exception:
-        return True
-
-def extract_timestamp_from_pk(pk_str: str) -> Optional[int]:
-    try:
-        # Instagram standard 64-bit ID. Bits 63:23 represent milliseconds since Insta epoch
-        pk_int = int(str(pk_str).split("_")[0])
-        ts_ms = (pk_int >> 23) + 1314220021000
-        return int(ts_ms / 1000)
-    except Exception:
-        return None
+def _next_max_id(data: Any) -> str:
+    """Pagination cursor for the next page of an account's reels ("" when there is none)."""
+    if not isinstance(data, dict):
+        return ""
+    result = data.get("result") if isinstance(data.get("result"), dict) else {}
+    page_info = result.get("page_info") or data.get("page_info") or {}
+    if page_info.get("has_next_page") and page_info.get("end_cursor"):
+        return str(page_info["end_cursor"])
+    for src in (result, data):
+        if src.get("more_available", True) and src.get("next_max_id"):
+            return str(src["next_max_id"])
+    return ""
 
 def fetch_reels_from_account_sync(username: str, timeframe_days: Optional[int]) -> List[Dict[str, Any]]:
     """Fetch reels for a single account synchronously."""
-    results = []
+    results, _ = fetch_reels_page_sync(username, "", timeframe_days)
+    return results
+
+class RapidAPIError(Exception):
+    """An account page could not be fetched (network error, non-200 or unparseable body)."""
+
+def fetch_reels_page(username: str, max_id: str = "", timeframe_days: Optional[int] = None,
+                     timeout: float = 10) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Fetch one page of an account's reels. Returns (reels, next_max_id); next_max_id is "" on
+    the last page. Raises RapidAPIError when the page could not be fetched, so callers can
+    tell a failure from an account that has no reels.
+    """
+    body = {"username": username, "maxId": max_id or ""}
     try:
-        resp = requests.post(
-            f"https://{RAPIDAPI_HOST}/api/instagram/reels",
-            headers=HEADERS,
-            json={"username": username, "maxId": ""},
-            timeout=10, # Fast timeout to not block
-        )
+        with RAPIDAPI_LATENCY.time(account=username if username in SEED_ACCOUNTS else "other"):
+            resp = requests.post(
+                RAPIDAPI_BASE_URL + REELS_PATH,
+                headers=HEADERS,
+                json=body,
+                timeout=timeout,
+            )
+        RAPIDAPI_RESPONSES.inc(status=resp.status_code)
         if resp.status_code != 200:
-            return []
+            log.warning("RapidAPI non-200 response", extra=sampled(account=username, status=resp.status_code))
+            raise RapidAPIError(f"HTTP {resp.status_code}")
 
-        data = resp.json()
-        
-        edges = data.get("result", {}).get("edges", [])
-        if edges:
-            items = [edge.get("node", {}).get("media") or edge.get("node", {}) for edge in edges]
-        else:
-            items = data if isinstance(data, list) else data.get("items", data.get("data", []))
-            
-        if not items or not isinstance(items, list):
-            return []
-
-        for item in items:
-            if not isinstance(item, dict):
-                continue
-                
-            pk_val = item.get("pk") or item.get("id", "")
-            taken_at = item.get("taken_at") or item.get("takenAt") or item.get("device_timestamp")
-            
-            # If the API drops the date, reverse engineer it from the media ID (PK)
-            if not taken_at and pk_val:
-                taken_at = extract_timestamp_from_pk(pk_val)
-
-            if not _is_within_timeframe(taken_at, timeframe_days):
-                continue
-
-            likes = int(item.get("like_count") or item.get("likeCount") or 0)
-            comments = int(item.get("comment_count") or item.get("commentCount") or 0)
-            
-            # play_count might not be present, fallback to view_count
-            views = item.get("play_count") or item.get("playCount") or item.get("view_count") or item.get("viewCount")
-            if views is None: views = likes * 3 # rough estimate if fully missing
-            views = int(views)
-            
-            er = round(((likes + comments) / max(views, 1)) * 100, 2)
-
-            thumb = ""
-            image_versions = item.get("image_versions2") or item.get("imageVersions2") or {}
-            candidates = image_versions.get("candidates", [])
-            if candidates:
-                thumb = candidates[0].get("url", "")
-
-            code = item.get("code") or item.get("shortCode") or ""
-            video_url = f"https://www.instagram.com/reel/{code}/" if code else f"https://www.instagram.com/{username}/"
-
-            published_at = ""
-            if taken_at:
-                try:
-                    published_at = datetime.fromtimestamp(taken_at).isoformat()
-                except Exception:
-                    pass
-
-            caption_data = item.get("caption") or {}
-            caption_text = caption_data.get("text", "") if isinstance(caption_data, dict) else (caption_data if isinstance(caption_data, str) else "")
-
-            results.append({
-                "platform_id": str(item.get("id", "") or item.get("pk", "")),
-                "platform": "instagram",
-                "title": caption_text[:150] or f"Reel from @{username}",
-                "author": username,
-                "views": int(views),
-                "likes": int(likes),
-                "comments": int(comments),
-                "engagement_rate": er,
-                "thumbnail_url": thumb,
-                "video_url": video_url,
-                "published_at": published_at,
-                "transcript": caption_text,
-            })
+        data = rapidapi_normalize.loads(resp.content)
+        if RAPIDAPI_RECORD_DIR:
+            rapidapi_recorder.save(RAPIDAPI_RECORD_DIR, REELS_PATH, body, data)
+        return rapidapi_normalize.normalize_reels(data, username, timeframe_days), _next_max_id(data)
+    except RapidAPIError:
+        raise
     except Exception as e:
-        print(f"Error fetching from @{username}: {e}")
-    return results
+        RAPIDAPI_RESPONSES.inc(status="error")
+        log.warning("RapidAPI account fetch failed", extra=sampled(account=username, error=str(e)))
+        raise RapidAPIError(str(e)) from e
+
+def fetch_reels_page_sync(username: str, max_id: str = "", timeframe_days: Optional[int] = None) -> Tuple[List[Dict[str, Any]], str]:
+    """fetch_reels_page() for best-effort callers: a failed page is ([], "")."""
+    try:
+        return fetch_reels_page(username, max_id, timeframe_days)
+    except RapidAPIError:
+        return [], ""
+
+def _fetch_account(username: str, timeframe_days: Optional[int], timeout: float) -> List[Dict[str, Any]]:
+    """First page of an account's reels for the search fan-out; raises RapidAPIError on failure."""
+    reels, _ = fetch_reels_page(username, "", timeframe_days, timeout=timeout)
+    return reels
+
+async def _fetch_accounts_with_deadline(
+    accounts: List[str], spares: List[str], timeframe_days: Optional[int], want: int
+) -> SearchResults:
+    """
+    Fetch accounts concurrently within SEARCH_DEADLINE and return the partial results.
+    Stops early once `want` reels are in. Each account is a slot: if it is still pending
+    after HEDGE_AFTER, or fails, it gets a hedge request (a substitute from `spares`, or the
+    same account again once they run out) on the separate hedge pool, and only the first
+    of the two to answer contributes. A failure never fills a slot, so the hedge can still
+    win it. Stragglers are cancelled; requests already running finish in the pool but are
+    ignored, and their HTTP timeout is bounded by the deadline so they free workers soon
+    after. The result is marked partial when the deadline left slots unanswered.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + SEARCH_DEADLINE
+    hedge_at = started + HEDGE_AFTER if HEDGE_SPARES > 0 else None
+    # future -> slot index; a hedge shares the slot of the account it stands in for
+    pending: Dict[asyncio.Future, int] = {}
+    substitutes = iter(spares)
+    hedged = set()
+
+    def launch(slot: int, username: str, executor: ThreadPoolExecutor):
+        # run_in_executor doesn't carry contextvars; copy them so worker logs keep the request id
+        ctx = contextvars.copy_context()
+        timeout = max(1.0, deadline - loop.time())
+        pending[loop.run_in_executor(executor, ctx.run, _fetch_account, username, timeframe_days, timeout)] = slot
+
+    def hedge(slot: int):
+        if slot in hedged or len(hedged) >= HEDGE_SPARES:
+            return
+        hedged.add(slot)
+        launch(slot, next(substitutes, accounts[slot]), hedge_executor)
+
+    for slot, username in enumerate(accounts):
+        launch(slot, username, account_executor)
+    results: List[Dict[str, Any]] = []
+    filled = set()
+    failed = 0
+    timed_out = False
+    try:
+        while pending:
+            now = loop.time()
+            if now >= deadline:
+                timed_out = True
+                break
+            wake = min(deadline, hedge_at) if hedge_at is not None else deadline
+            done, _ = await asyncio.wait(list(pending), timeout=wake - now, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                slot = pending.pop(fut)
+                if slot in filled or fut.cancelled():
+                    continue
+                if fut.exception() is not None:
+                    # Leave the slot open: a pending twin may still answer, otherwise hedge it now
+                    failed += 1
+                    if slot not in pending.values():
+                        hedge(slot)
+                    continue
+                results.extend(fut.result())
+                filled.add(slot)
+                for twin in [f for f, s in pending.items() if s == slot]:
+                    twin.cancel()
+                    del pending[twin]
+            if len(results) >= want:
+                break
+            if hedge_at is not None and loop.time() >= hedge_at:
+                hedge_at = None
+                for slot in sorted(set(pending.values())):
+                    hedge(slot)
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+    dropped = len(set(pending.values()))
+    log.info("Search fan-out finished", extra={
+        "reels": len(results), "accounts": len(filled), "dropped": dropped,
+        "hedged": len(hedged), "failed": failed, "elapsed_ms": round((loop.time() - started) * 1000),
+    })
+    return SearchResults(results, partial=timed_out and dropped > 0)
 
 async def search_reels_by_keyword_async(
     query: str, count: int = 100, timeframe_days: Optional[int] = None, sort_by: str = "views"
 ) -> List[Dict[str, Any]]:
     """
     Massive Concurrent Reels Fetcher.
-    Picks ~15 seed accounts based on keyword and fetches their reels concurrently.
-    Guarantees massive volume quickly.
+    Picks ~20 seed accounts based on keyword and fetches their reels concurrently.
+    Latency is bounded by SEARCH_DEADLINE, not by the slowest account.
     """
     if not RAPIDAPI_KEY:
-        print("WARNING: RAPIDAPI_KEY is not set.")
+        log.warning("RAPIDAPI_KEY is not set")
         return []
 
-    accounts = _pick_accounts(query, max_accounts=20)
-    all_results = []
-    
-    loop = asyncio.get_event_loop()
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        # Schedule all account fetches concurrently
-        tasks = [
-            loop.run_in_executor(executor, fetch_reels_from_account_sync, username, timeframe_days)
-            for username in accounts
-        ]
-        
-        # Wait for all to complete
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        for br in batch_results:
-            if isinstance(br, list):
-                all_results.extend(br)
+    picked = _pick_accounts(query, max_accounts=SEARCH_ACCOUNTS + HEDGE_SPARES)
+    accounts, spares = picked[:SEARCH_ACCOUNTS], picked[SEARCH_ACCOUNTS:]
+    fetched = await _fetch_accounts_with_deadline(accounts, spares, timeframe_days, want=count * SEARCH_OVERSAMPLE)
+    all_results = list(fetched)
 
     # Keyword post-filtering: if the query is specific, weed out irrelevant reels
     # Default tags are "viral trending wow epic". We don't filter those.
-    query_lower = query.lower().strip()
-    if query_lower and query_lower not in ["viral trending wow epic", "viral", "trending", "wow", "epic", ""]:
+    # Every spelling of the query's words counts, so "фитнес" keeps Russian and English captions
+    words = filter_terms(query)
+    if words and not words <= UNFILTERED_WORDS:
         filtered = []
-        words = set(query_lower.replace("#", "").split())
         for r in all_results:
             text_corpus = ((r.get("transcript") or "") + " " + (r.get("author") or "")).lower()
             # If any word from the query is in the transcript/author
@@ -234,7 +294,7 @@ async def search_reels_by_keyword_async(
     elif sort_by == "recent":
         all_results.sort(key=lambda x: x["published_at"] or "", reverse=True)
 
-    return all_results[:count]
+    return SearchResults(all_results[:count], partial=fetched.partial)
 
 # Synchronous wrapper if needed anywhere else
 def search_reels_by_keyword(*args, **kwargs):
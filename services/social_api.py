@@ -1,11 +1,13 @@
 import asyncio
 from typing import List, Dict, Any
 from services import rapidapi_service
+from services.providers import get_providers, fan_out_search
 
 class SocialAPIWrapper:
-    """Simplified wrapper that just passes through to the new massive concurrent fetcher."""
-    def __init__(self):
+    """Routes searches to every enabled provider (SEARCH_PROVIDERS) and merges their results."""
+    def __init__(self, providers=None):
         self.rapidapi = rapidapi_service
+        self.providers = providers if providers is not None else get_providers()
 
     async def search_trends(self, query: str, timeframe: str = "all", sort_by: str = "views") -> List[Dict[str, Any]]:
         days = None
@@ -14,11 +16,12 @@ class SocialAPIWrapper:
         elif timeframe in ["7d", "week"]: days = 7
         elif timeframe in ["30d", "month"]: days = 30
         
-        # Call the new async concurrent function directly, fetch up to 100 reels
-        results = await self.rapidapi.search_reels_by_keyword_async(
+        # Concurrent multi-source fan-out with per-provider deadlines, deduped by shortcode/pk
+        results = await fan_out_search(
+            self.providers,
             query, 
-            count=100, 
-            timeframe_days=days, 
-            sort_by=sort_by
+            days=days, 
+            sort_by=sort_by,
+            count=100,
         )
         return results
@@ -0,0 +1,44 @@
+import hashlib
+import os
+from functools import lru_cache
+from urllib.parse import parse_qs
+from starlette.staticfiles import StaticFiles
+
+STATIC_DIR = "frontend/static"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+@lru_cache(maxsize=None)
+def _content_hash(path: str) -> str:
+    try:
+        with open(os.path.join(STATIC_DIR, path), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:12]
+    except OSError:
+        return ""
+
+def static_url(path: str) -> str:
+    """Content-hashed URL for a static asset, e.g. /static/css/style.css?v=3f2a9c1b0d4e."""
+    path = path.lstrip("/")
+    digest = _content_hash(path)
+    return f"/static/{path}?v={digest}" if digest else f"/static/{path}"
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that lets browsers keep hashed assets forever.
+    Requests whose ?v= equals the file's current content hash are immutable (the
+    URL changes with the content); bare URLs, stale hashes and unrelated query
+    parameters must revalidate, which StaticFiles answers with 304 via ETag.
+    """
+    @staticmethod
+    def _is_current(path: str, query_string: bytes) -> bool:
+        versions = parse_qs(query_string.decode("latin-1")).get("v", [])
+        digest = _content_hash(path.lstrip("/"))
+        return bool(digest) and versions == [digest]
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            if self._is_current(path, scope.get("query_string", b"")):
+                response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+            else:
+                response.headers["Cache-Control"] = "public, no-cache"
+        return response
@@ -0,0 +1,234 @@
+import hashlib
+import io
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import requests
+
+THUMB_CACHE_DIR = os.getenv("THUMB_CACHE_DIR", "cache/thumbs")
+THUMB_CACHE_MAX_BYTES = int(os.getenv("THUMB_CACHE_MAX_MB", "512")) * 1024 * 1024
+DEFAULT_WIDTH = 360
+ALLOWED_WIDTHS = (180, 360, 720)
+JPEG_QUALITY = 78
+# Source images bigger than this (bytes, or decoded pixels) are refused
+THUMB_MAX_SOURCE_BYTES = int(os.getenv("THUMB_MAX_SOURCE_MB", "8")) * 1024 * 1024
+THUMB_MAX_PIXELS = 40_000_000
+CHUNK_SIZE = 64 * 1024
+
+# Only proxy Instagram/Facebook CDN images, never arbitrary URLs (SSRF)
+ALLOWED_HOST_SUFFIXES = (".cdninstagram.com", ".fbcdn.net")
+
+# Magic bytes -> (extension, media type) of the formats served as they are when Pillow is missing
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", ".png", "image/png"),
+    (b"GIF8", ".gif", "image/gif"),
+)
+MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".gif": "image/gif", ".webp": "image/webp"}
+
+_image_module = None
+_image_checked = False
+
+def _pil():
+    """Pillow's Image module, imported on first use (None when it is not installed)."""
+    global _image_module, _image_checked
+    if not _image_checked:
+        try:
+            from PIL import Image
+            # Pillow raises DecompressionBombError past twice this
+            Image.MAX_IMAGE_PIXELS = THUMB_MAX_PIXELS
+            _image_module = Image
+        except ImportError:
+            _image_module = None
+        _image_checked = True
+    return _image_module
+
+def sniff_image(data: bytes) -> Optional[Tuple[str, str]]:
+    """(extension, media type) of an image body, or None when it is not a known image format."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp", "image/webp"
+    for magic, ext, media_type in IMAGE_SIGNATURES:
+        if data.startswith(magic):
+            return ext, media_type
+    return None
+
+class ThumbnailCache:
+    """
+    Fetch-once thumbnail proxy backed by a content-addressed on-disk cache.
+
+    Files are addressed by sha256 of the image identity (CDN host+path without the
+    expiring signature query) plus the target width, so a re-signed URL for the same
+    image is a cache hit. Total size is bounded; the least recently used files
+    (by mtime, touched on every hit) are evicted first. Thumbnails are re-encoded as
+    JPEG with Pillow; without it, known image formats are stored and served as they
+    are. Anything that is not an image, too big, or fails to decode is not cached.
+    Concurrent misses for one thumbnail fetch it once.
+    """
+    def __init__(self, directory: str = THUMB_CACHE_DIR, max_bytes: int = THUMB_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self._inflight: Dict[str, threading.Event] = {}
+
+    @staticmethod
+    def is_allowed(url: str) -> bool:
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return False
+        host = (parts.hostname or "").lower()
+        return parts.scheme == "https" and any(host.endswith(s) for s in ALLOWED_HOST_SUFFIXES)
+
+    @staticmethod
+    def normalize_width(width: Optional[int]) -> int:
+        if not width:
+            return DEFAULT_WIDTH
+        return min(ALLOWED_WIDTHS, key=lambda w: abs(w - width))
+
+    def key_for(self, url: str, width: int) -> str:
+        parts = urlsplit(url)
+        identity = f"{parts.hostname}{parts.path}|{width}"
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def _path(self, key: str, ext: str = ".jpg") -> str:
+        return os.path.join(self.directory, key[:2], key + ext)
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        for ext, media_type in MEDIA_TYPES.items():
+            path = self._path(key, ext)
+            if os.path.exists(path):
+                try:
+                    os.utime(path)  # LRU touch
+                except OSError:
+                    pass
+                return path, media_type
+        return None
+
+    def get(self, url: str, width: int = DEFAULT_WIDTH) -> Optional[Tuple[str, str]]:
+        """
+        Return (path, media type) of the cached thumbnail, fetching and resizing it on a miss.
+        Blocking (network + image work); call from a worker thread.
+        """
+        width = self.normalize_width(width)
+        key = self.key_for(url, width)
+        cached = self._lookup(key)
+        if cached:
+            return cached
+        with self._lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+        if not owner:
+            # Another thread is fetching this thumbnail: use its result
+            event.wait(30)
+            return self._lookup(key)
+        try:
+            # It may have landed between the first lookup and taking ownership
+            return self._lookup(key) or self._fetch(url, key, width)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _fetch(self, url: str, key: str, width: int) -> Optional[Tuple[str, str]]:
+        raw = self._download(url)
+        if not raw:
+            return None
+        converted = self._resize(raw, width)
+        if converted is None:
+            return None
+        data, ext = converted
+        path = self._path(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return None
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._account(len(data))
+        return path, MEDIA_TYPES[ext]
+
+    @staticmethod
+    def _download(url: str) -> Optional[bytes]:
+        """The image body, or None on errors, redirects (the target would bypass is_allowed) and oversized bodies."""
+        try:
+            with requests.get(url, timeout=10, stream=True, allow_redirects=False) as resp:
+                if resp.status_code != 200:
+                    return None
+                if int(resp.headers.get("Content-Length") or 0) > THUMB_MAX_SOURCE_BYTES:
+                    return None
+                body = bytearray()
+                for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                    body += chunk
+                    if len(body) > THUMB_MAX_SOURCE_BYTES:
+                        return None
+                return bytes(body)
+        except (requests.RequestException, ValueError):
+            return None
+
+    def _resize(self, raw: bytes, width: int) -> Optional[Tuple[bytes, str]]:
+        """(data, extension) to store: a resized JPEG, or the raw image when Pillow is missing."""
+        sniffed = sniff_image(raw)
+        if sniffed is None:
+            return None
+        Image = _pil()
+        if Image is None:
+            return raw, sniffed[0]
+        try:
+            with Image.open(io.BytesIO(raw)) as img:
+                if img.width * img.height > THUMB_MAX_PIXELS:
+                    return None
+                img = img.convert("RGB")
+                if img.width > width:
+                    img.thumbnail((width, width * 4))
+                out = io.BytesIO()
+                img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+                return out.getvalue(), ".jpg"
+        except (Image.DecompressionBombError, OSError, ValueError, SyntaxError):
+            return None
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if os.path.splitext(name)[1] not in MEDIA_TYPES:
+                    continue
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        return files
+
+    def _account(self, added: int):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += added
+            if self._size <= self.max_bytes:
+                return
+            # Evict oldest-touched files down to 90% of the budget (re-measured, so the total never drifts)
+            files = self._scan()
+            self._size = sum(size for _, size, _ in files)
+            target = int(self.max_bytes * 0.9)
+            for mtime, size, p in sorted(files):
+                if self._size <= target:
+                    break
+                try:
+                    os.remove(p)
+                    self._size -= size
+                except OSError:
+                    pass
+
+# Global instance
+thumbnail_cache = ThumbnailCache()
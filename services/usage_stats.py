@@ -0,0 +1,124 @@
+from datetime import date, datetime, timedelta
+from typing import Any, Dict
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from models.database import DailyUsage, QueryStat, SearchHistory, User, UsageCounter, UserDayActivity, UserUsage
+from services.query_normalize import canonical_query
+
+ADMIN_USERS_PER_PAGE = 50
+DASHBOARD_DAYS = 14
+TOP_QUERIES = 10
+
+def _bump(session: Session, model, keys: Dict[str, Any], deltas: Dict[str, int], sets: Dict[str, Any] = None):
+    """
+    Atomically add `deltas` to the rollup row identified by `keys` (creating it if
+    needed) inside the caller's transaction. The UPDATE is a single statement, so
+    concurrent writers never lose increments.
+    """
+    sets = sets or {}
+    stmt = (update(model)
+            .where(*(getattr(model, k) == v for k, v in keys.items()))
+            .values({**{c: getattr(model, c) + d for c, d in deltas.items()}, **sets}))
+    if session.execute(stmt).rowcount:
+        return
+    try:
+        with session.begin_nested():
+            session.add(model(**keys, **deltas, **sets))
+    except IntegrityError:
+        # Another transaction created the row in between
+        session.execute(stmt)
+
+def _mark_active(session: Session, user_id: int, today: date):
+    """Count the user once in today's active_users."""
+    try:
+        with session.begin_nested():
+            session.add(UserDayActivity(day=today, user_id=user_id))
+    except IntegrityError:
+        return
+    _bump(session, DailyUsage, {"day": today}, {"active_users": 1})
+
+def record_search(session: Session, user_id: int, query: str):
+    """Roll a new search into the totals; call before committing the SearchHistory row."""
+    now = datetime.utcnow()
+    today = now.date()
+    _bump(session, UsageCounter, {"name": "searches"}, {"value": 1})
+    _bump(session, DailyUsage, {"day": today}, {"searches": 1})
+    _bump(session, UserUsage, {"user_id": user_id}, {"searches": 1}, {"last_active_at": now})
+    _bump(session, QueryStat, {"query": canonical_query(query) or query}, {"searches": 1}, {"last_searched_at": now})
+    _mark_active(session, user_id, today)
+
+def record_tokens(session: Session, user_id: int, amount: int):
+    now = datetime.utcnow()
+    _bump(session, UsageCounter, {"name": "tokens_spent"}, {"value": amount})
+    _bump(session, DailyUsage, {"day": now.date()}, {"tokens_spent": amount})
+    _bump(session, UserUsage, {"user_id": user_id}, {"tokens_spent": amount}, {"last_active_at": now})
+    _mark_active(session, user_id, now.date())
+
+def record_signup(session: Session):
+    _bump(session, UsageCounter, {"name": "users"}, {"value": 1})
+
+def backfill(session: Session):
+    """
+    Build the rollups from existing rows once, for databases created before they
+    existed (startup, before any new writes). Token spending was never logged
+    per event, so tokens_spent starts at zero.
+    """
+    if session.get(UsageCounter, "users") is not None:
+        return
+    session.add(UsageCounter(name="users", value=session.exec(select(func.count()).select_from(User)).one()))
+    session.add(UsageCounter(name="searches", value=session.exec(select(func.count()).select_from(SearchHistory)).one()))
+    session.add(UsageCounter(name="tokens_spent", value=0))
+
+    day = func.date(SearchHistory.searched_at)
+    for d, searches, users in session.exec(
+            select(day, func.count(), func.count(func.distinct(SearchHistory.user_id))).group_by(day)):
+        session.add(DailyUsage(day=date.fromisoformat(str(d)), searches=searches, active_users=users))
+    for d, user_id in session.exec(select(day, SearchHistory.user_id).distinct()):
+        session.add(UserDayActivity(day=date.fromisoformat(str(d)), user_id=user_id))
+    for user_id, searches, last in session.exec(
+            select(SearchHistory.user_id, func.count(), func.max(SearchHistory.searched_at)).group_by(SearchHistory.user_id)):
+        session.add(UserUsage(user_id=user_id, searches=searches, last_active_at=last))
+    queries: Dict[str, QueryStat] = {}
+    for query, searches, last in session.exec(
+            select(SearchHistory.query, func.count(), func.max(SearchHistory.searched_at)).group_by(SearchHistory.query)):
+        key = canonical_query(query) or query
+        stat = queries.setdefault(key, QueryStat(query=key, searches=0, last_searched_at=last))
+        stat.searches += searches
+        stat.last_searched_at = max(stat.last_searched_at, last)
+    session.add_all(queries.values())
+    session.commit()
+
+def dashboard(session: Session) -> Dict[str, Any]:
+    """Admin page summary: reads a fixed number of rollup rows, independent of history size."""
+    counters = {c.name: c.value for c in session.exec(select(UsageCounter))}
+    today = datetime.utcnow().date()
+    days = session.exec(select(DailyUsage).where(DailyUsage.day > today - timedelta(days=DASHBOARD_DAYS))
+                        .order_by(DailyUsage.day.desc())).all()
+    today_row = days[0] if days and days[0].day == today else None
+    return {
+        "total_users": counters.get("users", 0),
+        "total_searches": counters.get("searches", 0),
+        "total_tokens_spent": counters.get("tokens_spent", 0),
+        "active_today": today_row.active_users if today_row else 0,
+        "daily_usage": days,
+        "top_queries": session.exec(select(QueryStat).order_by(QueryStat.searches.desc()).limit(TOP_QUERIES)).all(),
+    }
+
+def user_page(session: Session, page: int = 1, q: str = "", per_page: int = ADMIN_USERS_PER_PAGE) -> Dict[str, Any]:
+    """One page of users (by id) with their usage rollup, optionally filtered by id or email."""
+    page = max(page, 1)
+    stmt = select(User, UserUsage).join(UserUsage, UserUsage.user_id == User.id, isouter=True)
+    q = q.strip().lstrip("#")
+    if q:
+        # autoescape: "%" and "_" in the search are literal characters, not LIKE wildcards
+        match = User.email.contains(q, autoescape=True)
+        stmt = stmt.where(or_(match, User.id == int(q)) if q.isdigit() else match)
+    # One extra row tells whether there is a next page without a COUNT(*)
+    rows = session.exec(stmt.order_by(User.id).offset((page - 1) * per_page).limit(per_page + 1)).all()
+    return {
+        "user_rows": [(u, usage) for u, usage in rows[:per_page]],
+        "users_page": page,
+        "users_query": q,
+        "has_next_users": len(rows) > per_page,
+    }
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_tmp = tempfile.mkdtemp(prefix="nocta-tests-")
+# Settings are read at import time, so they must be in place before the app is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["THUMB_CACHE_DIR"] = os.path.join(_tmp, "thumbs")
+os.environ["FEED_SNAPSHOT_PATH"] = os.path.join(_tmp, "home_feed.json")
+os.environ["RAPIDAPI_KEY"] = ""
+os.environ["GEMINI_API_KEY"] = ""
+os.environ["LOG_LEVEL"] = "WARNING"
+os.chdir(ROOT)  # templates and static files are resolved relative to the repo root
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    # Only the DB part of startup: the background workers would reach out to upstream APIs
+    main.on_startup()
+    return main
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+    client = TestClient(app.app)
+    r = client.post("/auth/login", data={"email": "admin@nocta.app", "password": "admin123"})
+    assert r.status_code == 200
+    return client
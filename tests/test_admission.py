@@ -0,0 +1,167 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.admission import AdmissionController, UpstreamBusyError
+
+def _user(i, role="user"):
+    return SimpleNamespace(id=i, role=role)
+
+async def _hold(admission, user, entered, release):
+    async with admission.slot(user):
+        entered.set()
+        await release.wait()
+
+def test_waiters_are_served_round_robin_across_users():
+    async def run():
+        admission = AdmissionController(slots=1, per_user=2, user_queue=5)
+        a, b = _user(1), _user(2)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(admission, a, entered, release))
+        await entered.wait()
+        order = []
+
+        async def request(user, tag):
+            async with admission.slot(user):
+                order.append(tag)
+
+        # User 1 queues two requests before user 2 queues one
+        tasks = [asyncio.create_task(request(a, "a1")), asyncio.create_task(request(a, "a2"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request(b, "b1")))
+        await asyncio.sleep(0)
+        assert admission.waiting == 3
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        return order, admission
+
+    order, admission = asyncio.run(run())
+    assert order == ["a1", "b1", "a2"]
+    assert (admission.inflight, admission.waiting) == (0, 0)
+
+def test_higher_priority_class_is_served_first():
+    async def run():
+        admission = AdmissionController(slots=1, per_user=1, user_queue=5)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(admission, _user(1), entered, release))
+        await entered.wait()
+        order = []
+
+        async def request(user):
+            async with admission.slot(user):
+                order.append(user.role)
+
+        tasks = [asyncio.create_task(request(_user(2))), asyncio.create_task(request(_user(3, role="admin")))]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        return order
+
+    assert asyncio.run(run()) == ["admin", "user"]
+
+def test_full_queues_reject_with_retry_after():
+    async def run():
+        admission = AdmissionController(slots=1, per_user=1, user_queue=1, max_waiting=2)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(admission, _user(1), entered, release))
+        await entered.wait()
+
+        async def request(user):
+            async with admission.slot(user):
+                pass
+
+        queued = [asyncio.create_task(request(_user(2)))]
+        await asyncio.sleep(0)
+        # Per-user queue limit
+        with pytest.raises(UpstreamBusyError) as per_user:
+            await request(_user(2))
+        queued.append(asyncio.create_task(request(_user(3))))
+        await asyncio.sleep(0)
+        # Global queue limit, even for a user with nothing queued
+        with pytest.raises(UpstreamBusyError) as total:
+            await request(_user(4))
+        assert admission.waiting == 2
+        release.set()
+        await asyncio.gather(holder, *queued)
+        return per_user.value, total.value, admission
+
+    per_user, total, admission = asyncio.run(run())
+    assert per_user.retry_after >= 1 and total.retry_after >= 1
+    assert (admission.inflight, admission.waiting) == (0, 0)
+
+def test_rejection_is_a_429_with_retry_after(app, client, monkeypatch):
+    monkeypatch.setattr(app, "admission", AdmissionController(slots=0, user_queue=0))
+    r = client.get("/api/search", params={"q": "admission429"})
+    assert r.status_code == 429 and int(r.headers["Retry-After"]) >= 1
+    assert "Слишком много запросов" in r.text
+    r = client.get("/api/search", params={"q": "admission429", "format": "json"})
+    assert r.status_code == 429 and r.json()["retry_after"] >= 1
+
+def test_timed_out_waiter_leaves_the_queue():
+    async def run():
+        admission = AdmissionController(slots=1, per_user=1, queue_timeout=0.05)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(admission, _user(1), entered, release))
+        await entered.wait()
+        with pytest.raises(UpstreamBusyError):
+            async with admission.slot(_user(2)):
+                pass
+        assert admission.waiting == 0 and not admission._classes[1]
+        release.set()
+        await holder
+        # The slot is free again and nobody is waiting for it
+        async with admission.slot(_user(2)):
+            assert admission.inflight == 1
+        return admission
+
+    admission = asyncio.run(run())
+    assert (admission.inflight, admission.waiting) == (0, 0)
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def run():
+        admission = AdmissionController(slots=1, per_user=1)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(admission, _user(1), entered, release))
+        await entered.wait()
+        reached = []
+
+        async def request(user):
+            async with admission.slot(user):
+                reached.append(user.id)
+
+        waiter = asyncio.create_task(request(_user(2)))
+        await asyncio.sleep(0)
+        assert admission.waiting == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admission.waiting == 0
+        release.set()
+        await holder
+        await request(_user(3))
+        return reached, admission
+
+    reached, admission = asyncio.run(run())
+    assert reached == [3]
+    assert (admission.inflight, admission.waiting) == (0, 0)
+
+def test_waiter_cancelled_after_its_grant_hands_the_slot_back():
+    async def run():
+        admission = AdmissionController(slots=1, per_user=1)
+        entered, release = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(_hold(admission, _user(1), entered, release))
+        await entered.wait()
+        waiter = asyncio.create_task(_hold(admission, _user(2), asyncio.Event(), asyncio.Event()))
+        await asyncio.sleep(0)
+        # The slot is granted and the waiter cancelled before it gets to run
+        release.set()
+        await holder
+        assert admission.inflight == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return admission
+
+    admission = asyncio.run(run())
+    assert (admission.inflight, admission.waiting) == (0, 0)
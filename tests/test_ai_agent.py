@@ -0,0 +1,76 @@
+import asyncio
+import uuid
+
+import pytest
+
+from services.ai_agent import AIAgent, AnalysisError
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class SlowFakeModel:
+    """Local stand-in for Gemini: answers after a short delay and counts calls."""
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return FakeResponse('{"visual_hook": "fake hook", "summary": "fake"}')
+
+def _video():
+    return {"platform_id": uuid.uuid4().hex, "video_url": "https://example.com/reel", "views": 10}
+
+def test_concurrent_requests_share_one_model_call():
+    model = SlowFakeModel()
+    agent = AIAgent(model=model, persist=False, media_analysis=False)
+    video = _video()
+
+    async def run():
+        return await asyncio.gather(*(agent.analyze_video(video) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert model.calls == 1
+    assert all(r == {"visual_hook": "fake hook", "summary": "fake"} for r in results)
+
+def test_cached_analysis_skips_the_model(app):
+    model = SlowFakeModel(delay=0)
+    video = _video()
+    agent = AIAgent(model=model, persist=True, media_analysis=False)
+    asyncio.run(agent.analyze_video(video))
+    asyncio.run(agent.analyze_video(video))
+    assert model.calls == 1
+
+    # A fresh agent (e.g. another worker) finds the stored result in the DB
+    other_model = SlowFakeModel(delay=0)
+    other = AIAgent(model=other_model, persist=True, media_analysis=False)
+    assert asyncio.run(other.get_cached(video)) == {"visual_hook": "fake hook", "summary": "fake"}
+    asyncio.run(other.analyze_video(video))
+    assert other_model.calls == 0
+
+def test_changed_metadata_is_not_a_cache_hit():
+    model = SlowFakeModel(delay=0)
+    agent = AIAgent(model=model, persist=False, media_analysis=False)
+    video = _video()
+    asyncio.run(agent.analyze_video(video))
+    asyncio.run(agent.analyze_video({**video, "views": 11}))
+    assert model.calls == 2
+
+class BrokenFakeModel:
+    def __init__(self, text=None):
+        self.text = text
+
+    async def generate_content_async(self, prompt):
+        if self.text is None:
+            raise RuntimeError("quota exceeded")
+        return FakeResponse(self.text)
+
+def test_failed_analysis_raises_and_is_not_cached():
+    video = _video()
+    for model in (BrokenFakeModel(), BrokenFakeModel("sorry, no json")):
+        agent = AIAgent(model=model, persist=False, media_analysis=False)
+        with pytest.raises(AnalysisError):
+            asyncio.run(agent.analyze_video(video))
+        assert asyncio.run(agent.get_cached(video)) is None
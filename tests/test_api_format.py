@@ -0,0 +1,53 @@
+import json
+import time
+from types import SimpleNamespace
+
+from starlette.requests import Request
+
+from services import api_format
+from services.feed_builder import FeedSnapshot
+
+PAYLOAD = {"items": [{"title": "reel %d" % i, "views": i} for i in range(40)]}
+
+def _request(**headers):
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+def test_formats_are_negotiated():
+    body = api_format.data_response(_request(), PAYLOAD, "json")
+    assert body.media_type == "application/json" and json.loads(body.body) == PAYLOAD
+    packed = api_format.data_response(_request(), PAYLOAD, "msgpack")
+    if api_format.msgpack is not None:
+        assert packed.media_type == "application/msgpack" and api_format.msgpack.unpackb(packed.body) == PAYLOAD
+    else:
+        # Without msgpack installed the binary mode falls back to JSON
+        assert packed.media_type == "application/json"
+    assert api_format.wants_data("json") and not api_format.wants_data("html")
+
+def test_encodings_share_a_weak_etag(monkeypatch):
+    monkeypatch.setattr(api_format, "brotli", SimpleNamespace(compress=lambda body, quality: b"br" + body))
+    plain = api_format.data_response(_request(), PAYLOAD)
+    encoded = api_format.data_response(_request(accept_encoding="gzip, br"), PAYLOAD)
+    assert encoded.headers["Content-Encoding"] == "br" and "Content-Encoding" not in plain.headers
+    assert encoded.body != plain.body
+    assert plain.headers["ETag"].startswith("W/") and encoded.headers["ETag"] == plain.headers["ETag"]
+    assert encoded.headers["Vary"] == plain.headers["Vary"] == "Accept-Encoding"
+
+def test_revalidation_returns_304():
+    etag = api_format.data_response(_request(), PAYLOAD).headers["ETag"]
+    for sent in (etag, etag[2:], f'"other", {etag}', "*"):
+        r = api_format.data_response(_request(if_none_match=sent), PAYLOAD)
+        assert r.status_code == 304 and not r.body
+        assert r.headers["ETag"] == etag and r.headers["Vary"] == "Accept-Encoding"
+    assert api_format.data_response(_request(if_none_match='W/"other"'), PAYLOAD).status_code == 200
+
+def test_feed_page_revalidates(app, client):
+    video = {"platform_id": "fmt1", "title": "t", "author": "a", "views": 1, "likes": 1, "comments": 0,
+             "engagement_rate": 1.0, "video_url": "https://example.com/fmt1", "thumbnail_url": "", "published_at": ""}
+    app.feed_builder.publish(FeedSnapshot("v-format", time.time(), [video]))
+    for fmt in ("json", "msgpack", "html"):
+        first = client.get("/api/home/feed", params={"page": 1, "format": fmt})
+        assert first.status_code == 200
+        again = client.get("/api/home/feed", params={"page": 1, "format": fmt},
+                           headers={"If-None-Match": first.headers["ETag"]})
+        assert again.status_code == 304 and again.headers["ETag"] == first.headers["ETag"]
@@ -0,0 +1,38 @@
+from services.autocomplete import TOP_PER_PREFIX, QueryIndex
+
+def _queries(result):
+    return [s["query"] for s in result]
+
+def test_most_searched_queries_win_on_short_prefixes():
+    index = QueryIndex()
+    # Many rarely searched queries that sort before the popular one
+    for i in range(TOP_PER_PREFIX * 20):
+        index.add(f"aa{i:05d}", 1)
+    index.add("azure", 500)
+    assert _queries(index.suggest("a", limit=1)) == ["azure"]
+
+def test_recently_searched_cached_query_is_suggested():
+    index = QueryIndex()
+    for i in range(TOP_PER_PREFIX * 2):
+        index.add(f"food{i:03d}", 100)
+    index.record("food tips")
+    cached = {"food tips"}
+    result = index.suggest("f", limit=3, is_cached=lambda q: q in cached)
+    assert result[0] == {"query": "food tips", "cached": True, "searches": 1}
+
+def test_typed_tokens_match_in_any_order():
+    index = QueryIndex()
+    index.record("fitness gym")
+    index.record("gym")
+    assert "fitness gym" in _queries(index.suggest("gym fi"))
+    assert _queries(index.suggest("gym fi")) == ["fitness gym"]
+    # Russian spelling of a canonical token
+    assert "fitness gym" in _queries(index.suggest("фит"))
+
+def test_counts_rerank_existing_entries():
+    index = QueryIndex()
+    index.add("tech", 1)
+    index.add("tea", 5)
+    assert _queries(index.suggest("te")) == ["tea", "tech"]
+    index.add("tech", 10)
+    assert _queries(index.suggest("te")) == ["tech", "tea"]
@@ -0,0 +1,43 @@
+import threading
+
+from services.cache import LRUCache, decode_json_cached
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+
+def test_lru_is_safe_across_threads():
+    cache = LRUCache(maxsize=8)
+    errors = []
+
+    def hammer(offset):
+        try:
+            for i in range(5000):
+                key = (offset + i) % 16
+                cache.set(key, i)
+                cache.get(key)
+                cache.get((key + 1) % 16)
+        except Exception as e:  # KeyError when get() races an eviction
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [] and len(cache) <= 8
+
+def test_mutating_a_decoded_row_does_not_touch_the_cache():
+    key = ("test", 1, "2024-01-01")
+    first = decode_json_cached(key, '{"views": 10, "title": "t"}')
+    first["views"] = 0
+    del first["title"]
+    assert decode_json_cached(key, "") == {"views": 10, "title": "t"}
+
+    thumbs = decode_json_cached(("test", 2, "2024-01-01"), '["a", "b"]')
+    thumbs.append("c")
+    assert decode_json_cached(("test", 2, "2024-01-01"), "") == ["a", "b"]
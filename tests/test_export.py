@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from urllib.parse import unquote
+
+from services.query_normalize import canonical_query
+
+def _reels(n):
+    return [{"platform_id": str(i), "platform": "instagram", "title": f"Котики {i}", "author": "cats",
+             "views": 1000 - i, "likes": 10, "comments": 1, "engagement_rate": 1.1,
+             "video_url": f"https://example.com/{i}", "thumbnail_url": "", "published_at": "2024-01-01"}
+            for i in range(n)]
+
+def _cache_search(app, q, reels):
+    app.app_cache.set(app.search_cache_key(canonical_query(q), "all"), reels, ttl_seconds=300)
+
+def test_export_cyrillic_query_csv(app, client):
+    _cache_search(app, "котики", _reels(50))
+    r = client.get("/api/export/search", params={"q": "котики", "format": "csv"})
+    assert r.status_code == 200
+    disposition = r.headers["content-disposition"]
+    disposition.encode("latin-1")
+    assert 'filename="search' in disposition
+    encoded = disposition.split("filename*=UTF-8''", 1)[1]
+    assert unquote(encoded).startswith("search-котики-")
+    rows = list(csv.reader(io.StringIO(r.content.decode("utf-8-sig"))))
+    assert rows[0][:3] == ["platform_id", "platform", "title"]
+    assert len(rows) == 51 and rows[1][2] == "Котики 0"
+
+def test_export_search_ndjson(app, client):
+    _cache_search(app, "dogs", _reels(3))
+    r = client.get("/api/export/search", params={"q": "#Dogs", "format": "ndjson"})
+    assert r.status_code == 200
+    assert [json.loads(line)["platform_id"] for line in r.text.splitlines()] == ["0", "1", "2"]
+
+def test_export_requires_cached_pool_and_known_format(app, client):
+    assert client.get("/api/export/search", params={"q": "never searched"}).status_code == 404
+    _cache_search(app, "котики", _reels(1))
+    r = client.get("/api/export/search", params={"q": "котики", "format": "xml"})
+    assert r.status_code == 400 and "csv" in r.json()["formats"]
+
+def test_export_requires_login(app):
+    from fastapi.testclient import TestClient
+    assert TestClient(app.app).get("/api/export/favorites").status_code == 401
+
+def test_csv_neutralizes_formula_cells():
+    from services.export import to_csv
+    rows = [{"title": "=HYPERLINK(\"http://evil\")", "author": "@cats", "views": -5, "note": "plain"}]
+    text = b"".join(to_csv(rows, ["title", "author", "views", "note"])).decode("utf-8-sig")
+    row = list(csv.reader(io.StringIO(text)))[1]
+    assert row == ["'=HYPERLINK(\"http://evil\")", "'@cats", "-5", "plain"]
@@ -0,0 +1,113 @@
+import asyncio
+import re
+import time
+
+from services.cache import app_cache
+from services import feed_builder
+from services.feed_builder import FEED_PER_PAGE, FeedBuilder, FeedSnapshot
+
+def _video(i):
+    return {"platform_id": f"feed{i}", "platform": "instagram", "title": f"t{i}", "author": "a",
+            "views": 100, "likes": 1, "comments": 0, "engagement_rate": 1.0,
+            "video_url": f"https://example.com/feed/{i}", "thumbnail_url": "", "published_at": "2024-01-01"}
+
+def _sentinel(html):
+    return re.search(r'<div id="scroll-sentinel-\d+" class="scroll-sentinel"[^>]*>', html).group(0)
+
+def test_last_feed_page_marks_end(app, client):
+    app.feed_builder.publish(FeedSnapshot("v-test", time.time(), [_video(i) for i in range(FEED_PER_PAGE + 3)]))
+
+    first = _sentinel(client.get("/api/home/feed", params={"page": 1}).text)
+    assert 'data-next="/api/home/feed?v=v-test&amp;page=2"' in first
+    assert "data-end" not in first
+
+    last = _sentinel(client.get("/api/home/feed", params={"page": 2, "v": "v-test"}).text)
+    assert "data-end" in last and "data-next" not in last
+
+    data = client.get("/api/home/feed", params={"page": 2, "v": "v-test", "format": "json"}).json()
+    assert data["last_page"] is True and data["next_url"] is None
+
+def test_evicted_feed_version_ends_the_scroll(app, client):
+    app.feed_builder.publish(FeedSnapshot("v-current", time.time(), [_video(i) for i in range(FEED_PER_PAGE * 2)]))
+    r = client.get("/api/home/feed", params={"page": 2, "v": "v-gone"})
+    assert "feed2" not in r.text
+    assert "data-end" in _sentinel(r.text) and "loadHomeContent()" in r.text
+    data = client.get("/api/home/feed", params={"page": 2, "v": "v-gone", "format": "json"}).json()
+    assert data["restart"] is True and data["items"] == [] and data["next_url"] is None
+
+def test_feed_etag_changes_across_boots(app, client, monkeypatch):
+    app.feed_builder.publish(FeedSnapshot("v-etag", time.time(), [_video(i) for i in range(3)]))
+    before = client.get("/api/home/feed", params={"page": 1}).headers["ETag"]
+    monkeypatch.setattr(app, "BOOT_ID", "another-boot")
+    assert client.get("/api/home/feed", params={"page": 1}).headers["ETag"] != before
+
+def test_stale_feed_is_rebuilt_once_across_builders(tmp_path):
+    calls = []
+
+    async def search(keyword, timeframe, sort_by):
+        calls.append(keyword)
+        await asyncio.sleep(0.05)
+        return [_video(f"{keyword}{i}") for i in range(2)]
+
+    path = str(tmp_path / "feed.json")
+    # Two builders sharing a snapshot file stand in for two worker processes
+    builders = [FeedBuilder(search, keywords=["a", "b"], refresh_seconds=60, path=path) for _ in range(2)]
+
+    async def run():
+        for b in builders:
+            b.ensure_fresh()
+        await asyncio.gather(*(b._task for b in builders))
+        # The second builder found the lock taken; on its next request it picks up the file
+        for b in builders:
+            b.ensure_fresh()
+        await asyncio.gather(*(b._task for b in builders if b._task))
+
+    asyncio.run(run())
+    assert sorted(calls) == ["a", "b"]
+    assert builders[0].current.version == builders[1].current.version
+
+def test_last_search_and_anomalous_pages_mark_end(app, client):
+    pool = [_video(i) for i in range(15)]
+    app_cache.set(app.search_cache_key("fitness", "all"), list(pool), ttl_seconds=60)
+    app_cache.set("anomalous_3d_anomaly", list(pool), ttl_seconds=60)
+
+    for url, params in (("/api/search", {"q": "fitness"}), ("/api/anomalous", {})):
+        assert "data-end" not in _sentinel(client.get(url, params={**params, "page": 1}).text)
+        assert "data-end" in _sentinel(client.get(url, params={**params, "page": 2}).text)
+        # Past the end (e.g. a stale prefetch): still an end marker, never another empty request
+        assert "data-end" in _sentinel(client.get(url, params={**params, "page": 3}).text)
+
+def test_failed_builds_back_off(monkeypatch):
+    calls = []
+
+    async def failing(keyword, timeframe, sort_by):
+        calls.append(keyword)
+        raise RuntimeError("upstream down")
+
+    builder = FeedBuilder(failing, keywords=["a"], refresh_seconds=60, path="")
+    clock = [1000.0]
+    monkeypatch.setattr(feed_builder.time, "time", lambda: clock[0])
+
+    async def request():
+        builder.ensure_fresh()
+        if builder._task:
+            await builder._task
+
+    async def run():
+        await request()
+        assert builder.retry_delay == feed_builder.FEED_RETRY_SECONDS
+        await request()  # Within the cooldown: no new build
+        assert calls == ["a"]
+        clock[0] += feed_builder.FEED_RETRY_SECONDS
+        await request()
+        assert calls == ["a", "a"] and builder.retry_delay == 2 * feed_builder.FEED_RETRY_SECONDS
+
+    asyncio.run(run())
+
+def test_cold_feed_renders_a_polling_sentinel(app, client, monkeypatch):
+    async def pending(keyword, timeframe, sort_by):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(app, "feed_builder", FeedBuilder(pending, keywords=["a"], path=""))
+    sentinel = _sentinel(client.get("/api/home/feed", params={"page": 1}).text)
+    assert 'data-poll="/api/home/feed?page=1"' in sentinel and "data-end" not in sentinel
@@ -0,0 +1,131 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlmodel import Session
+
+from core.database import engine
+from models.database import AnalysisJob, User
+from services import auth
+from services.job_queue import JobQueue, QueueFullError
+
+def _user(tokens=100, role="user"):
+    with Session(engine) as session:
+        user = User(email=f"{uuid.uuid4().hex}@test", name="Jobs", password_hash="x", role=role, tokens=tokens)
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        return user
+
+def _tokens(user_id):
+    with Session(engine) as session:
+        return session.get(User, user_id).tokens
+
+def _request():
+    from starlette.requests import Request
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+
+def test_failed_profile_report_renders_error_state(app):
+    job = AnalysisJob(id=1, user_id=1, kind="profile_report", status="failed", error="boom")
+    response = app.render_job(_request(), None, job)
+    assert response.status_code == 200
+    assert "не удался" in response.body.decode()
+
+def test_failed_job_refunds_tokens(app):
+    user = _user(tokens=30)
+
+    async def ok():
+        return {"fine": True}
+
+    async def broken():
+        raise RuntimeError("upstream down")
+
+    with Session(engine) as session:
+        assert auth.deduct_tokens(session.get(User, user.id), app.ANALYSIS_COST, session)
+    assert asyncio.run(app.refund_on_failure(user.id, app.ANALYSIS_COST, ok)()) == {"fine": True}
+    assert _tokens(user.id) == 20
+    with Session(engine) as session:
+        assert auth.deduct_tokens(session.get(User, user.id), app.ANALYSIS_COST, session)
+    with pytest.raises(RuntimeError):
+        asyncio.run(app.refund_on_failure(user.id, app.ANALYSIS_COST, broken)())
+    assert _tokens(user.id) == 20
+
+def test_queued_jobs_cannot_overspend(app, client):
+    user = _user(tokens=25)
+    client.cookies.clear()
+    auth._sessions["two-jobs"] = {"user_id": user.id, "expires_at": float("inf")}
+    client.cookies.set(auth.SESSION_COOKIE_NAME, "two-jobs")
+    statuses = [client.post("/api/profile-report", data={"username": f"someone{i}"}).status_code for i in range(4)]
+    assert statuses.count(402) == 2
+    assert _tokens(user.id) == 5
+
+def test_profile_report_requires_tokens(app, client):
+    user = _user(tokens=5)
+    client.cookies.clear()
+    auth._sessions["broke"] = {"user_id": user.id, "expires_at": float("inf")}
+    client.cookies.set(auth.SESSION_COOKIE_NAME, "broke")
+    r = client.post("/api/profile-report", data={"username": "someone"})
+    assert r.status_code == 402
+    assert _tokens(user.id) == 5
+
+def test_priority_classes():
+    assert JobQueue.priority_for(User(email="a", name="a", password_hash="", role="admin")) == 0
+    assert JobQueue.priority_for(User(email="u", name="u", password_hash="", role="user")) == 1
+
+def _login(client, user, sid):
+    client.cookies.clear()
+    auth._sessions[sid] = {"user_id": user.id, "expires_at": float("inf")}
+    client.cookies.set(auth.SESSION_COOKIE_NAME, sid)
+
+def test_identical_jobs_charge_only_the_first(app, client):
+    first, second = _user(tokens=30), _user(tokens=30)
+    username = f"shared{uuid.uuid4().hex[:8]}"
+    _login(client, first, "coalesce-1")
+    assert client.post("/api/profile-report", data={"username": username}).status_code == 200
+    _login(client, second, "coalesce-2")
+    assert client.post("/api/profile-report", data={"username": "@" + username.upper()}).status_code == 200
+    assert (_tokens(first.id), _tokens(second.id)) == (20, 30)
+
+def test_per_user_queue_cap():
+    queue = JobQueue(max_per_user=2)
+    busy, other = _user(), _user()
+
+    async def fn():
+        return {}
+
+    async def run():
+        for _ in range(2):
+            await queue.submit(busy, "video", fn)
+        with pytest.raises(QueueFullError):
+            await queue.submit(busy, "video", fn)
+        await queue.submit(other, "video", fn)
+
+    asyncio.run(run())
+
+def test_follower_gets_the_leaders_result():
+    queue = JobQueue(workers=1)
+    leader_user, follower_user = _user(), _user()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"hook": "x"}
+
+    async def run():
+        await queue.start()
+        try:
+            leader, created = await queue.submit(leader_user, "video", fn, key=("video", "same"))
+            follower, joined = await queue.submit(follower_user, "video", fn, key=("video", "same"))
+            assert created and not joined
+            assert queue.position(follower) == queue.position(leader)
+            while (await queue.get(follower)).status != "done":
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+        return await queue.get(leader), await queue.get(follower)
+
+    leader_job, follower_job = asyncio.run(run())
+    assert calls == [1]
+    assert follower_job.user_id == follower_user.id and follower_job.result == leader_job.result
+    assert not queue._groups and not queue._follows
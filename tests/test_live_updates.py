@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.admission import AdmissionController
+from services.live_updates import BoundedSet, LiveHub, LiveLimitError, Subscription
+
+class FakeScanner:
+    """Returns a fresh batch of reels per call and counts the calls."""
+    def __init__(self, per_scan=2):
+        self.per_scan = per_scan
+        self.calls = 0
+
+    async def __call__(self, name):
+        self.calls += 1
+        start = (self.calls - 1) * self.per_scan
+        return [{"platform_id": f"{name}{i}", "video_url": ""} for i in range(start, start + self.per_scan)]
+
+def _user(i, role="user"):
+    return SimpleNamespace(id=i, role=role)
+
+def test_one_scan_fans_out_to_every_subscriber():
+    async def run():
+        scanner = FakeScanner()
+        hub = LiveHub(scan_seconds=3600)
+        hub.register("radar", scanner)
+        subs = [hub.subscribe([("radar", "fitness")]) for _ in range(5)]
+        events = await asyncio.gather(*(s.get(1) for s in subs))
+        await hub.stop()
+        return scanner.calls, events
+
+    calls, events = asyncio.run(run())
+    assert calls == 1
+    assert all(e["topic"] == "fitness" and len(e["reels"]) == 2 for e in events)
+
+def test_slow_subscriber_loses_the_oldest_events():
+    sub = Subscription([("radar", "x")], maxsize=3)
+    for i in range(5):
+        sub.put({"n": i})
+    assert sub.dropped == 2
+    assert [sub.queue.get_nowait()["n"] for _ in range(3)] == [2, 3, 4]
+
+def test_scans_take_an_admission_slot_of_a_subscriber():
+    async def run():
+        admission = AdmissionController(slots=4, per_user=1)
+        seen_inflight = []
+
+        async def scanner(name):
+            seen_inflight.append(admission.inflight)
+            return []
+
+        hub = LiveHub(scan_seconds=3600, admission=admission)
+        hub.register("spy", scanner)
+        hub.subscribe([("spy", "nike")], _user(1))
+        await asyncio.sleep(0.01)
+        await hub.stop()
+        return seen_inflight
+
+    assert asyncio.run(run()) == [1]
+
+def test_topics_and_streams_per_user_are_capped():
+    async def run():
+        hub = LiveHub(scan_seconds=3600, max_topics=2, streams_per_user=1)
+        hub.register("radar", FakeScanner())
+        user = _user(7)
+        sub = hub.subscribe([("radar", k) for k in "abcd"], user)
+        assert hub.topic_count == 2
+        with pytest.raises(LiveLimitError):
+            hub.subscribe([("radar", "a")], user)
+        hub.unsubscribe(sub)
+        assert hub.topic_count == 0
+        hub.unsubscribe(hub.subscribe([("radar", "a")], user))
+        await hub.stop()
+
+    asyncio.run(run())
+
+def test_bounded_set_forgets_oldest():
+    seen = BoundedSet(maxsize=3)
+    for k in "abcd":
+        seen.add(k)
+    assert "a" not in seen and "d" in seen and len(seen) == 3
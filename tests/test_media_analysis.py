@@ -0,0 +1,157 @@
+import asyncio
+import shutil
+import socket
+import subprocess
+
+import pytest
+
+from services import media_utils
+from services.ai_agent import AIAgent
+from services.media_utils import MediaUtils
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class RecordingModel:
+    """Stands in for the Gemini model: records what it was sent."""
+    def __init__(self):
+        self.calls = []
+
+    def generate_content(self, contents):
+        self.calls.append(contents)
+        return FakeResponse('{"visual_hook": "hook", "summary": "s"}')
+
+@pytest.fixture
+def agent():
+    return AIAgent(model=RecordingModel(), persist=False, media_analysis=True)
+
+def test_media_analysis_sends_transcript_and_keyframes(agent, monkeypatch, tmp_path):
+    frame = tmp_path / "001.jpg"
+    frame.write_bytes(b"\xff\xd8jpeg")
+    seen = []
+
+    async def fake_process(url):
+        seen.append(url)
+        return {"transcript": "три совета для роста", "keyframes": [str(frame)]}
+
+    monkeypatch.setattr(MediaUtils, "process_async", staticmethod(fake_process))
+    video = {"platform_id": "m1", "video_url": "https://cdn.example.com/reel.mp4"}
+    result = asyncio.run(agent.analyze_video(video))
+
+    assert result["visual_hook"] == "hook"
+    assert seen == ["https://cdn.example.com/reel.mp4"]
+    prompt, image = agent.model.calls[0]
+    assert "три совета для роста" in prompt
+    assert image == {"mime_type": "image/jpeg", "data": b"\xff\xd8jpeg"}
+
+def test_media_failure_falls_back_to_metadata(agent, monkeypatch):
+    async def broken(url):
+        raise RuntimeError("ffmpeg missing")
+
+    monkeypatch.setattr(MediaUtils, "process_async", staticmethod(broken))
+    asyncio.run(agent.analyze_video({"platform_id": "m2", "video_url": "https://cdn.example.com/x.mp4"}))
+    assert isinstance(agent.model.calls[0], str)
+
+def test_non_http_video_url_is_never_fetched(agent, monkeypatch):
+    async def fail(url):
+        raise AssertionError("must not be called")
+
+    monkeypatch.setattr(MediaUtils, "process_async", staticmethod(fail))
+    asyncio.run(agent.analyze_video({"platform_id": "m3", "video_url": "/etc/passwd"}))
+    assert isinstance(agent.model.calls[0], str)
+
+@pytest.mark.parametrize("source", ["/etc/passwd", "file:///etc/passwd", "ftp://example.com/a.mp4",
+                                    "https://example.com/a.mp4", "http://scontent.cdninstagram.com/a.mp4",
+                                    "https://127.0.0.1/a.mp4", "https://evil.com/.cdninstagram.com/a.mp4"])
+def test_download_rejects_disallowed_urls(source):
+    with pytest.raises(ValueError):
+        MediaUtils.download(source)
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "169.254.169.254", "10.0.0.5", "::1"])
+def test_download_rejects_allowed_hosts_resolving_to_private_addresses(monkeypatch, address):
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    monkeypatch.setattr(media_utils.socket, "getaddrinfo",
+                        lambda *a, **kw: [(family, socket.SOCK_STREAM, 6, "", (address, 443))])
+    with pytest.raises(ValueError):
+        MediaUtils.download("https://scontent.cdninstagram.com/v/reel.mp4")
+
+def test_repeat_download_is_served_from_the_url_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(media_utils, "MEDIA_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(media_utils.socket, "getaddrinfo",
+                        lambda *a, **kw: [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("157.240.1.1", 443))])
+    downloads = []
+
+    def fake_stream(url, dest):
+        downloads.append(url)
+        with open(dest, "wb") as f:
+            f.write(b"fake mp4 bytes")
+        return dest
+
+    monkeypatch.setattr(MediaUtils, "_stream_download", staticmethod(fake_stream))
+    first = MediaUtils.download("https://scontent.cdninstagram.com/v/reel.mp4?oh=sig1")
+    # Same file behind a re-signed CDN URL: no second download
+    second = MediaUtils.download("https://scontent.cdninstagram.com/v/reel.mp4?oh=sig2")
+    assert first == second
+    assert len(downloads) == 1
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_pipeline_on_a_generated_sample(monkeypatch, tmp_path):
+    monkeypatch.setattr(media_utils, "MEDIA_CACHE_DIR", str(tmp_path / "media"))
+    sample = tmp_path / "sample.mp4"
+    subprocess.run(["ffmpeg", "-y", "-v", "error",
+                    "-f", "lavfi", "-i", "testsrc=duration=3:size=320x240:rate=10",
+                    "-f", "lavfi", "-i", "sine=frequency=440:duration=3",
+                    "-g", "10", "-shortest", "-pix_fmt", "yuv420p", str(sample)], check=True)
+
+    video_path = MediaUtils.import_file(str(sample))
+    assert MediaUtils.import_file(str(sample)) == video_path
+
+    audio_path = MediaUtils.extract_audio(video_path)
+    assert audio_path and open(audio_path, "rb").read(4) == b"RIFF"
+
+    frames = MediaUtils.extract_keyframes(video_path, max_frames=5)
+    assert 1 <= len(frames) <= 5
+    assert all(open(f, "rb").read(2) == b"\xff\xd8" for f in frames)
+
+def _failing_ffmpeg(args):
+    """Stands in for an ffmpeg run that writes part of its output, then dies."""
+    out = args[-1]
+    with open(out.replace("%03d", "001"), "wb") as f:
+        f.write(b"partial")
+    return False
+
+def test_failed_extraction_leaves_no_output_to_reuse(monkeypatch, tmp_path):
+    video = tmp_path / "abc" / "video.mp4"
+    video.parent.mkdir()
+    video.write_bytes(b"mp4")
+    monkeypatch.setattr(MediaUtils, "_run_ffmpeg", staticmethod(_failing_ffmpeg))
+
+    assert MediaUtils.extract_audio(str(video)) is None
+    assert MediaUtils.extract_keyframes(str(video)) == []
+    assert sorted(p.name for p in video.parent.iterdir()) == ["video.mp4"]
+
+def test_speech_model_is_loaded_once_per_process(monkeypatch, tmp_path):
+    import sys
+    import types
+
+    loads = []
+
+    class Segment:
+        text = " hello "
+
+    class WhisperModel:
+        def __init__(self, *args, **kwargs):
+            loads.append(args)
+
+        def transcribe(self, path):
+            return [Segment()], None
+
+    monkeypatch.setitem(sys.modules, "faster_whisper", types.SimpleNamespace(WhisperModel=WhisperModel))
+    monkeypatch.setattr(media_utils, "_whisper", None)
+    for name in ["a", "b"]:
+        audio = tmp_path / name / "audio.wav"
+        audio.parent.mkdir()
+        audio.write_bytes(b"RIFF")
+        assert MediaUtils.transcribe_audio(str(audio)) == "hello"
+    assert len(loads) == 1
@@ -0,0 +1,43 @@
+import threading
+
+from services import rapidapi_service
+from services.metrics import MetricsRegistry, RAPIDAPI_LATENCY
+
+def test_render_while_threads_add_label_sets():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_requests_total", "t", ("key",))
+    histogram = registry.histogram("test_latency_seconds", "t", ("key",))
+    stop = threading.Event()
+
+    def writer(prefix):
+        # A fixed label set keeps memory flat; the early loops still add new series mid-render
+        for i in range(20000):
+            if stop.is_set():
+                break
+            counter.inc(key=f"{prefix}{i % 50}")
+            histogram.observe(0.01, key=f"{prefix}{i % 50}")
+
+    threads = [threading.Thread(target=writer, args=(p,)) for p in "abcd"]
+    for t in threads:
+        t.start()
+    try:
+        for _ in range(50):
+            registry.render_prometheus()
+            registry.summary()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert "test_latency_seconds_count" in registry.render_prometheus()
+
+def test_rapidapi_latency_labels_are_bounded(monkeypatch):
+    class Response:
+        status_code = 500
+
+    monkeypatch.setattr(rapidapi_service.requests, "post", lambda *a, **kw: Response())
+    seed = next(iter(rapidapi_service.SEED_ACCOUNTS))
+    for username in [seed, "some_user_1", "some_user_2"]:
+        rapidapi_service.fetch_reels_page_sync(username)
+    accounts = {key[0] for key, _ in RAPIDAPI_LATENCY.items()}
+    assert seed in accounts and "other" in accounts
+    assert not accounts & {"some_user_1", "some_user_2"}
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from services import profile_service, rapidapi_service
+from services.profile_service import ProfileFetchError, ProfileService, compute_profile_stats
+
+class FakeAgent:
+    model = None
+
+def _reel(pk, views=100, likes=10, comments=1, published_at="2024-01-01T00:00:00"):
+    return {"platform_id": str(pk), "views": views, "likes": likes, "comments": comments,
+            "engagement_rate": round((likes + comments) / views * 100, 2), "published_at": published_at}
+
+class FakeAccount:
+    """Pages of 3 reels, newest first, chained by maxId; `fail` makes page fetches raise."""
+    def __init__(self, pks):
+        self.pks = sorted(pks, reverse=True)
+        self.requests = []
+        self.fail = False
+
+    def fetch(self, username, max_id="", timeframe_days=None):
+        self.requests.append(max_id)
+        if self.fail:
+            raise rapidapi_service.RapidAPIError("HTTP 500")
+        start = int(max_id or 0)
+        page = [_reel(pk) for pk in self.pks[start:start + 3]]
+        return page, str(start + 3) if start + 3 < len(self.pks) else ""
+
+@pytest.fixture
+def account(monkeypatch):
+    fake = FakeAccount(range(1, 8))
+    monkeypatch.setattr(rapidapi_service, "fetch_reels_page", fake.fetch)
+    return fake
+
+@pytest.fixture
+def service():
+    return ProfileService(ai_agent=FakeAgent())
+
+def test_first_scan_pages_through_the_history(service, account):
+    reels = asyncio.run(service.get_reels("@Acc"))
+    assert [r["platform_id"] for r in reels] == ["7", "6", "5", "4", "3", "2", "1"]
+    assert account.requests == ["", "3", "6"]
+
+def test_refresh_stops_at_the_newest_known_reel(service, account, monkeypatch):
+    asyncio.run(service.get_reels("acc"))
+    account.pks = [9, 8] + account.pks
+    account.requests.clear()
+    monkeypatch.setattr(profile_service, "PROFILE_REFRESH_SECONDS", 0)
+    reels = asyncio.run(service.get_reels("acc"))
+    assert [r["platform_id"] for r in reels][:3] == ["9", "8", "7"] and len(reels) == 9
+    assert account.requests == [""]
+
+def test_failed_first_scan_raises_and_is_not_cached(service, account):
+    account.fail = True
+    with pytest.raises(ProfileFetchError):
+        asyncio.run(service.get_reels("acc"))
+    account.fail = False
+    assert len(asyncio.run(service.get_reels("acc"))) == 7
+
+def test_failed_refresh_serves_the_cached_history(service, account, monkeypatch):
+    asyncio.run(service.get_reels("acc"))
+    monkeypatch.setattr(profile_service, "PROFILE_REFRESH_SECONDS", 0)
+    account.fail = True
+    assert len(asyncio.run(service.get_reels("acc"))) == 7
+
+def test_history_and_locks_are_bounded(account, monkeypatch):
+    monkeypatch.setattr(profile_service, "PROFILE_CACHE_ACCOUNTS", 2)
+    service = ProfileService(ai_agent=FakeAgent())
+    for name in ["a", "b", "c"]:
+        asyncio.run(service.get_reels(name))
+    assert len(service._history) == 2 and service._locks == {}
+
+def test_profile_stats():
+    reels = [_reel(1, views=100, likes=1, comments=0, published_at="2024-01-01T00:00:00"),
+             _reel(2, views=300, likes=12, comments=0, published_at="2024-01-03T00:00:00"),
+             _reel(3, views=1000, likes=150, comments=0, published_at="2024-01-08T00:00:00")]
+    stats = compute_profile_stats(reels)
+    assert stats["video_count"] == 3 and stats["total_views"] == 1400
+    assert stats["avg_views"] == 467 and stats["median_views"] == 300
+    assert [b["count"] for b in stats["er_distribution"]] == [0, 1, 1, 0, 1]
+    assert stats["cadence_days"] == 3.5
+    assert compute_profile_stats([])["avg_views"] == 0
+
+def test_failed_scan_is_not_charged(app, client, monkeypatch):
+    from models.database import User
+    from sqlmodel import Session, select
+
+    async def fail(username):
+        raise ProfileFetchError("down")
+
+    monkeypatch.setattr(app.profile_service, "get_profile", fail)
+    with Session(app.engine) as session:
+        before = session.exec(select(User).where(User.role == "admin")).first().tokens
+    r = client.post("/api/analyze-profile", data={"username": "someone"})
+    assert "Не удалось загрузить профиль" in r.text
+    with Session(app.engine) as session:
+        assert session.exec(select(User).where(User.role == "admin")).first().tokens == before
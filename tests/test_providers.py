@@ -0,0 +1,64 @@
+import asyncio
+import uuid
+
+from sqlmodel import Session
+
+from core.database import engine
+from models.database import Video
+from services import providers
+from services.providers import LocalDBProvider, ReelsProvider, dedup_key, fan_out_search, normalize_reel
+
+class StaticProvider(ReelsProvider):
+    def __init__(self, name, reels, delay=0.0, primary=False):
+        self.name, self.reels, self.delay, self.primary = name, reels, delay, primary
+
+    async def search(self, query, days, sort_by, count):
+        await asyncio.sleep(self.delay)
+        return self.reels
+
+def _reel(code, views=10, **extra):
+    return {"platform_id": code, "video_url": f"https://www.instagram.com/reel/{code}/", "views": views, **extra}
+
+def test_dedup_key_prefers_the_shortcode():
+    assert dedup_key({"video_url": "https://www.instagram.com/reel/AbC_1/", "platform_id": "123_456"}) == "AbC_1"
+    assert dedup_key({"video_url": "https://www.instagram.com/someone/", "platform_id": "123_456"}) == "123"
+    assert dedup_key({"video_url": "https://www.instagram.com/someone/"}) == ""
+
+def test_normalize_reel_fills_and_coerces():
+    reel = normalize_reel({"platform_id": 5, "views": "200", "likes": None, "comments": "x"})
+    assert reel["platform_id"] == "5" and reel["views"] == 200 and reel["likes"] == 0 and reel["comments"] == 0
+    assert reel["title"] == "" and reel["platform"] == "instagram"
+
+def test_duplicates_keep_the_freshest_metrics():
+    merged = asyncio.run(fan_out_search([StaticProvider("a", [_reel("x", views=10)], primary=True),
+                                         StaticProvider("b", [_reel("x", views=50)])], "q", count=10))
+    assert [r["views"] for r in merged] == [50]
+
+def test_reels_without_a_key_are_not_merged():
+    profile = "https://www.instagram.com/someone/"
+    unkeyed = [{"video_url": profile, "views": v} for v in (1, 2, 3)]
+    merged = asyncio.run(fan_out_search([StaticProvider("a", unkeyed, primary=True)], "q", count=10))
+    assert sorted(r["views"] for r in merged) == [1, 2, 3]
+
+def test_secondary_source_never_cuts_the_primary_short():
+    local = StaticProvider("localdb", [_reel(f"l{i}") for i in range(5)])
+    api = StaticProvider("rapidapi", [_reel(f"r{i}", views=100) for i in range(5)], delay=0.05, primary=True)
+    merged = asyncio.run(fan_out_search([local, api], "q", count=5))
+    assert {r["platform_id"] for r in merged} == {f"r{i}" for i in range(5)}
+
+def test_slow_secondary_is_cancelled_once_the_primary_filled_the_pool():
+    api = StaticProvider("rapidapi", [_reel(f"r{i}") for i in range(5)], primary=True)
+    slow = StaticProvider("apify", [_reel("late")], delay=5)
+    merged = asyncio.run(asyncio.wait_for(fan_out_search([api, slow], "q", count=5), 1))
+    assert len(merged) == 5
+
+def test_localdb_is_opt_in_and_matches_stored_reels(app):
+    assert [p.name for p in providers.get_providers()] == ["rapidapi"]
+    word = uuid.uuid4().hex[:10]
+    with Session(engine) as session:
+        session.add(Video(platform_id="9", platform="instagram", title=f"best {word} tips", author="a",
+                          thumbnail_url="", video_url="https://www.instagram.com/reel/LOC9/", views=7))
+        session.commit()
+    found = asyncio.run(LocalDBProvider().search(word, None, "views", 10))
+    assert [r["video_url"] for r in found] == ["https://www.instagram.com/reel/LOC9/"]
+    assert asyncio.run(LocalDBProvider().search(word, 7, "views", 10)) == []
@@ -0,0 +1,28 @@
+import asyncio
+
+from services import rapidapi_service
+from services.query_normalize import canonical_query, filter_terms
+
+def test_filter_terms_cover_every_spelling():
+    assert filter_terms("фитнес") == filter_terms("Fitness") == {"fitness", "фитнес"}
+    assert filter_terms("#Котики!") == {"котики"}
+
+def test_canonical_search_keeps_captions_in_the_typed_language(monkeypatch):
+    reels = [{"platform_id": str(i), "transcript": caption, "author": "someone", "views": i}
+             for i, caption in enumerate(["Фитнес дома"] * 5 + ["fitness at home"] * 5 + ["cooking"] * 5)]
+
+    async def fetch(accounts, spares, timeframe_days, want):
+        return rapidapi_service.SearchResults(reels)
+
+    monkeypatch.setattr(rapidapi_service, "RAPIDAPI_KEY", "test")
+    monkeypatch.setattr(rapidapi_service, "_fetch_accounts_with_deadline", fetch)
+    found = asyncio.run(rapidapi_service.search_reels_by_keyword_async(canonical_query("фитнес")))
+    assert {r["transcript"] for r in found} == {"Фитнес дома", "fitness at home"}
+
+def test_radar_remove_matches_canonically(app, client):
+    app._radar_keywords[:] = []
+    client.post("/api/radar/add", data={"keyword": "Фитнес"})
+    client.post("/api/radar/add", data={"keyword": "#fitness"})
+    assert app._radar_keywords == ["Фитнес"]
+    client.post("/api/radar/remove", data={"keyword": "fitness"})
+    assert app._radar_keywords == []
@@ -0,0 +1,28 @@
+from services.rapidapi_normalize import normalize_reels
+
+def test_each_item_uses_its_own_key_convention():
+    data = {"items": [
+        {"pk": "1", "like_count": 10, "comment_count": 1, "play_count": 500, "code": "snake"},
+        {"pk": "2", "likeCount": 20, "commentCount": 2, "playCount": 900, "shortCode": "camel"},
+    ]}
+    snake, camel = normalize_reels(data, "acc")
+    assert (snake["views"], snake["likes"], snake["video_url"]) == (500, 10, "https://www.instagram.com/reel/snake/")
+    assert (camel["views"], camel["likes"], camel["video_url"]) == (900, 20, "https://www.instagram.com/reel/camel/")
+
+def test_missing_field_falls_back_to_the_other_convention():
+    # Detected as camel (likeCount), but views only come in snake_case
+    reel, = normalize_reels([{"pk": "3", "likeCount": 5, "play_count": 400}], "acc")
+    assert reel["views"] == 400
+
+def test_zero_views_next_to_likes_are_estimated():
+    reel, = normalize_reels([{"pk": "4", "like_count": 5, "play_count": 0}], "acc")
+    assert reel["views"] == 15 and reel["engagement_rate"] < 100
+    untouched, = normalize_reels([{"pk": "5", "like_count": 0, "play_count": 0}], "acc")
+    assert untouched["views"] == 0 and untouched["engagement_rate"] == 0
+
+def test_malformed_item_does_not_drop_the_page():
+    data = [{"pk": "5", "like_count": 1, "play_count": 10},
+            {"pk": "6", "like_count": "lots", "play_count": 10},
+            {"pk": "7", "like_count": 2, "play_count": 20, "image_versions2": {"candidates": ["bad"]}},
+            {"pk": "8", "like_count": 3, "play_count": 30}]
+    assert [r["platform_id"] for r in normalize_reels(data, "acc")] == ["5", "8"]
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services import rapidapi_service
+from services.providers import ReelsProvider, fan_out_search
+
+def _reels(username, n=3):
+    return [{"platform_id": f"{username}-{i}", "author": username, "views": i} for i in range(n)]
+
+def test_hedge_and_original_fill_one_slot(monkeypatch):
+    monkeypatch.setattr(rapidapi_service, "SEARCH_DEADLINE", 2.0)
+    monkeypatch.setattr(rapidapi_service, "HEDGE_AFTER", 0.05)
+
+    def fetch(username, max_id, timeframe_days, timeout=10):
+        # The original account is slow but still answers before the deadline
+        time.sleep(0.3 if username == "slow" else 0.1)
+        return _reels(username), ""
+
+    monkeypatch.setattr(rapidapi_service, "fetch_reels_page", fetch)
+    results = asyncio.run(rapidapi_service._fetch_accounts_with_deadline(["slow"], ["spare"], None, want=100))
+    assert {r["author"] for r in results} == {"spare"}
+    assert len(results) == 3
+    assert not results.partial
+
+def test_deadline_marks_results_partial(monkeypatch):
+    monkeypatch.setattr(rapidapi_service, "SEARCH_DEADLINE", 0.1)
+
+    def fetch(username, max_id, timeframe_days, timeout=10):
+        time.sleep(0.5 if username == "stuck" else 0)
+        return _reels(username), ""
+
+    monkeypatch.setattr(rapidapi_service, "fetch_reels_page", fetch)
+    results = asyncio.run(rapidapi_service._fetch_accounts_with_deadline(["fast", "stuck"], [], None, want=100))
+    assert {r["author"] for r in results} == {"fast"}
+    assert results.partial
+
+def test_hedges_do_not_queue_behind_the_calls_they_hedge(monkeypatch):
+    monkeypatch.setattr(rapidapi_service, "SEARCH_DEADLINE", 1.0)
+    monkeypatch.setattr(rapidapi_service, "HEDGE_AFTER", 0.05)
+    # One account worker, held by the slow original
+    monkeypatch.setattr(rapidapi_service, "account_executor", ThreadPoolExecutor(max_workers=1))
+    release = threading.Event()
+
+    def fetch(username, max_id, timeframe_days, timeout=10):
+        if username == "slow":
+            release.wait(2)
+        return _reels(username), ""
+
+    monkeypatch.setattr(rapidapi_service, "fetch_reels_page", fetch)
+    try:
+        results = asyncio.run(rapidapi_service._fetch_accounts_with_deadline(["slow"], ["spare"], None, want=100))
+    finally:
+        release.set()
+    assert {r["author"] for r in results} == {"spare"} and not results.partial
+
+def test_without_spares_the_same_account_is_hedged(monkeypatch):
+    monkeypatch.setattr(rapidapi_service, "SEARCH_DEADLINE", 1.0)
+    monkeypatch.setattr(rapidapi_service, "HEDGE_AFTER", 0.05)
+    calls = []
+
+    def fetch(username, max_id, timeframe_days, timeout=10):
+        calls.append(username)
+        # The first request hangs, the retry answers at once
+        time.sleep(0.5 if len(calls) == 1 else 0)
+        return _reels(username), ""
+
+    monkeypatch.setattr(rapidapi_service, "fetch_reels_page", fetch)
+    results = asyncio.run(rapidapi_service._fetch_accounts_with_deadline(["only"], [], None, want=100))
+    assert calls == ["only", "only"]
+    assert len(results) == 3 and not results.partial
+
+def test_failed_account_leaves_its_slot_to_the_hedge(monkeypatch):
+    monkeypatch.setattr(rapidapi_service, "SEARCH_DEADLINE", 1.0)
+    monkeypatch.setattr(rapidapi_service, "HEDGE_AFTER", 0.05)
+
+    def fetch(username, max_id, timeframe_days, timeout=10):
+        if username == "broken":
+            raise rapidapi_service.RapidAPIError("HTTP 500")
+        time.sleep(0.1)
+        return _reels(username), ""
+
+    monkeypatch.setattr(rapidapi_service, "fetch_reels_page", fetch)
+    results = asyncio.run(rapidapi_service._fetch_accounts_with_deadline(["broken"], ["spare"], None, want=100))
+    assert {r["author"] for r in results} == {"spare"} and not results.partial
+
+class StaticProvider(ReelsProvider):
+    def __init__(self, name, reels, partial=False, delay=0.0, deadline=1.0):
+        self.name, self.reels, self.partial, self.delay, self.deadline = name, reels, partial, delay, deadline
+
+    async def search(self, query, days, sort_by, count):
+        await asyncio.sleep(self.delay)
+        return rapidapi_service.SearchResults(self.reels, partial=self.partial)
+
+def test_fan_out_reports_partial_pools():
+    full = asyncio.run(fan_out_search([StaticProvider("a", _reels("a"))], "q", count=100))
+    assert not full.partial
+    timed_out = asyncio.run(fan_out_search([StaticProvider("a", _reels("a")),
+                                            StaticProvider("b", _reels("b"), delay=0.2, deadline=0.05)], "q", count=100))
+    assert len(timed_out) == 3 and timed_out.partial
+    cut = asyncio.run(fan_out_search([StaticProvider("a", _reels("a"), partial=True)], "q", count=100))
+    assert cut.partial
+    # Enough reels despite a cut-short source: cached as usual
+    enough = asyncio.run(fan_out_search([StaticProvider("a", _reels("a"), partial=True)], "q", count=2))
+    assert not enough.partial
@@ -0,0 +1,14 @@
+import pytest
+
+from services.static_assets import static_url
+
+def test_hashed_url_is_immutable(client):
+    r = client.get(static_url("css/style.css"))
+    assert r.status_code == 200
+    assert "immutable" in r.headers["Cache-Control"]
+
+@pytest.mark.parametrize("query", ["", "?nav=1", "?dev=abc", "?v=000000000000", "?v="])
+def test_other_urls_revalidate(client, query):
+    r = client.get("/static/css/style.css" + query)
+    assert r.status_code == 200
+    assert r.headers["Cache-Control"] == "public, no-cache"
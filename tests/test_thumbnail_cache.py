@@ -0,0 +1,93 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from services import thumbnail_cache as thumbs
+from services.thumbnail_cache import ThumbnailCache
+
+URL = "https://scontent.cdninstagram.com/v/t51/thumb.jpg?oh=sig"
+
+def _jpeg(width=800, height=1000):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), "orange").save(out, format="JPEG")
+    return out.getvalue()
+
+class FakeResponse:
+    def __init__(self, body, status=200, headers=None):
+        self.body, self.status_code, self.headers = body, status, headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Serves `upstream.body` for every request and records the requested URLs."""
+    class Upstream:
+        body = _jpeg()
+        status = 200
+        requests = []
+
+    def fake_get(url, **kwargs):
+        assert kwargs.get("stream") and kwargs.get("allow_redirects") is False
+        Upstream.requests.append(url)
+        return FakeResponse(Upstream.body, Upstream.status)
+
+    Upstream.requests = []
+    monkeypatch.setattr(thumbs.requests, "get", fake_get)
+    return Upstream
+
+def test_miss_then_hit(tmp_path, upstream):
+    cache = ThumbnailCache(str(tmp_path))
+    path, media_type = cache.get(URL, 360)
+    assert media_type == "image/jpeg"
+    with Image.open(path) as img:
+        assert img.width == 360
+    # A re-signed URL for the same image is a hit
+    assert cache.get(URL.replace("sig", "other"), 360) == (path, media_type)
+    assert len(upstream.requests) == 1
+
+def test_eviction_keeps_the_cache_bounded(tmp_path, upstream):
+    cache = ThumbnailCache(str(tmp_path))
+    first, _ = cache.get(URL, 360)
+    size = os.path.getsize(first)
+    cache.max_bytes = size + size // 2
+    os.utime(first, (0, 0))  # Least recently used
+    second, _ = cache.get(URL.replace("thumb", "other"), 360)
+    assert not os.path.exists(first) and os.path.exists(second)
+    assert cache._size == os.path.getsize(second)
+
+def test_oversized_body_is_refused(tmp_path, upstream, monkeypatch):
+    monkeypatch.setattr(thumbs, "THUMB_MAX_SOURCE_BYTES", 1000)
+    assert ThumbnailCache(str(tmp_path)).get(URL) is None
+    assert not any(files for _, _, files in os.walk(tmp_path))
+
+def test_redirects_are_not_followed(tmp_path, upstream):
+    upstream.status = 302
+    assert ThumbnailCache(str(tmp_path)).get(URL) is None
+
+@pytest.mark.parametrize("body", [b"<html>not an image</html>", b"\xff\xd8\xff truncated jpeg"])
+def test_non_image_body_is_not_cached(tmp_path, upstream, body):
+    upstream.body = body
+    assert ThumbnailCache(str(tmp_path)).get(URL) is None
+    assert not any(files for _, _, files in os.walk(tmp_path))
+
+def test_decompression_bomb_is_refused(tmp_path, upstream, monkeypatch):
+    monkeypatch.setattr(thumbs, "THUMB_MAX_PIXELS", 100 * 100)
+    assert ThumbnailCache(str(tmp_path)).get(URL) is None
+
+def test_without_pillow_the_sniffed_type_is_served(tmp_path, upstream, monkeypatch):
+    monkeypatch.setattr(thumbs, "_pil", lambda: None)
+    out = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(out, format="PNG")
+    upstream.body = out.getvalue()
+    path, media_type = ThumbnailCache(str(tmp_path)).get(URL)
+    assert media_type == "image/png" and path.endswith(".png")
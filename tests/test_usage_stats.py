@@ -0,0 +1,102 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models.database import DailyUsage, QueryStat, SearchHistory, User, UsageCounter, UserDayActivity, UserUsage
+from services import usage_stats
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+def _users(session, *emails):
+    users = [User(email=email, name="u", password_hash="x") for email in emails]
+    session.add_all(users)
+    session.commit()
+    return [u.id for u in users]
+
+class RacingSession:
+    """Proxy whose first UPDATE misses, as if another transaction created the row right after it."""
+    def __init__(self, session):
+        self._session = session
+        self.missed = False
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def execute(self, stmt, *args, **kwargs):
+        if not self.missed:
+            self.missed = True
+            return SimpleNamespace(rowcount=0)
+        return self._session.execute(stmt, *args, **kwargs)
+
+def test_bump_creates_then_increments(session):
+    for _ in range(3):
+        usage_stats._bump(session, UsageCounter, {"name": "searches"}, {"value": 2})
+    session.commit()
+    assert session.get(UsageCounter, "searches").value == 6
+
+def test_bump_falls_back_to_update_when_the_insert_races(session):
+    session.add(UsageCounter(name="searches", value=5))
+    session.commit()
+    usage_stats._bump(session, UsageCounter, {"name": "tokens_spent"}, {"value": 1})
+    racing = RacingSession(session)
+    usage_stats._bump(racing, UsageCounter, {"name": "searches"}, {"value": 1})
+    assert racing.missed
+    # Only the savepoint was rolled back: earlier writes in the transaction survive
+    session.commit()
+    assert session.get(UsageCounter, "searches").value == 6
+    assert session.get(UsageCounter, "tokens_spent").value == 1
+
+def test_active_users_count_each_user_once_a_day(session):
+    first, second = _users(session, "a@test", "b@test")
+    for user_id, query in ((first, "fitness"), (first, "#Fitness"), (second, "cars")):
+        usage_stats.record_search(session, user_id, query)
+    usage_stats.record_tokens(session, first, 10)
+    session.commit()
+    today = session.get(DailyUsage, datetime.utcnow().date())
+    assert (today.searches, today.tokens_spent, today.active_users) == (3, 10, 2)
+    assert len(session.exec(select(UserDayActivity)).all()) == 2
+    assert session.get(UserUsage, first).searches == 2
+    assert session.get(QueryStat, "fitness").searches == 2
+
+def test_backfill_builds_rollups_once(session):
+    first, second = _users(session, "a@test", "b@test")
+    day1, day2 = datetime(2026, 1, 1, 10), datetime(2026, 1, 2, 10)
+    for user_id, query, at in ((first, "fitness", day1), (first, "Fitness", day1), (second, "cars", day1), (first, "cars", day2)):
+        session.add(SearchHistory(user_id=user_id, query=query, searched_at=at))
+    session.commit()
+
+    usage_stats.backfill(session)
+    usage_stats.backfill(session)  # A second startup leaves the rollups alone
+    stats = usage_stats.dashboard(session)
+    assert (stats["total_users"], stats["total_searches"], stats["total_tokens_spent"]) == (2, 4, 0)
+    first_day = session.get(DailyUsage, day1.date())
+    assert (first_day.searches, first_day.active_users) == (3, 2)
+    assert session.get(DailyUsage, day2.date()).active_users == 1
+    assert len(session.exec(select(UserDayActivity)).all()) == 3
+    assert session.get(UserUsage, first).searches == 3 and session.get(UserUsage, first).last_active_at == day2
+    assert session.get(QueryStat, "fitness").searches == 2 and session.get(QueryStat, "cars").searches == 2
+
+def test_user_pager(session):
+    ids = _users(session, *(f"pager{c}@test" for c in "abcde"))
+    usage_stats.record_search(session, ids[0], "q")
+    session.commit()
+
+    first = usage_stats.user_page(session, 1, per_page=2)
+    assert [u.id for u, _ in first["user_rows"]] == ids[:2] and first["has_next_users"]
+    assert first["user_rows"][0][1].searches == 1 and first["user_rows"][1][1] is None
+    last = usage_stats.user_page(session, 3, per_page=2)
+    assert [u.id for u, _ in last["user_rows"]] == ids[4:] and not last["has_next_users"]
+    assert [u.id for u, _ in usage_stats.user_page(session, 1, q=f"#{ids[3]}")["user_rows"]] == [ids[3]]
+
+def test_user_search_treats_like_wildcards_literally(session):
+    literal, lookalike, percent = _users(session, "a_b@test", "axb@test", "100%@test")
+    assert [u.id for u, _ in usage_stats.user_page(session, q="a_b")["user_rows"]] == [literal]
+    assert [u.id for u, _ in usage_stats.user_page(session, q="%")["user_rows"]] == [percent]
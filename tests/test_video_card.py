@@ -0,0 +1,24 @@
+def _video(**fields):
+    return {"platform_id": "card1", "title": "old caption", "author": "a", "views": 10, "likes": 1,
+            "video_url": "https://example.com/card1", "thumbnail_url": "", **fields}
+
+def test_card_cache_tracks_embedded_fields(app):
+    first = app.video_card(_video())
+    assert app.video_card(_video()) is first
+    edited = app.video_card(_video(title="new caption"))
+    assert "new caption" in edited and "old caption" not in edited
+    other_source = app.video_card(_video(video_url="https://example.com/other"))
+    assert "https://example.com/other" in other_source
+
+def test_cards_without_an_id_are_not_cached(app):
+    before = len(app._card_cache)
+    a = app.video_card({"title": "first", "author": "x", "views": 1, "likes": 1})
+    b = app.video_card({"title": "second", "author": "x", "views": 1, "likes": 1})
+    assert "first" in a and "second" in b
+    assert len(app._card_cache) == before
+
+def test_card_cache_tracks_counters_and_extra_fields(app):
+    first = app.video_card(_video())
+    assert app.video_card(_video(views=11)) is not first
+    assert app.video_card(_video(thumbnail_url="https://scontent.cdninstagram.com/v/new.jpg")) is not first
+    assert "source_note" in app.video_card(_video(source_note="x"))